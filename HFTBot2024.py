@@ -1,45 +1,75 @@
 import os
-import time
 import math
-import pandas as pd
-from datetime import datetime
+import time
+import asyncio
+from datetime import date, datetime
 import MetaTrader5 as mt5
-import numpy as np
-
-# Initialize MetaTrader 5
-if not mt5.initialize():
-    print("Failed to initialize MetaTrader 5")
-    mt5.shutdown()
-    exit()
+from tickfeed import TickFeed
+from tradelog import TradeLogWriter
+from snapshot import MarketSnapshot
+from orderbook import OrderBook
+from tickstore import TickRecorder
+from exits import ExitScheduler
+from checkpoint import Checkpoint
+from symbols import SymbolCache
+from exposure import ExposureEngine
+from supervisor import Supervisor
+from barstore import BarStore
+from barclock import BarClock
+from indicators import IndicatorEngine, SMA
+import metrics
 
 # Specify the file path
 file_path = os.path.join(os.path.expanduser("~"), "Desktop", "trade_log.csv")
 
-# Initialize trade log DataFrame
-if os.path.exists(file_path):
-    trade_log_df = pd.read_csv(file_path)
-else:
-    trade_log_df = pd.DataFrame(columns=["SN", "Date", "Instrument", "P/L", "Net Balance", "Comment/ErrorLogs", "Forecast"])
+# Initialize trade log writer (appends in the background, one file per day)
+trade_log = TradeLogWriter(file_path, columns=["SN", "Date", "Instrument", "P/L", "Net Balance", "Comment/ErrorLogs", "Forecast"])
+
+# Market state shared by everything handling one tick
+snapshot = MarketSnapshot(mt5)
+
+# Local order/position book, updated from deal deltas
+book = OrderBook(mt5)
+
+# Contract size and currencies of the traded symbols, read once
+symbols = SymbolCache(mt5)
+
+# Net position, floating P/L, margin and equity, kept up to date from ticks and fills (balance set at start-up)
+exposure = ExposureEngine(symbols, balance=0.0)
+
+# Every tick seen is recorded to one binary file per symbol per day
+tick_recorder = TickRecorder(os.path.join(os.path.expanduser("~"), "Desktop", "ticks"))
+
+# M1 history kept on disk and topped up incrementally, shared with backtest.py --store
+bars = BarStore(mt5, os.path.join(os.path.expanduser("~"), "Desktop", "bars"))
+
+# Bot state (trade counters, balance, pending exits), saved after every change for warm restarts
+checkpoint = Checkpoint(os.path.join(os.path.expanduser("~"), "Desktop", "hftbot_state.json"))
 
 # Function to calculate A
 def calculate_A(H, fibH, S):
     return 24 / H * fibH * S
 
-# Function to get the current hour in 24-hour format
+# Fires at every H1 open, so the hour used by the signal changes on the boundary itself, not on a later tick
+clock = BarClock()
+
+# Function to get the current hour in 24-hour format (of the latest H1 bar the clock has opened)
 def get_current_hour():
-    return datetime.now().hour
+    return datetime.fromtimestamp(clock.last.get(3600, time.time())).hour
 
 # Function to get the spot price of the currency pair/instrument
+@metrics.timed("get_spot_price")
 def get_spot_price(symbol):
-    tick = mt5.symbol_info_tick(symbol)
+    tick = snapshot.tick(symbol)
     if tick:
+        tick_recorder.record(symbol, tick)
         return tick.last
     else:
         raise Exception(f"Failed to get tick for symbol: {symbol}")
 
-# Function to execute trades
-def execute_trade(symbol, trade_type, volume, price):
-    request = {
+# Function to build a market order request
+def deal_request(symbol, trade_type, volume, price):
+    return {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
         "volume": volume,
@@ -51,142 +81,325 @@ def execute_trade(symbol, trade_type, volume, price):
         "type_time": mt5.ORDER_TIME_GTC,
         "type_filling": mt5.ORDER_FILLING_IOC,
     }
-    result = mt5.order_send(request)
+
+# Function to build the request that closes a position at a given price
+def close_request(position, price):
+    return {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": position.symbol,
+        "volume": position.volume,
+        "type": mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
+        "position": position.ticket,
+        "price": price,
+        "deviation": 20,
+        "magic": 234000,
+        "comment": "Closing position",
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": mt5.ORDER_FILLING_IOC,
+    }
+
+# Function to execute trades
+@metrics.timed("execute_trade")
+def execute_trade(symbol, trade_type, volume, price):
+    request = deal_request(symbol, trade_type, volume, price)
+    result = supervisor.expect(snapshot.order_send(request), "order_send")
+    metrics.count_reject("execute_trade", result)
+    book.record(request, result)
     if result is None:
         print("Failed to execute trade: order_send returned None")
         return None
     return result
 
 # Function to log trade data
+@metrics.timed("log_trade")
 def log_trade(trade_data):
-    global trade_log_df
-    trade_log_df = pd.concat([trade_log_df, pd.DataFrame([trade_data])], ignore_index=True)
-    print(trade_log_df)  # Display the DataFrame
-    trade_log_df.to_csv(file_path, index=False)
-
-# Function to calculate SMA
-def calculate_sma(symbol, period=50):
-    rates = mt5.copy_rates_from_pos(symbol, mt5.TIMEFRAME_M1, 0, period)
-    if rates is None or len(rates) < period:
-        return None
-    close_prices = [rate['close'] for rate in rates]
-    sma = np.mean(close_prices)
-    return sma
+    trade_log.log(trade_data)
+
+# Function to log a trade that closed without a timed exit and carry the balance forward
+def log_closed(ticket, info, pl, comment):
+    global start_balance
+    info = info or {"SN": None, "Forecast": None}  # Opened before this run
+    print(f"Trade {info['SN'] or ticket}: {comment}, P/L = {pl}, Net Balance = {exposure.balance}")
+    log_trade({
+        "SN": info["SN"],
+        "Date": datetime.now(),
+        "Instrument": symbol,
+        "P/L": pl,
+        "Net Balance": exposure.balance,
+        "Comment/ErrorLogs": comment,
+        "Forecast": info["Forecast"]
+    })
+    start_balance = exposure.balance
+
+# Function to log the trades the exposure engine saw reach their SL or TP (closed at that level)
+def log_stopped(closed):
+    for ticket, info, pl in closed:
+        log_closed(ticket, info, pl, "Trade closed by SL/TP")
+    if closed:
+        print(exposure.report())
+        save_state()
+
+# Function to book a position found closed at its exit time (SL/TP between ticks, during a reconnect, or
+# closed by hand) at the price and profit of its closing deals; returns (P/L, comment)
+def book_closed(ticket):
+    deals = supervisor.expect(mt5.history_deals_get(position=ticket), "history_deals_get")
+    out = [d for d in deals or () if d.entry != mt5.DEAL_ENTRY_IN]
+    if out:
+        volume = sum(d.volume for d in out)
+        price = sum(d.price * d.volume for d in out) / volume
+        profit = sum(d.profit + d.swap + d.commission + d.fee for d in out)
+        pl = exposure.close(ticket, price, profit)
+        if pl is None:
+            pl = profit  # Opened before this run and not in the book
+        reasons = {d.reason for d in out}
+        comment = ("Trade closed by SL" if reasons == {mt5.DEAL_REASON_SL} else
+                   "Trade closed by TP" if reasons == {mt5.DEAL_REASON_TP} else "Trade closed outside the bot")
+    else:
+        pl = exposure.close(ticket)
+        comment = "Trade closed before its exit; no closing deal found, P/L at the last price"
+    return pl, comment
+
+# Function to book and log a position the exit scheduler found already closed
+def close_missing(ticket, info):
+    if exposure.settled(ticket):
+        return  # Already booked and logged at its SL/TP by log_stopped
+    log_closed(ticket, info, *book_closed(ticket))
+    print(exposure.report())
+    save_state()
+
+# M1 indicator engines per (symbol, period), seeded once from history and then updated per tick
+sma_engines = {}
+
+# Function to get the SMA incrementally from a new tick, without re-fetching bars
+@metrics.timed("update_sma")
+def update_sma(symbol, tick, period=50):
+    engine = sma_engines.get((symbol, period))
+    if engine is None:
+        rates = bars.read(symbol, mt5.TIMEFRAME_M1, period)
+        if rates is None or len(rates) < period:
+            return None
+        engine = IndicatorEngine(60)
+        engine.add("sma", SMA(period))
+        engine.seed_from_rates(rates)
+        sma_engines[(symbol, period)] = engine
+    engine.on_tick(tick)
+    return engine["sma"]
 
 # Initialize variables
-start_balance = mt5.account_info().balance
+start_balance = None
 trade_num = 0
+trades_today = 0  # Counted against max_trades_per_day, reset when the date changes
+trade_day = date.today().isoformat()
 max_trades_per_day = 100
+max_net_volume = 2.0  # Lots, long or short, open at any time
 symbol = "USDJPYm"  # Hardcoded symbol
 Startinglot = 2.0  # Hardcoded lot size
+hold_seconds = 180  # Each trade is closed 3 minutes after entry
 previous_hour = get_current_hour()
 
-# Main trading loop
-while True:
-    try:
-        current_hour = get_current_hour()
-
-        if trade_num >= max_trades_per_day:
-            print("Reached maximum trades for the day.")
-            break
-        
-        if trade_num < max_trades_per_day:
-            spot_price = get_spot_price(symbol)
-            fibH = current_hour - previous_hour  # Fibonacci sequence based on the current hour and previous hour
-            A = calculate_A(current_hour, fibH, spot_price)
-            sin_A = math.sin(A)
-
-            sma_50 = calculate_sma(symbol, 50)
-
-            if sma_50 is None:
-                print("Not enough data to calculate SMA.")
-                continue
-
-            # Print debug information
-            print(f"Current hour: {current_hour}")
-            print(f"Previous hour: {previous_hour}")
-            print(f"Fibonacci H (fibH): {fibH}")
-            print(f"Spot price: {spot_price}")
-            print(f"Sine(A): {sin_A}")
-            print(f"SMA(50): {sma_50}")
-
-            # Check if spot price is not zero
-            if spot_price == 0.0:
-                print("Spot price is zero. Skipping trade execution.")
-                continue
-
-            # Determine trade type based on SMA and sine(A)
-            if spot_price > sma_50 and sin_A > 0:
-                trade_type = mt5.ORDER_TYPE_BUY
-                forecast = "Buy"
-            elif spot_price < sma_50 and sin_A < 0:
-                trade_type = mt5.ORDER_TYPE_SELL
-                forecast = "Sell"
-            else:
-                print("Conditions not met for trade execution.")
-                continue
-
-            # Execute trade
-            result = execute_trade(symbol, trade_type, Startinglot, spot_price)
-            if result.retcode != mt5.TRADE_RETCODE_DONE:
-                print(f"Failed to execute trade: {result.comment}")
-                log_trade({
-                    "SN": trade_num + 1,
-                    "Date": datetime.now(),
-                    "Instrument": symbol,
-                    "P/L": 0,
-                    "Net Balance": start_balance,
-                    "Comment/ErrorLogs": result.comment,
-                    "Forecast": forecast
-                })
-            else:
-                print(f"Trade executed successfully: {result}")
-
-                trade_num += 1
-                time.sleep(180)  # Wait for 3 minutes
-
-                positions = mt5.positions_get(symbol=symbol)
-                for position in positions:
-                    close_request = {
-                        "action": mt5.TRADE_ACTION_DEAL,
-                        "symbol": position.symbol,
-                        "volume": position.volume,
-                        "type": mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
-                        "position": position.ticket,
-                        "price": spot_price,
-                        "deviation": 20,
-                        "magic": 234000,
-                        "comment": "Closing position",
-                        "type_time": mt5.ORDER_TIME_GTC,
-                        "type_filling": mt5.ORDER_FILLING_IOC,
-                    }
-                    close_result = mt5.order_send(close_request)
-                    if close_result.retcode != mt5.TRADE_RETCODE_DONE:
-                        print(f"Failed to close position: {close_result.comment}")
-
-                balance_after_trade = mt5.account_info().balance
-                pl = balance_after_trade - start_balance
-                print(f"Trade {trade_num}: P/L = {pl}, Net Balance = {balance_after_trade}")
-                log_trade({
-                    "SN": trade_num,
-                    "Date": datetime.now(),
-                    "Instrument": symbol,
-                    "P/L": pl,
-                    "Net Balance": balance_after_trade,
-                    "Comment/ErrorLogs": "Trade executed and closed successfully",
-                    "Forecast": forecast
-                })
-                start_balance = balance_after_trade
-
-        # Update previous hour
+# Function to reload terminal state after a reconnect
+def resync():
+    snapshot.refresh()
+    symbols.invalidate()
+    book.full_sync()
+
+# Reconnects with backoff when the terminal connection drops, then resyncs and resumes the tick loop
+supervisor = Supervisor(mt5, resync)
+
+# Positions are closed at the current price when their hold time is up, while ticks keep being evaluated
+exits = ExitScheduler(mt5, close_request, lambda s: supervisor.expect(snapshot.positions(s), "positions_get"),
+                      lambda s: supervisor.expect(snapshot.tick(s), "symbol_info_tick"), snapshot.order_send,
+                      on_missing=close_missing)
+
+# Function to save the bot state
+def save_state():
+    checkpoint.save({
+        "trade_num": trade_num,
+        "trade_day": trade_day,
+        "trades_today": trades_today,
+        "start_balance": start_balance,
+        "previous_hour": previous_hour,
+        "exits": exits.pending(),
+    })
+
+# Function to restore the state saved by the last run (the daily count only if it is from today)
+def load_state():
+    global trade_num, trades_today, start_balance, previous_hour
+    state = checkpoint.load()
+    trade_num = state.get("trade_num", 0)
+    if state.get("trade_day") == trade_day:
+        trades_today = state.get("trades_today", 0)
+    start_balance = state.get("start_balance")
+    previous_hour = state.get("previous_hour", previous_hour)
+    for ticket, position_symbol, deadline, info in state.get("exits", []):
+        exits.schedule(ticket, position_symbol, deadline, info)
+    return state
+
+# Function to close every position whose hold time is up (deadlines in server time)
+def close_due(now):
+    global start_balance
+    closed = exits.process(now)
+    for ticket, info, position, close_result in closed:
+        if close_result is None or close_result.retcode != mt5.TRADE_RETCODE_DONE:
+            metrics.count_reject("close_position", close_result)
+            print(f"Failed to close position: {close_result.comment if close_result else 'order_send returned None'}")
+            continue
+        pl = exposure.close(ticket, close_result.price)
+        if pl is None:
+            pl = position.profit  # Opened before this run and not in the book
+        balance_after_trade = exposure.balance
+        print(f"Trade {info['SN']}: P/L = {pl}, Net Balance = {balance_after_trade}")
+        log_trade({
+            "SN": info["SN"],
+            "Date": datetime.now(),
+            "Instrument": symbol,
+            "P/L": pl,
+            "Net Balance": balance_after_trade,
+            "Comment/ErrorLogs": "Trade executed and closed successfully",
+            "Forecast": info["Forecast"]
+        })
+        start_balance = balance_after_trade
+    if closed:
+        print(exits.report())
+        print(exposure.report())
+        save_state()
+
+# Function to evaluate the SMA + sine(A) signal on a new tick
+async def on_tick(tick):
+    global trade_num, trades_today, trade_day, previous_hour
+
+    snapshot.refresh()
+    snapshot.set_tick(symbol, tick)
+    tick_recorder.record(symbol, tick)
+    log_stopped(exposure.on_tick(symbol, tick.bid, tick.ask))
+    close_due(tick.time_msc / 1000)
+    today = date.today().isoformat()
+    if today != trade_day:
+        trade_day, trades_today = today, 0
+    current_hour = get_current_hour()
+    if current_hour == 0:
         previous_hour = current_hour
+        update_sma(symbol, tick, 50)
+        return  # calculate_A divides by the hour
+    spot_price = tick.last
+    fibH = current_hour - previous_hour  # Fibonacci sequence based on the current hour and previous hour
+    A = calculate_A(current_hour, fibH, spot_price)
+    sin_A = math.sin(A)
+
+    # Update previous hour
+    previous_hour = current_hour
 
-        # Sleep until the next 8 seconds
-        time.sleep(8)
+    sma_50 = update_sma(symbol, tick, 50)
 
+    # Skipped evaluations are counted in metrics, not printed: this runs on every tick
+    if sma_50 is None:
+        metrics.count("no_sma", "on_tick")
+        return
+
+    # Check if spot price is not zero
+    if spot_price == 0.0:
+        metrics.count("zero_price", "on_tick")
+        return
+
+    # Determine trade type based on SMA and sine(A)
+    if spot_price > sma_50 and sin_A > 0:
+        trade_type = mt5.ORDER_TYPE_BUY
+        forecast = "Buy"
+    elif spot_price < sma_50 and sin_A < 0:
+        trade_type = mt5.ORDER_TYPE_SELL
+        forecast = "Sell"
+    else:
+        metrics.count("no_signal", "on_tick")
+        return
+
+    # One trade at a time: the open one is still waiting for its timed exit
+    if len(exits) or trades_today >= max_trades_per_day:
+        return
+    if not exposure.allows(symbol, trade_type == mt5.ORDER_TYPE_BUY, Startinglot, max_net_volume):
+        metrics.count("exposure_blocked", "on_tick")
+        return
+
+    # Execute trade
+    result = execute_trade(symbol, trade_type, Startinglot, spot_price)
+    if result is None:
+        return
+    if result.retcode != mt5.TRADE_RETCODE_DONE:
+        print(f"Failed to execute trade: {result.comment}")
+        log_trade({
+            "SN": trade_num + 1,
+            "Date": datetime.now(),
+            "Instrument": symbol,
+            "P/L": 0,
+            "Net Balance": start_balance,
+            "Comment/ErrorLogs": result.comment,
+            "Forecast": forecast
+        })
+    else:
+        print(f"Trade executed successfully: {result}")
+        trade_num += 1
+        trades_today += 1
+        info = {"SN": trade_num, "Forecast": forecast}
+        exits.schedule(result.order, symbol, tick.time_msc / 1000 + hold_seconds, info)
+        exposure.open(result.order, symbol, trade_type == mt5.ORDER_TYPE_BUY, result.volume, result.price,
+                      info=info)
+    save_state()
+
+# Function to evaluate the signal on the latest tick as soon as a new hour opens
+async def on_hour(opened):
+    tick = supervisor.expect(mt5.symbol_info_tick(symbol), "symbol_info_tick")
+    if tick is not None:
+        await on_tick(tick)
+
+clock.every(3600, on_hour)
+
+# Main trading loop, driven by new ticks and hour opens instead of fixed sleeps
+async def run(feed=None):
+    global start_balance
+    if start_balance is None:
+        # Warm restart from the last checkpoint
+        started = time.perf_counter()
+        if load_state():
+            print(f"Resumed in {(time.perf_counter() - started) * 1000:.1f} ms: trade {trade_num}, "
+                  f"{trades_today} today, {len(exits)} exits pending")
+        account = snapshot.account()
+        if start_balance is None:
+            start_balance = account.balance
+        exposure.balance, exposure.leverage, exposure.currency = account.balance, account.leverage, account.currency
+        book.full_sync()
+        exposure.load(book.positions_for(symbol), mt5)
+    if feed is None:
+        feed = TickFeed(mt5, symbol, on_none=lambda: supervisor.expect(None, "symbol_info_tick"))
+
+    hours = asyncio.create_task(clock.run_async())
+    try:
+        async for tick in feed:
+            if hours.done():
+                hours.result()  # Raise what stopped the hour callbacks (e.g. a lost connection)
+            if trades_today >= max_trades_per_day and not len(exits):
+                print("Reached maximum trades for the day.")
+                break
+            await on_tick(tick)
+    finally:
+        hours.cancel()
+        print(clock.report())
+
+if __name__ == "__main__":
+    # Initialize MetaTrader 5
+    if not mt5.initialize():
+        print("Failed to initialize MetaTrader 5")
+        mt5.shutdown()
+        exit()
+
+    # Optional --metrics-file/--metrics-port/--profile
+    instrumentation = metrics.start_from_args("hftbot")
+
+    # Tick loop, resumed after a reconnect if the terminal connection drops
+    try:
+        asyncio.run(supervisor.run_async(run))
     except Exception as e:
         print(f"Error: {e}")
-        break
 
-# Shutdown MetaTrader 5
-mt5.shutdown()
+    # Flush the trade log and metrics, then shutdown MetaTrader 5
+    instrumentation.stop()
+    trade_log.close()
+    mt5.shutdown()
@@ -0,0 +1,172 @@
+## Vectorized backtest of the saharabot2024 sine(A) signal over historical M1 bars ##
+## Run: python backtest.py bars.csv|bars.parquet [--hold 3] [--cycle 3] [--lot 0.1] [--balance 10000] ##
+## or:  python backtest.py --synthetic 525600   (one year of random-walk minute bars, for timing) ##
+## or:  python backtest.py --store ~/Desktop/bars --symbol USDJPYm   (M1 bars the live bots stored, see barstore.py) ##
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# The strategy functions do not need a terminal; use the replay stand-in where MetaTrader5 is not installed
+try:
+    import MetaTrader5  # noqa: F401
+except ImportError:
+    import mt5replay
+    mt5replay.install()
+
+from saharabot2024 import calculate_signal, calculate_risk, calculate_sl_tp
+
+CONTRACT_SIZE = 100000
+
+
+# Load M1 bars from CSV or Parquet with time, open, high, low, close columns (time as epoch seconds or a date string)
+def load_bars(path):
+    if path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path)
+    df.columns = [c.strip("<>").lower() for c in df.columns]
+    if "date" in df.columns and "time" in df.columns and not np.issubdtype(df["time"].dtype, np.number):
+        # MT5 history export: separate <DATE> and <TIME> columns
+        df["time"] = df["date"].astype(str) + " " + df["time"].astype(str)
+    if not np.issubdtype(df["time"].dtype, np.number):
+        df["time"] = pd.to_datetime(df["time"]).astype("int64") // 10**9
+    return {
+        "time": df["time"].to_numpy(dtype=np.int64),
+        "open": df["open"].to_numpy(dtype=np.float64),
+        "high": df["high"].to_numpy(dtype=np.float64),
+        "low": df["low"].to_numpy(dtype=np.float64),
+        "close": df["close"].to_numpy(dtype=np.float64),
+    }
+
+
+# M1 bars from a bar store (the live bots' download), no terminal needed
+def store_bars(root, symbol):
+    import MetaTrader5 as mt5
+    from barstore import BarStore
+    rates = BarStore(None, root).window(symbol, mt5.TIMEFRAME_M1)
+    return {field: rates[field].astype(np.float64 if field != "time" else np.int64)
+            for field in ("time", "open", "high", "low", "close")}
+
+
+# Random-walk minute bars around USDJPY levels
+def synthetic_bars(n, seed=1, start_price=150.0):
+    rng = np.random.default_rng(seed)
+    close = start_price + np.cumsum(rng.normal(0, 0.01, n))
+    open_ = np.r_[start_price, close[:-1]]
+    spread = np.abs(rng.normal(0, 0.008, n))
+    return {
+        "time": 1_704_067_200 + np.arange(n, dtype=np.int64) * 60,
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+    }
+
+
+# Run the backtest. Like the live loop, a trade opens at the open of every `cycle`-th bar (bar times that
+# are multiples of cycle minutes, 3 = every 180 s) and is held for `hold` bars
+def run_backtest(bars, hold=3, cycle=3, lot=0.1, start_balance=10000.0, sl_percent=0.5, tp_percent=1.0):
+    n = len(bars["time"])
+    entries = np.flatnonzero(bars["time"][:n - hold + 1] % (cycle * 60) == 0)
+    minute = (bars["time"][entries] // 60) % 60
+    # Minute 0 divides by zero in calculate_A (the live loop dies on it), so no trade is taken there
+    entries = entries[minute != 0]
+    minute = minute[minute != 0]
+
+    spot = bars["open"][entries]
+    sin_A = calculate_signal(minute, spot)
+    is_buy = sin_A > 0
+    sl, tp = calculate_sl_tp(spot, is_buy, sl_percent, tp_percent)
+
+    # Highs/lows of each trade's holding window, shape (n_trades, hold)
+    window = entries[:, None] + np.arange(hold)
+    highs = bars["high"][window]
+    lows = bars["low"][window]
+    sl_hit = np.where(is_buy[:, None], lows <= sl[:, None], highs >= sl[:, None])
+    tp_hit = np.where(is_buy[:, None], highs >= tp[:, None], lows <= tp[:, None])
+
+    # First bar where each level is touched (hold if never); a bar touching both counts as SL first
+    sl_bar = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), hold)
+    tp_bar = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), hold)
+    exit_sl = (sl_bar <= tp_bar) & (sl_bar < hold)
+    exit_tp = (tp_bar < sl_bar)
+    time_exit = bars["close"][entries + hold - 1]
+    exit_price = np.where(exit_sl, sl, np.where(exit_tp, tp, time_exit))
+    exit_bar = np.where(exit_sl, sl_bar, np.where(exit_tp, tp_bar, hold - 1))
+
+    direction = np.where(is_buy, 1.0, -1.0)
+    pl = direction * (exit_price - spot) * lot * CONTRACT_SIZE / exit_price
+    balance = start_balance + np.cumsum(pl)
+    balance_before = np.r_[start_balance, balance[:-1]]
+    trade_num = np.arange(1, len(entries) + 1)
+    risk, reward = calculate_risk(balance_before, trade_num)
+
+    return pd.DataFrame({
+        "SN": trade_num,
+        "Date": pd.to_datetime(bars["time"][entries], unit="s"),
+        "Forecast": np.where(is_buy, "Buy", "Sell"),
+        "Entry": spot,
+        "SL": sl,
+        "TP": tp,
+        "Exit": exit_price,
+        "Exit bar": exit_bar,
+        "Outcome": np.where(exit_sl, "SL", np.where(exit_tp, "TP", "Time")),
+        "P/L": pl,
+        "Net Balance": balance,
+        "Risk": risk,
+        "Reward": reward,
+    })
+
+
+def summarize(trades, start_balance):
+    balance = np.r_[start_balance, trades["Net Balance"].to_numpy()]
+    drawdown = np.maximum.accumulate(balance) - balance
+    return {
+        "trades": len(trades),
+        "net_pl": float(trades["P/L"].sum()),
+        "win_rate": float((trades["P/L"] > 0).mean()) if len(trades) else 0.0,
+        "max_drawdown": float(drawdown.max()),
+        "sl": int((trades["Outcome"] == "SL").sum()),
+        "tp": int((trades["Outcome"] == "TP").sum()),
+        "time": int((trades["Outcome"] == "Time").sum()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized backtest of the saharabot sine(A) signal")
+    parser.add_argument("bars", nargs="?", help="CSV or Parquet file of M1 bars")
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic minute bars instead of a file")
+    parser.add_argument("--store", help="Read M1 bars from this bar store root instead of a file")
+    parser.add_argument("--symbol", default="USDJPYm", help="Symbol to read from --store")
+    parser.add_argument("--hold", type=int, default=3, help="Bars a trade is held before the time exit")
+    parser.add_argument("--cycle", type=int, default=3, help="Bars between trade entries")
+    parser.add_argument("--lot", type=float, default=0.1)
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--out", help="Write the trade list to this CSV file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        bars = synthetic_bars(args.synthetic)
+    elif args.store:
+        bars = store_bars(args.store, args.symbol)
+    elif args.bars:
+        bars = load_bars(args.bars)
+    else:
+        parser.error("a bars file, --store or --synthetic is required")
+
+    start = time.perf_counter()
+    trades = run_backtest(bars, args.hold, args.cycle, args.lot, args.balance)
+    elapsed = time.perf_counter() - start
+
+    print(f"Backtested {len(bars['time'])} bars in {elapsed * 1000:.1f} ms")
+    for key, value in summarize(trades, args.balance).items():
+        print(f"{key}: {value}")
+    if args.out:
+        trades.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+## Bar-aligned clock: callbacks fire at the bar boundaries of any timeframe, within milliseconds of the boundary ##
+## Deadlines are absolute multiples of the bar length, so a slow callback or a late wake never shifts the next one; ##
+## sleeps run on the monotonic clock, re-anchored to wall time after every wake, and end early by the measured ##
+## wake-up lateness of sleep(), with the last couple of milliseconds yielded away in zero-length sleeps ##
+
+import asyncio
+import inspect
+import time
+
+import metrics
+
+
+# Open time of the bar of `seconds` length containing timestamp
+def bar_open(timestamp, seconds):
+    return timestamp - timestamp % seconds
+
+
+# First bar boundary strictly after timestamp
+def next_boundary(timestamp, seconds):
+    return bar_open(timestamp, seconds) + seconds
+
+
+class BarClock:
+    def __init__(self, offset=0.0, spin=0.002):
+        self.offset = offset  # Added to time.time(), e.g. the broker's server time zone offset
+        self.spin = spin  # Seconds before a deadline spent in sleep(0) instead of one long sleep
+        self.lateness = 0.0005  # Running estimate of how late sleep() wakes up
+        self.fired = 0
+        self.skipped = 0  # Boundaries passed while a callback was still running
+        self.max_late = 0.0
+        self.last = {}  # bar seconds -> open time of the latest bar fired
+        self._timers = []  # [seconds, callback, next boundary]
+
+    def now(self):
+        return time.time() + self.offset
+
+    # Call callback(bar_open_time) at the open of every bar of `seconds` length
+    def every(self, seconds, callback):
+        now = self.now()
+        self.last.setdefault(seconds, bar_open(now, seconds))
+        self._timers.append([seconds, callback, next_boundary(now, seconds)])
+
+    def next_deadline(self):
+        return min((timer[2] for timer in self._timers), default=None)
+
+    # Remaining time to a deadline measured on the monotonic clock, minus the expected oversleep
+    def _plan(self, deadline):
+        anchor = time.monotonic() + (deadline - self.now())
+        return anchor, anchor - time.monotonic() - self.spin - self.lateness
+
+    def _measured(self, planned, slept):
+        oversleep = max(slept - planned, 0.0)
+        self.lateness += 0.1 * (oversleep - self.lateness)
+
+    def _woke(self, deadline):
+        late = self.now() - deadline
+        self.max_late = max(self.max_late, late)
+        metrics.registry.record("bar_wake", late)
+        return late
+
+    # Sleep until a timestamp (same clock as now()); returns how late it woke
+    def sleep_until(self, deadline):
+        while True:
+            anchor, planned = self._plan(deadline)
+            if planned > 0:
+                start = time.monotonic()
+                time.sleep(planned)
+                self._measured(planned, time.monotonic() - start)
+            elif time.monotonic() < anchor:
+                time.sleep(0)
+            else:
+                return self._woke(deadline)
+
+    async def sleep_until_async(self, deadline):
+        while True:
+            anchor, planned = self._plan(deadline)
+            if planned > 0:
+                start = time.monotonic()
+                await asyncio.sleep(planned)
+                self._measured(planned, time.monotonic() - start)
+            elif time.monotonic() < anchor:
+                await asyncio.sleep(0)
+            else:
+                return self._woke(deadline)
+
+    # Timers whose boundary has passed, advanced to their next boundary: [(callback, bar open time)]
+    def _due(self):
+        now = self.now()
+        due = []
+        for timer in self._timers:
+            seconds, callback, boundary = timer
+            if boundary > now:
+                continue
+            opened = bar_open(now, seconds)
+            self.skipped += int((opened - boundary) // seconds)
+            self.last[seconds] = opened
+            timer[2] = opened + seconds
+            due.append((callback, opened))
+        return due
+
+    # Fire the callbacks whose bar has opened; returns how many fired
+    def run_pending(self):
+        due = self._due()
+        for callback, opened in due:
+            callback(opened)
+        self.fired += len(due)
+        return len(due)
+
+    # Sleep to each boundary and fire its callbacks (coroutine callbacks are awaited), forever
+    async def run_async(self):
+        while True:
+            await self.sleep_until_async(self.next_deadline())
+            for callback, opened in self._due():
+                self.fired += 1
+                result = callback(opened)
+                if inspect.isawaitable(result):
+                    await result
+
+    def report(self):
+        return (f"{self.fired} bar callbacks, {self.skipped} skipped, wake-up lateness "
+                f"{self.lateness * 1000:.2f} ms typical / {self.max_late * 1000:.2f} ms max")
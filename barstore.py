@@ -0,0 +1,264 @@
+## Local bar store: one column file per field per symbol and timeframe, topped up from the terminal incrementally ##
+## Only bars newer than the last stored one are fetched, so after a restart warm-up is one small ##
+## copy_rates_from_pos call; reads come back shaped like copy_rates_from_pos and hot windows stay in an LRU ##
+## Layout: <root>/<symbol>/<timeframe>/<field>.col = packed little-endian values of closed bars ##
+## Run: python barstore.py <root> [symbol]   (lists stored series and their spans) ##
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+import metrics
+
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+EXTENSION = ".col"
+
+# MetaTrader5 TIMEFRAME_* values -> (folder name, bar length in seconds)
+TIMEFRAMES = {
+    1: ("M1", 60), 5: ("M5", 300), 15: ("M15", 900), 30: ("M30", 1800),
+    16385: ("H1", 3600), 16388: ("H4", 14400), 16408: ("D1", 86400),
+}
+
+
+# Closed bars of one symbol and timeframe: column memmaps over the files, plus any rows that could not be
+# written (kept in memory and retried on the next append) and the forming bar from the last fetch
+class _Series:
+    def __init__(self, folder):
+        self.folder = folder
+        self.columns = {}
+        self.count = 0
+        self.unwritten = np.zeros(0, dtype=RATES_DTYPE)
+        self.forming = None
+        self._open()
+
+    def _path(self, field):
+        return os.path.join(self.folder, field + EXTENSION)
+
+    # Map the column files, cutting them to the shortest so a crash mid-append leaves no half row
+    def _open(self):
+        sizes = {}
+        for field in RATES_DTYPE.names:
+            try:
+                sizes[field] = os.path.getsize(self._path(field)) // RATES_DTYPE[field].itemsize
+            except OSError:
+                sizes[field] = 0
+        self.count = min(sizes.values())
+        self.columns = {}
+        for field in RATES_DTYPE.names:
+            if sizes[field] > self.count:
+                os.truncate(self._path(field), self.count * RATES_DTYPE[field].itemsize)
+            if self.count:
+                self.columns[field] = np.memmap(self._path(field), dtype=RATES_DTYPE[field], mode="r",
+                                                shape=(self.count,))
+
+    def __len__(self):
+        return self.count + len(self.unwritten)
+
+    def last_time(self):
+        if len(self.unwritten):
+            return int(self.unwritten["time"][-1])
+        return int(self.columns["time"][-1]) if self.count else None
+
+    def first_time(self):
+        if self.count:
+            return int(self.columns["time"][0])
+        return int(self.unwritten["time"][0]) if len(self.unwritten) else None
+
+    # Append closed bars; on a write error they stay in memory and the error is returned
+    def append(self, rows):
+        rows = np.concatenate([self.unwritten, rows]) if len(self.unwritten) else rows
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            for field in RATES_DTYPE.names:
+                with open(self._path(field), "ab") as f:
+                    f.write(np.ascontiguousarray(rows[field]).tobytes())
+        except OSError as e:
+            self._open()
+            self.unwritten = rows
+            return e
+        self.unwritten = np.zeros(0, dtype=RATES_DTYPE)
+        self._open()
+        return None
+
+    # Replace the whole series (used when older history is fetched in front of it)
+    def rewrite(self, rows):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            for field in RATES_DTYPE.names:
+                temp = self._path(field) + ".tmp"
+                with open(temp, "wb") as f:
+                    f.write(np.ascontiguousarray(rows[field]).tobytes())
+                os.replace(temp, self._path(field))
+        except OSError as e:
+            self.columns, self.count = {}, 0
+            self.unwritten = rows
+            return e
+        self.unwritten = np.zeros(0, dtype=RATES_DTYPE)
+        self._open()
+        return None
+
+    # Index of the first bar at or after a bar time
+    def index(self, bar_time):
+        if bar_time is None:
+            return 0
+        stored = int(np.searchsorted(self.columns["time"], bar_time, side="left")) if self.count else 0
+        if stored < self.count or not len(self.unwritten):
+            return stored
+        return self.count + int(np.searchsorted(self.unwritten["time"], bar_time, side="left"))
+
+    # Bars [lo, hi) as one structured array (a copy)
+    def rows(self, lo, hi):
+        hi = min(hi, len(self))
+        lo = max(min(lo, hi), 0)
+        out = np.zeros(hi - lo, dtype=RATES_DTYPE)
+        stored_hi = min(hi, self.count)
+        if stored_hi > lo:
+            for field in RATES_DTYPE.names:
+                out[field][:stored_hi - lo] = self.columns[field][lo:stored_hi]
+        if hi > self.count:
+            out[max(stored_hi - lo, 0):] = self.unwritten[max(lo - self.count, 0):hi - self.count]
+        return out
+
+
+class BarStore:
+    def __init__(self, mt5, root, cache_windows=64, max_fetch=100000):
+        self.mt5 = mt5
+        self.root = root
+        self.cache_windows = cache_windows
+        self.max_fetch = max_fetch  # Bars per copy_rates_from_pos call at most
+        self.fetches = 0
+        self.fetched = 0  # Bars downloaded
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.last_error = None
+        self._series = {}  # (symbol, timeframe) -> _Series
+        self._windows = OrderedDict()  # (symbol, timeframe, lo, hi) -> rates, least recently used first
+        self._lock = threading.RLock()
+
+    def _get(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(os.path.join(self.root, symbol, TIMEFRAMES[timeframe][0]))
+        return series
+
+    def _fetch(self, symbol, timeframe, count):
+        rates = self.mt5.copy_rates_from_pos(symbol, timeframe, 0, min(count, self.max_fetch))
+        self.fetches += 1
+        if rates is not None:
+            self.fetched += len(rates)
+            metrics.count("bars_fetched", "bar_store", len(rates))
+        return rates
+
+    # Store the bars closed since the last update and remember the forming bar; returns the number stored.
+    # With minimum, history is also fetched back until at least that many closed bars are stored
+    @metrics.timed("bar_update")
+    def update(self, symbol, timeframe, minimum=0):
+        with self._lock:
+            series = self._get(symbol, timeframe)
+            last = series.last_time()
+            # Two bars (the newest closed one and the forming one) cover the usual case of nothing or one bar
+            # closed since last time in one call
+            count = max(minimum + 1, 2) if last is None or len(series) < minimum else 2
+            rates = self._fetch(symbol, timeframe, count)
+            if rates is None or not len(rates):
+                return 0
+            seconds = TIMEFRAMES[timeframe][1]
+            if last is not None and rates["time"][0] > last + seconds:
+                # Bars are missing between the stored last one and these: fetch the gap, sized from bar times
+                # (weekends overshoot)
+                gap = (int(rates["time"][-1]) - last) // seconds + 1
+                rates = self._fetch(symbol, timeframe, max(gap, count))
+                if rates is None or not len(rates):
+                    return 0
+            rates = np.asarray(rates).astype(RATES_DTYPE, copy=False)
+            series.forming = rates[-1:].copy()
+            closed = rates[:-1]
+            first = series.first_time()
+            older = closed[closed["time"] < first] if first is not None else closed[:0]
+            newer = closed[closed["time"] > last] if last is not None else closed
+            if len(older):
+                error = series.rewrite(np.concatenate([older, series.rows(0, len(series)), newer]))
+                self._windows.clear()
+            elif len(newer):
+                error = series.append(newer)
+            else:
+                error = None
+            if error is not None:
+                self.errors += 1
+                self.last_error = error
+            return len(older) + len(newer)
+
+    # Last count bars, the forming one included, like copy_rates_from_pos(symbol, timeframe, 0, count);
+    # only bars closed since the previous call come from the terminal
+    def read(self, symbol, timeframe, count):
+        with self._lock:
+            self.update(symbol, timeframe, minimum=count - 1)
+            series = self._get(symbol, timeframe)
+            if series.forming is None:
+                return None
+            closed = self._window(symbol, timeframe, series, max(len(series) - (count - 1), 0), len(series))
+            return np.concatenate([closed, series.forming]) if count > 1 else series.forming.copy()
+
+    # Stored closed bars with start <= time < end (epoch seconds, None = open ended), no terminal calls;
+    # for backtests and anything else reading history
+    def window(self, symbol, timeframe, start=None, end=None):
+        with self._lock:
+            series = self._get(symbol, timeframe)
+            lo = series.index(start)
+            hi = series.index(end) if end is not None else len(series)
+            return self._window(symbol, timeframe, series, lo, hi)
+
+    def _window(self, symbol, timeframe, series, lo, hi):
+        key = (symbol, timeframe, lo, hi)
+        rates = self._windows.get(key)
+        if rates is not None:
+            self._windows.move_to_end(key)
+            self.hits += 1
+            return rates
+        self.misses += 1
+        rates = series.rows(lo, hi)
+        rates.flags.writeable = False  # Shared between callers
+        self._windows[key] = rates
+        if len(self._windows) > self.cache_windows:
+            self._windows.popitem(last=False)
+        return rates
+
+    def series(self):
+        if not os.path.isdir(self.root):
+            return []
+        names = {name: timeframe for timeframe, (name, _) in TIMEFRAMES.items()}
+        return sorted((symbol, names[tf]) for symbol in os.listdir(self.root)
+                      if os.path.isdir(os.path.join(self.root, symbol))
+                      for tf in os.listdir(os.path.join(self.root, symbol)) if tf in names)
+
+    def __len__(self):
+        return sum(len(series) for series in self._series.values())
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python barstore.py <root> [symbol]")
+        return
+    store = BarStore(None, sys.argv[1])
+    for symbol, timeframe in store.series():
+        if sys.argv[2:] and symbol not in sys.argv[2:]:
+            continue
+        times = store.window(symbol, timeframe)["time"]
+        span = ""
+        if len(times):
+            first, last = (datetime.fromtimestamp(int(t), tz=timezone.utc) for t in times[[0, -1]])
+            span = f"  {first:%Y-%m-%d %H:%M} - {last:%Y-%m-%d %H:%M}"
+        print(f"{symbol} {TIMEFRAMES[timeframe][0]}: {len(times)} bars{span}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+## Micro-benchmarks: incremental indicators vs the list + np.mean SMA in HFTBot2024.calculate_sma ##
+## Run: python bench_indicators.py [n_ticks] ##
+
+import sys
+import time
+
+import numpy as np
+
+from indicators import IndicatorEngine, SMA, EMA, RollingStd, RollingMax, RollingMin
+
+RATES_DTYPE = np.dtype([("time", "<i8"), ("close", "<f8")])
+
+
+# Synthetic M1 history plus a stream of ticks, ~10 ticks per bar
+def make_data(n_ticks, n_bars=500, seed=1):
+    rng = np.random.default_rng(seed)
+    rates = np.zeros(n_bars, dtype=RATES_DTYPE)
+    rates["time"] = 1_700_000_000 - 1_700_000_000 % 60 + np.arange(n_bars) * 60
+    rates["close"] = 150 + np.cumsum(rng.normal(0, 0.01, n_bars))
+    tick_times = rates["time"][-1] + np.arange(n_ticks) * 6
+    tick_prices = rates["close"][-1] + np.cumsum(rng.normal(0, 0.002, n_ticks))
+    return rates, tick_times, tick_prices
+
+
+# What calculate_sma does per call once the rates are back from the terminal (IPC cost not included)
+def bench_full_recompute(rates, tick_times, tick_prices, periods):
+    history = rates.copy()
+    start = time.perf_counter()
+    for t, price in zip(tick_times.tolist(), tick_prices.tolist()):
+        bar_time = t - t % 60
+        if bar_time > history["time"][-1]:
+            history = np.roll(history, -1)
+            history["time"][-1] = bar_time
+        history["close"][-1] = price
+        for period in periods:
+            window = history[-period:]
+            close_prices = [rate['close'] for rate in window]
+            np.mean(close_prices)
+    return time.perf_counter() - start
+
+
+def bench_incremental(rates, tick_times, tick_prices, periods, kinds):
+    engine = IndicatorEngine(60)
+    for period in periods:
+        for kind in kinds:
+            engine.add(f"{kind.__name__}{period}", kind(period))
+    engine.seed_from_rates(rates)
+    start = time.perf_counter()
+    for t, price in zip(tick_times.tolist(), tick_prices.tolist()):
+        engine.on_price(t, price)
+    return time.perf_counter() - start, engine
+
+
+def report(name, seconds, n_ticks):
+    print(f"{name:<45} {seconds * 1e6 / n_ticks:10.2f} us/tick  {n_ticks / seconds:12.0f} ticks/s")
+
+
+def main():
+    n_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rates, tick_times, tick_prices = make_data(n_ticks)
+
+    for periods in ([50], [10, 20, 50, 100, 200]):
+        label = ",".join(str(p) for p in periods)
+        report(f"full recompute SMA({label})", bench_full_recompute(rates, tick_times, tick_prices, periods), n_ticks)
+        seconds, engine = bench_incremental(rates, tick_times, tick_prices, periods, [SMA])
+        report(f"incremental SMA({label})", seconds, n_ticks)
+
+    all_kinds = [SMA, EMA, RollingStd, RollingMax, RollingMin]
+    seconds, engine = bench_incremental(rates, tick_times, tick_prices, [50], all_kinds)
+    report("incremental SMA+EMA+stdev+min+max(50)", seconds, n_ticks)
+
+    # Sanity check: incremental SMA matches a fresh mean of the last 50 closes
+    bar_times = np.concatenate((rates["time"], tick_times - tick_times % 60))
+    prices = np.concatenate((rates["close"], tick_prices))
+    last_of_bar = np.r_[bar_times[1:] != bar_times[:-1], True]
+    expected = prices[last_of_bar][-50:].mean()
+    print(f"SMA(50) incremental={engine['SMA50']:.6f} expected={expected:.6f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+## Replay benchmark: runs the three bots' own trading loops against the mt5replay stand-in, no terminal needed ##
+## Run: python bench_replay.py [--ticks ticks.csv] [--n 100000] [--bots saharabot,hft,grid] [--speed 1000] ##
+##      [--json results.json] [--baseline results.json --tolerance 0.2] ##
+## Each bot runs in a fresh process: saharabot2024.trading_loop, HFTBot2024.run(feed) and gridbot2024.trading_loop ##
+## with its GridManager, replayed at --speed x real time; the bots' clock, sleeps and bar timers follow the replay, ##
+## so a 3-minute hold takes 180/speed seconds. Reports decisions/s, orders/s and memory growth per 100k ticks ##
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+
+import mt5replay
+mt5replay.install()
+
+import barclock  # noqa: E402
+from tickfeed import TickFeed  # noqa: E402
+
+SYMBOL = "USDJPYm"  # The symbol all three bots trade
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+# Stands in for the time module inside the bots and barclock: time() is the replay clock and sleeps and
+# monotonic intervals are compressed by the replay speed; sleeping after the last tick ends the run
+class ReplayTime:
+    def __init__(self, speed):
+        self.speed = speed
+
+    def time(self):
+        return mt5replay.replay_time()
+
+    def monotonic(self):
+        return time.monotonic() * self.speed
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if mt5replay.finished():
+            raise ReplayFinished()
+        time.sleep(max(seconds, 0.0) / self.speed)
+
+    async def sleep_async(self, seconds):
+        await asyncio.sleep(max(seconds, 0.0) / self.speed)
+
+
+# The bot's tick feed, stopped once the replay has run out of ticks
+class ReplayFeed(TickFeed):
+    def poll(self):
+        ticks = super().poll()
+        if not ticks and mt5replay.finished():
+            self.stop()
+        return ticks
+
+
+# Random-walk USDJPY-like ticks, 4 per second on average, 1 pip spread
+def synthetic_ticks(n, seed=1, start_price=150.0, start_msc=1_704_067_200_000):
+    rng = np.random.default_rng(seed)
+    ticks = np.zeros(n, dtype=mt5replay.TICK_DTYPE)
+    ticks["time_msc"] = start_msc + np.cumsum(rng.integers(1, 500, n))
+    ticks["time"] = ticks["time_msc"] // 1000
+    ticks["bid"] = np.round(start_price + np.cumsum(rng.normal(0, 0.002, n)), 3)
+    ticks["ask"] = ticks["bid"] + 0.010
+    ticks["last"] = ticks["bid"]
+    ticks["volume"] = 1
+    ticks["volume_real"] = 1.0
+    return ticks
+
+
+# Current resident set size in bytes (peak on platforms without /proc)
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+# Wrap fn so every call is counted under key; order sends that fail are also counted as rejected
+def counting(fn, counts, key):
+    def wrapper(*args, **kwargs):
+        counts[key] += 1
+        result = fn(*args, **kwargs)
+        if key == "orders" and (result is None or result.retcode != mt5replay.TRADE_RETCODE_DONE):
+            counts["rejected"] += 1
+        return result
+    return wrapper
+
+
+# Take the memory reading at warm-up (after a tenth of the ticks) from a side thread while the loop runs
+def sample_rss(warmup, marks, done):
+    while not done.wait(0.01):
+        if mt5replay.replayed() >= warmup:
+            marks["warm"] = (mt5replay.replayed(), rss())
+            return
+
+
+# Same start-up as saharabot2024's __main__ block (nothing to resume from), then its trading loop
+def run_saharabot(clock, counts):
+    import saharabot2024 as bot
+    bot.time = clock
+    bot.calculate_signal = counting(bot.calculate_signal, counts, "decisions")
+    account = bot.snapshot.account()
+    bot.start_balance = account.balance
+    bot.exposure.balance, bot.exposure.leverage, bot.exposure.currency = \
+        account.balance, account.leverage, account.currency
+    bot.book.full_sync()
+    bot.exposure.load(bot.book.positions_for(bot.symbol), mt5replay)
+    try:
+        bot.supervisor.run(bot.trading_loop)
+    except ReplayFinished:
+        pass
+    bot.trade_log.close()
+
+
+# HFTBot2024.run on a feed that ends with the replay; its hour callbacks fire on the replay clock
+def run_hft(clock, counts):
+    import HFTBot2024 as bot
+    bot.calculate_A = counting(bot.calculate_A, counts, "decisions")
+    feed = ReplayFeed(mt5replay, bot.symbol, on_none=lambda: bot.supervisor.expect(None, "symbol_info_tick"))
+    asyncio.run(bot.supervisor.run_async(bot.run, feed))
+    bot.trade_log.close()
+
+
+# Same start-up as gridbot2024's __main__ block, then its trading loop keeping the GridManager ladder armed
+def run_grid(clock, counts):
+    import gridbot2024 as bot
+    from trailing import TrailingStopEngine
+    bot.time = clock
+    bot.grid.maintain = counting(bot.grid.maintain, counts, "decisions")
+    bot.book.full_sync()
+    trailing_engine = TrailingStopEngine(mt5replay, bot.symbol, 2 * 0.1, send=bot.send_modify)
+    try:
+        bot.supervisor.run(bot.trading_loop, trailing_engine)
+    except ReplayFinished:
+        pass
+    bot.trade_log.close()
+
+
+BOTS = {"saharabot": run_saharabot, "hft": run_hft, "grid": run_grid}
+
+
+# Runs in its own process, so every bot starts from fresh module state
+def run_bot(name, ticks, speed, balance=10000.0):
+    # The bots' trade logs, checkpoints and tick/bar stores go under a throwaway ~/Desktop
+    os.environ["HOME"] = tempfile.mkdtemp(prefix="bench_replay_")
+    mt5replay.load_ticks(ticks, SYMBOL)
+    mt5replay.reset(balance)
+    mt5replay.set_speed(speed)
+    clock = ReplayTime(speed)
+    barclock.time = clock
+    barclock.asyncio = SimpleNamespace(sleep=clock.sleep_async)
+
+    counts = Counter()
+    mt5replay.order_send = counting(mt5replay.order_send, counts, "orders")
+    marks = {}
+    done = threading.Event()
+    sampler = threading.Thread(target=sample_rss, args=(len(ticks) // 10, marks, done), daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        BOTS[name](clock, counts)
+    elapsed = time.perf_counter() - start
+    done.set()
+    end = (mt5replay.replayed(), rss())
+
+    warm = marks.get("warm")
+    growth = (end[1] - warm[1]) / (end[0] - warm[0]) * 100_000 if warm and end[0] > warm[0] else 0.0
+    return {
+        "bot": name,
+        "ticks": end[0],
+        "ticks_per_sec": end[0] / elapsed,
+        "decisions": counts["decisions"],
+        "decisions_per_sec": counts["decisions"] / elapsed,
+        "orders": counts["orders"],
+        "orders_per_sec": counts["orders"] / elapsed,
+        "rejected": counts["rejected"],
+        "rss_growth_kb_per_100k_ticks": growth / 1024,
+        "final_balance": mt5replay.account_info().balance,
+        "elapsed": elapsed,
+    }
+
+
+# Bots whose decision rate fell by more than the tolerance against a saved run
+def regressions(results, baseline, tolerance):
+    previous = {r["bot"]: r for r in baseline}
+    slower = []
+    for r in results:
+        old = previous.get(r["bot"])
+        if old and r["decisions_per_sec"] < old["decisions_per_sec"] * (1 - tolerance):
+            slower.append((r["bot"], old["decisions_per_sec"], r["decisions_per_sec"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bots' trading loops against recorded or synthetic ticks")
+    parser.add_argument("--ticks", help="Tick CSV with time_msc, bid, ask (default: synthetic)")
+    parser.add_argument("--n", type=int, default=100_000, help="Synthetic ticks")
+    parser.add_argument("--bots", default="saharabot,hft,grid")
+    parser.add_argument("--speed", type=float, default=1000.0, help="Replay at this multiple of real time")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--baseline", help="Fail if decisions/s dropped against this earlier --json output")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    ticks = mt5replay.read_ticks(args.ticks) if args.ticks else synthetic_ticks(args.n)
+    recorded = (int(ticks["time_msc"][-1]) - int(ticks["time_msc"][0])) / 1000
+    print(f"{len(ticks)} ticks over {recorded / 3600:.1f} h recorded, ~{recorded / args.speed:.0f} s per bot "
+          f"at {args.speed:g}x")
+
+    results = []
+    for name in args.bots.split(","):
+        if name not in BOTS:
+            parser.error(f"unknown bot {name!r}, expected one of {', '.join(BOTS)}")
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            r = pool.submit(run_bot, name, ticks, args.speed).result()
+        results.append(r)
+        print(f"{name:10s} {r['ticks']:>9d} ticks  {r['ticks_per_sec']:>8.0f} ticks/s  "
+              f"{r['decisions_per_sec']:>8.1f} decisions/s ({r['decisions']})  {r['orders_per_sec']:>7.2f} orders/s "
+              f"({r['orders']} sent, {r['rejected']} rejected)  "
+              f"{r['rss_growth_kb_per_100k_ticks']:>8.1f} KiB/100k ticks  balance {r['final_balance']:.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for bot, old, new in slower:
+            print(f"REGRESSION {bot}: {old:.0f} -> {new:.0f} decisions/s")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
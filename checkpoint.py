@@ -0,0 +1,56 @@
+## Small atomic JSON checkpoint of a bot's state, for warm restarts ##
+## save() writes a temporary file, fsyncs it and renames it over the old one, so a crash leaves either the ##
+## previous or the new state on disk, never a half-written one ##
+
+import json
+import os
+from datetime import date, datetime
+
+import numpy as np
+
+
+def _encode(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Cannot checkpoint {type(value).__name__}")
+
+
+class Checkpoint:
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.saves = 0
+
+    # Last saved state, or a copy of default when there is none (or it cannot be read)
+    def load(self, default=None):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}")
+        return dict(default or {})
+
+    def save(self, state):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, separators=(",", ":"), default=_encode)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.saves += 1
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,134 @@
+## Timed exits without blocking the main loop ##
+## schedule() puts a position's exit time on a heap; process() closes everything that is due at the current ##
+## market price in one batch, sent back to back on the calling thread (the terminal connection is not ##
+## thread-safe), and keeps track of how far fills and timing deviate from what was asked ##
+## A failed close is retried with exponential backoff until it succeeds or the position is gone, never dropped ##
+
+import heapq
+import time
+
+import metrics
+
+
+class ExitScheduler:
+    def __init__(self, mt5, close_request, positions=None, tick=None, send=None, retry_delay=1.0,
+                 max_retries=3, max_delay=30.0, on_missing=None):
+        self.mt5 = mt5
+        self.close_request = close_request  # (position, price) -> request
+        self.positions = positions or (lambda symbol: mt5.positions_get(symbol=symbol))  # Terminal positions of a symbol
+        self.tick = tick or mt5.symbol_info_tick
+        self.send = send or mt5.order_send
+        self.retry_delay = retry_delay  # Before the first retry, doubled after every further failure
+        self.max_retries = max_retries  # Failed closes after which a position is reported as stuck
+        self.max_delay = max_delay
+        self.on_missing = on_missing  # (ticket, info) called for positions already closed by SL/TP
+        self._heap = []  # (deadline, seq, ticket, symbol, info, attempts)
+        self._seq = 0
+        self.closed = 0
+        self.failed = 0
+        self.already_closed = 0
+        self.stuck = set()  # Tickets still open after max_retries failed closes
+        self.deviation_total = 0.0  # Sum of |fill price - requested price|
+        self.deviation_max = 0.0
+        self.lateness_total = 0.0  # Sum of seconds between the deadline and the close being sent
+        self.lateness_max = 0.0
+
+    def __len__(self):
+        return len(self._heap)
+
+    # Close the position with this ticket at (or right after) the deadline; info comes back with the close
+    def schedule(self, ticket, symbol, deadline, info=None):
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, ticket, symbol, info, 0))
+
+    # Exits still waiting, as [ticket, symbol, deadline, info] (e.g. for a checkpoint)
+    def pending(self):
+        return [[entry[2], entry[3], entry[0], entry[4]] for entry in sorted(self._heap)]
+
+    def next_deadline(self):
+        return self._heap[0][0] if self._heap else None
+
+    # Close every due position; returns [(ticket, info, position, result)] for each close sent
+    def process(self, now=None):
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        if not due:
+            return []
+
+        # One positions read and one tick per symbol for the whole batch
+        open_positions = {}
+        ticks = {}
+        batch = []
+        for i, entry in enumerate(due):
+            symbol = entry[3]
+            if symbol not in open_positions:
+                try:
+                    open_positions[symbol] = {p.ticket: p for p in self.positions(symbol) or ()}
+                    ticks[symbol] = self.tick(symbol)
+                except Exception:
+                    # Terminal gone: nothing is sent, every exit not yet handled stays scheduled
+                    for pending in due[i:] + [item[0] for item in batch]:
+                        heapq.heappush(self._heap, pending)
+                    raise
+            position = open_positions[symbol].get(entry[2])
+            if position is None:
+                self.stuck.discard(entry[2])
+                self.already_closed += 1  # Hit SL/TP before the deadline
+                if self.on_missing is not None:
+                    self.on_missing(entry[2], entry[4])
+                continue
+            tick = ticks[symbol]
+            price = tick.bid if position.type == self.mt5.ORDER_TYPE_BUY else tick.ask
+            batch.append((entry, position, price, self.close_request(position, price)))
+        if not batch:
+            return []
+
+        results = [self.send(item[3]) for item in batch]
+
+        closed = []
+        for (entry, position, price, request), result in zip(batch, results):
+            deadline, _, ticket, symbol, info, attempts = entry
+            if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+                self.failed += 1
+                delay = min(self.retry_delay * 2 ** attempts, self.max_delay)
+                self._seq += 1
+                heapq.heappush(self._heap, (now + delay, self._seq, ticket, symbol, info, attempts + 1))
+                if attempts + 1 >= self.max_retries:
+                    self.stuck.add(ticket)
+                    metrics.count("stuck_exits", "exits")
+                    comment = result.comment if result is not None else "order_send returned None"
+                    print(f"EXIT STUCK: position {ticket} on {symbol} still open after {attempts + 1} failed closes "
+                          f"({comment}), retrying in {delay:.1f}s")
+                closed.append((ticket, info, position, result))
+                continue
+            self.closed += 1
+            self.stuck.discard(ticket)
+            deviation = abs(result.price - price) if result.price else 0.0
+            lateness = max(now - deadline, 0.0)
+            self.deviation_total += deviation
+            self.deviation_max = max(self.deviation_max, deviation)
+            self.lateness_total += lateness
+            self.lateness_max = max(self.lateness_max, lateness)
+            closed.append((ticket, info, position, result))
+        return closed
+
+    def stats(self):
+        return {
+            "pending": len(self._heap),
+            "closed": self.closed,
+            "failed": self.failed,
+            "already_closed": self.already_closed,
+            "stuck": len(self.stuck),
+            "deviation_mean": self.deviation_total / self.closed if self.closed else 0.0,
+            "deviation_max": self.deviation_max,
+            "lateness_mean": self.lateness_total / self.closed if self.closed else 0.0,
+            "lateness_max": self.lateness_max,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"Exits: {s['closed']} closed, {s['failed']} failed, {s['already_closed']} closed by SL/TP, "
+                f"{s['pending']} pending ({s['stuck']} stuck); "
+                f"deviation mean {s['deviation_mean']:.5f} max {s['deviation_max']:.5f}; late by mean {s['lateness_mean']:.3f}s max {s['lateness_max']:.3f}s")
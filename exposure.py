@@ -0,0 +1,243 @@
+## Real-time exposure and P/L kept in memory: net position, floating P/L, margin and equity per symbol ##
+## Updated from ticks and our own fills only; a tick is O(1) however many positions are open, because each ##
+## symbol keeps running volume and volume x price sums per side, plus the nearest SL/TP on each side ##
+
+import math
+import threading
+from collections import namedtuple
+
+SymbolExposure = namedtuple("SymbolExposure", ["symbol", "net_volume", "long_volume", "short_volume", "positions",
+                                               "floating", "margin", "bid", "ask"])
+
+
+class _Position:
+    __slots__ = ("ticket", "symbol", "is_buy", "volume", "price", "sl", "tp", "info")
+
+    def __init__(self, ticket, symbol, is_buy, volume, price, sl, tp, info):
+        self.ticket = ticket
+        self.symbol = symbol
+        self.is_buy = is_buy
+        self.volume = volume
+        self.price = price
+        self.sl = sl
+        self.tp = tp
+        self.info = info
+
+
+# Running sums for one symbol
+class _Side:
+    def __init__(self, symbol, contract_size, base_is_account, profit_is_account):
+        self.symbol = symbol
+        self.contract_size = contract_size
+        self.base_is_account = base_is_account  # e.g. USDJPY on a USD account: P/L is converted at the price
+        self.profit_is_account = profit_is_account
+        self.positions = {}  # ticket -> _Position
+        self.long_volume = 0.0
+        self.long_cost = 0.0  # Sum of volume x open price
+        self.short_volume = 0.0
+        self.short_cost = 0.0
+        self.bid = 0.0
+        self.ask = 0.0
+        self.floating = 0.0
+        self._stops_dirty = True
+        self._stops = (-math.inf, math.inf, math.inf, -math.inf)  # Buy SL, buy TP, sell SL, sell TP triggers
+
+    def add(self, position, sign):
+        cost = sign * position.volume * position.price
+        if position.is_buy:
+            self.long_volume += sign * position.volume
+            self.long_cost += cost
+        else:
+            self.short_volume += sign * position.volume
+            self.short_cost += cost
+        if not self.positions:
+            self.long_volume = self.long_cost = self.short_volume = self.short_cost = 0.0  # No float drift when flat
+        self._stops_dirty = True
+
+    # Account-currency P/L of a price difference times volume
+    def convert(self, amount, bid):
+        amount *= self.contract_size
+        if not self.profit_is_account and self.base_is_account and bid:
+            amount /= bid
+        return amount
+
+    def revalue(self):
+        if not self.positions or not self.bid:
+            self.floating = 0.0
+            return
+        diff = (self.long_volume * self.bid - self.long_cost) + (self.short_cost - self.short_volume * self.ask)
+        self.floating = self.convert(diff, self.bid)
+
+    def margin(self, leverage, volume=None):
+        volume = self.long_volume + self.short_volume if volume is None else volume
+        notional = volume * self.contract_size
+        if not self.base_is_account:
+            notional *= (self.bid + self.ask) / 2 if self.bid else 0.0
+        return notional / leverage
+
+    # [(ticket, SL or TP price)] for positions this tick stops out (buys close on the bid, sells on the ask;
+    # a tick past both levels counts as the SL)
+    def stopped(self, bid, ask):
+        if self._stops_dirty:
+            buys = [p for p in self.positions.values() if p.is_buy]
+            sells = [p for p in self.positions.values() if not p.is_buy]
+            self._stops = (max((p.sl for p in buys if p.sl), default=-math.inf),
+                           min((p.tp for p in buys if p.tp), default=math.inf),
+                           min((p.sl for p in sells if p.sl), default=math.inf),
+                           max((p.tp for p in sells if p.tp), default=-math.inf))
+            self._stops_dirty = False
+        buy_sl, buy_tp, sell_sl, sell_tp = self._stops
+        if buy_sl < bid < buy_tp and sell_tp < ask < sell_sl:
+            return []
+        hit = []
+        for p in self.positions.values():
+            if p.is_buy:
+                level = p.sl if p.sl and bid <= p.sl else p.tp if p.tp and bid >= p.tp else None
+            else:
+                level = p.sl if p.sl and ask >= p.sl else p.tp if p.tp and ask <= p.tp else None
+            if level is not None:
+                hit.append((p.ticket, level))
+        return hit
+
+
+class ExposureEngine:
+    def __init__(self, symbols, balance, leverage=100, currency="USD"):
+        self.symbols = symbols  # SymbolCache, read once per symbol for contract size and currencies
+        self.balance = balance
+        self.leverage = leverage
+        self.currency = currency
+        self.realized = 0.0
+        self.ticks = 0
+        self.stopped_out = 0
+        self._stopped = set()  # Tickets on_tick closed at their SL/TP, until settled() is asked about them
+        self._sides = {}
+        self._positions = {}  # ticket -> _Position
+        self._lock = threading.Lock()
+
+    def _side(self, symbol):
+        side = self._sides.get(symbol)
+        if side is None:
+            spec = self.symbols.spec(symbol)
+            contract_size = spec.contract_size if spec is not None else 100000.0
+            base = spec.currency_base if spec is not None else symbol[:3]
+            profit = spec.currency_profit if spec is not None else symbol[3:6]
+            side = self._sides[symbol] = _Side(symbol, contract_size, base == self.currency, profit == self.currency)
+        return side
+
+    # Seed from positions already open (terminal positions or OrderBook entries)
+    def load(self, positions, mt5):
+        for p in positions:
+            self.open(p.ticket, p.symbol, p.type == mt5.ORDER_TYPE_BUY, p.volume, p.price_open, p.sl, p.tp)
+
+    # A fill of ours opened a position
+    def open(self, ticket, symbol, is_buy, volume, price, sl=0.0, tp=0.0, info=None):
+        with self._lock:
+            side = self._side(symbol)
+            position = _Position(ticket, symbol, is_buy, volume, price, sl, tp, info)
+            self._positions[ticket] = side.positions[ticket] = position
+            side.add(position, 1)
+            side.revalue()
+
+    def modify(self, ticket, sl, tp):
+        with self._lock:
+            position = self._positions.get(ticket)
+            if position is not None:
+                position.sl, position.tp = sl, tp
+                self._sides[position.symbol]._stops_dirty = True
+
+    # A position was closed at price; returns its realized P/L (None if it was not tracked). With profit
+    # (e.g. from the closing deals) that is booked instead of the P/L worked out from the price
+    def close(self, ticket, price=None, profit=None):
+        with self._lock:
+            return self._close(ticket, price, profit)
+
+    # Whether on_tick already closed this ticket at its SL/TP (each ticket is reported once)
+    def settled(self, ticket):
+        with self._lock:
+            if ticket in self._stopped:
+                self._stopped.discard(ticket)
+                return True
+            return False
+
+    def __contains__(self, ticket):
+        return ticket in self._positions
+
+    def _close(self, ticket, price, profit=None):
+        position = self._positions.pop(ticket, None)
+        if position is None:
+            return None
+        side = self._sides[position.symbol]
+        del side.positions[ticket]
+        side.add(position, -1)
+        if price is None:
+            price = side.bid if position.is_buy else side.ask
+        if profit is None:
+            diff = price - position.price if position.is_buy else position.price - price
+            profit = side.convert(diff * position.volume, side.bid or price)
+        self.realized += profit
+        self.balance += profit
+        side.revalue()
+        return profit
+
+    # New prices for a symbol; positions whose SL/TP the tick reaches are closed at that level (where the
+    # terminal fills them), returned as [(ticket, info, profit)]
+    def on_tick(self, symbol, bid, ask):
+        with self._lock:
+            side = self._side(symbol)
+            self.ticks += 1
+            side.bid, side.ask = bid, ask
+            closed = []
+            if side.positions:
+                for ticket, level in side.stopped(bid, ask):
+                    info = side.positions[ticket].info
+                    closed.append((ticket, info, self._close(ticket, level)))
+                    self._stopped.add(ticket)
+                    self.stopped_out += 1
+            side.revalue()
+            return closed
+
+    def floating(self, symbol=None):
+        if symbol is not None:
+            side = self._sides.get(symbol)
+            return side.floating if side is not None else 0.0
+        return sum(side.floating for side in self._sides.values())
+
+    def net_volume(self, symbol):
+        side = self._sides.get(symbol)
+        return side.long_volume - side.short_volume if side is not None else 0.0
+
+    def margin(self, symbol=None):
+        if symbol is not None:
+            side = self._sides.get(symbol)
+            return side.margin(self.leverage) if side is not None else 0.0
+        return sum(side.margin(self.leverage) for side in self._sides.values())
+
+    def equity(self):
+        return self.balance + self.floating()
+
+    def free_margin(self):
+        return self.equity() - self.margin()
+
+    def __len__(self):
+        return len(self._positions)
+
+    # Whether a new position of this volume fits the free margin (and the net volume cap, if given)
+    def allows(self, symbol, is_buy, volume, max_net_volume=None):
+        with self._lock:
+            side = self._side(symbol)
+            if side.margin(self.leverage, volume) > self.free_margin():
+                return False
+            if max_net_volume is not None:
+                net = side.long_volume - side.short_volume + (volume if is_buy else -volume)
+                if abs(net) > max_net_volume + 1e-9:
+                    return False
+            return True
+
+    def exposure(self, symbol):
+        side = self._side(symbol)
+        return SymbolExposure(symbol, side.long_volume - side.short_volume, side.long_volume, side.short_volume,
+                              len(side.positions), side.floating, side.margin(self.leverage), side.bid, side.ask)
+
+    def report(self):
+        return (f"Equity {self.equity():.2f} (balance {self.balance:.2f}, floating {self.floating():.2f}), "
+                f"margin {self.margin():.2f}, {len(self._positions)} open, realized {self.realized:.2f}")
@@ -0,0 +1,196 @@
+## Tick-level backtest of gridbot2024 against mt5replay's matching engine: stop and limit orders fill and SL/TP ##
+## fire on the exact ticks between steps ##
+## Run: python gridbacktest.py --ticks ticks.csv | --store ~/Desktop/ticks --symbol USDJPYm | --synthetic 10000000 ##
+##      [--maintain 1] [--cycle 3600] [--trail-interval 0] [--trailing 0.2] [--volume 0.05] [--pips 0.05] ##
+##      [--levels 3] [--tp-pips 4] [--sl-pips 2] [--balance 10000] [--log gridbacktest.csv] [--verbose] ##
+## By default the live bot's GridManager re-arms and reprices levels and its TrailingStopEngine trails stops ##
+## --trailing behind the price every --maintain seconds ##
+## --maintain 0 replays the retired hourly flow instead (it lives here, no longer in the bot): a fresh ladder every ##
+## --cycle seconds, and trailing stops move only once every pending order has filled, unless --trail-interval ##
+## also moves them ##
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import mt5replay
+mt5 = mt5replay.install()
+
+import gridbot2024  # noqa: E402
+from gridmanager import GridManager  # noqa: E402
+from trailing import TrailingStopEngine  # noqa: E402
+from tickstore import TickRecorder  # noqa: E402
+from tradelog import TradeLogWriter  # noqa: E402
+
+
+# Retired hourly flow: deploy a fresh ladder around the mid price, sending the levels one after another
+def grid_strategy(symbol, volume=0.05, pips=0.05, levels=3, tp_pips=4, sl_pips=2):
+    tick = gridbot2024.snapshot.tick(symbol)
+    ladder = gridbot2024.build_grid_ladder((tick.bid + tick.ask) / 2, pips, levels, tp_pips, sl_pips)
+    for level in ladder:
+        request, result = gridbot2024.send_pending_order(symbol, int(level["type"]), volume, float(level["price"]),
+                                                         float(level["sl"]), float(level["tp"]))
+        gridbot2024.log_trade(request["type"], volume, request["price"], request["sl"], request["tp"], result)
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            print(f"Failed to place grid order type {request['type']} at {request['price']}: {result}")
+
+
+# Retired trailing rule: pull each position's stop to `distance` behind the current price when that tightens it
+def update_trailing_stop(symbol, distance):
+    tick = gridbot2024.snapshot.tick(symbol)
+    for position in gridbot2024.snapshot.positions(symbol) or ():
+        if position.type == mt5.ORDER_TYPE_BUY and tick.bid - distance > position.sl:
+            new_sl = tick.bid - distance
+        elif position.type == mt5.ORDER_TYPE_SELL and tick.ask + distance < position.sl:
+            new_sl = tick.ask + distance
+        else:
+            continue
+        gridbot2024.send_modify(gridbot2024.modify_request(position.ticket, new_sl, position.tp))
+
+
+# Run the GridManager every `maintain` seconds of market time over the ticks (or, with maintain=0, the retired
+# grid_strategy every `cycle` seconds); returns a summary dict
+def run_backtest(ticks, symbol="USDJPYm", cycle=3600, trail_interval=0, trailing=0.2, balance=10000.0,
+                 log_path=None, verbose=False, maintain=1, **params):
+    ticks = mt5replay.read_ticks(ticks)
+    mt5replay.load_ticks(ticks, symbol)
+    mt5replay.reset(balance)
+    mt5replay.set_speed(None)
+    gridbot2024.symbol = symbol
+
+    # Keep the backtest's orders and ticks out of the live log and tick store
+    scratch = tempfile.TemporaryDirectory(prefix="gridbacktest_")
+    gridbot2024.trade_log = TradeLogWriter(log_path or os.path.join(scratch.name, "log.csv"),
+                                           gridbot2024.columns, rotate_daily=False)
+    gridbot2024.tick_recorder = TickRecorder(os.path.join(scratch.name, "ticks"))
+    gridbot2024.book.full_sync()
+
+    times = ticks["time_msc"]
+    deployments = 0
+    grid = None
+    start = time.perf_counter()
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        now = int(times[0])
+        if maintain:
+            # The live trading_loop: every `maintain` seconds the manager re-arms missing levels and reprices moved
+            # ones, and the bot's TrailingStopEngine trails open positions. Like the live loop, a step with no new
+            # tick does nothing, so those are skipped outright; the book and the trailed positions only change
+            # through deals, so they are resynced when the replay has booked new ones
+            grid = GridManager(mt5, symbol, gridbot2024.book, gridbot2024.symbols, gridbot2024.build_grid_ladder,
+                               gridbot2024.place_order, gridbot2024.send_modify, gridbot2024.grid_magic,
+                               sync_interval=float("inf"), retry_interval=maintain, **params)
+            trailing_engine = TrailingStopEngine(mt5, symbol, trailing, send=gridbot2024.send_modify)
+            steps = np.arange(now, times[-1] + 1, maintain * 1000)
+            indexes = np.searchsorted(times, steps, side="right") - 1
+            new_tick = np.flatnonzero(np.diff(indexes, prepend=-1))
+            deals = 0
+            for step, index in zip(steps[new_tick].tolist(), indexes[new_tick].tolist()):
+                mt5replay.advance_to(step)
+                tick = mt5replay.Tick(*ticks[index].tolist())
+                gridbot2024.snapshot.refresh()
+                gridbot2024.snapshot.set_tick(symbol, tick)
+                total = mt5.history_deals_total(0, step / 1000 + 1)
+                if total != deals:
+                    deals = total
+                    gridbot2024.book.sync()
+                    trailing_engine.sync(mt5.positions_get(symbol=symbol))
+                grid.maintain(tick, step / 1000)
+                trailing_engine.on_tick(tick, step / 1000)
+            deployments = grid.recenters
+        while not maintain and now <= times[-1]:
+            mt5replay.advance_to(now)
+            gridbot2024.snapshot.refresh()
+            grid_strategy(symbol, **params)
+            deployments += 1
+            cycle_end = now + cycle * 1000
+            if trail_interval:
+                for t in range(now + trail_interval * 1000, cycle_end, trail_interval * 1000):
+                    mt5replay.advance_to(t)
+                    gridbot2024.snapshot.refresh()
+                    update_trailing_stop(symbol, trailing)
+            mt5replay.advance_to(cycle_end)
+            gridbot2024.snapshot.refresh()
+            if not mt5.orders_get(symbol=symbol):
+                update_trailing_stop(symbol, trailing)
+            now = cycle_end
+    elapsed = time.perf_counter() - start
+    gridbot2024.trade_log.close()
+    gridbot2024.tick_recorder.close()
+    scratch.cleanup()
+
+    deals = mt5replay.history_deals_get(0, times[-1] / 1000 + 1)
+    orders = mt5replay.history_orders_get(0, times[-1] / 1000 + 1)
+    closes = [d for d in deals if d.entry == mt5.DEAL_ENTRY_OUT]
+    equity = balance + np.cumsum([d.profit for d in closes])
+    peak = np.maximum.accumulate(np.r_[balance, equity])
+    account = mt5.account_info()
+    return {
+        "ticks": len(ticks),
+        "elapsed": elapsed,
+        "ticks_per_sec": len(ticks) / elapsed,
+        "deployments": deployments,
+        "fills": sum(1 for o in orders if o.state == mt5.ORDER_STATE_FILLED),
+        "orders_placed": len(orders) + len(mt5.orders_get(symbol=symbol)),
+        "orders_repriced": grid.repriced if grid else 0,
+        "orders_cancelled": sum(1 for o in orders if o.state == mt5.ORDER_STATE_CANCELED),
+        "sl": sum(1 for d in closes if d.reason == mt5.DEAL_REASON_SL),
+        "tp": sum(1 for d in closes if d.reason == mt5.DEAL_REASON_TP),
+        "open_positions": len(mt5.positions_get(symbol=symbol)),
+        "pending_orders": len(mt5.orders_get(symbol=symbol)),
+        "balance": account.balance,
+        "equity": account.equity,
+        "max_drawdown": float((peak - np.r_[balance, equity]).max()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tick-level gridbot2024 backtest on the replay matching engine")
+    parser.add_argument("--ticks", help="Tick CSV with time_msc, bid, ask")
+    parser.add_argument("--store", help="Tick store root (see tickstore.py)")
+    parser.add_argument("--symbol", default="USDJPYm")
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic ticks")
+    parser.add_argument("--cycle", type=int, default=3600,
+                        help="Seconds between ladder deployments of the retired hourly flow (--maintain 0)")
+    parser.add_argument("--trail-interval", type=int, default=0, help="Retired flow: also trail stops every this many seconds")
+    parser.add_argument("--trailing", type=float, default=0.2, help="Trailing stop distance")
+    parser.add_argument("--volume", type=float, default=0.05)
+    parser.add_argument("--pips", type=float, default=0.05)
+    parser.add_argument("--levels", type=int, default=3)
+    parser.add_argument("--tp-pips", type=float, default=4)
+    parser.add_argument("--sl-pips", type=float, default=2)
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--log", help="Write the backtest's trade log here")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's output")
+    parser.add_argument("--maintain", type=int, default=1,
+                        help="Run the live GridManager every this many seconds (0 = the retired hourly ladders)")
+    args = parser.parse_args()
+
+    if args.ticks:
+        ticks = mt5replay.read_ticks(args.ticks)
+    elif args.store:
+        from tickstore import TickStore
+        ticks = TickStore(args.store).read(args.symbol)
+    elif args.synthetic:
+        from bench_replay import synthetic_ticks
+        ticks = synthetic_ticks(args.synthetic)
+    else:
+        parser.error("one of --ticks, --store or --synthetic is required")
+
+    r = run_backtest(ticks, args.symbol, args.cycle, args.trail_interval, args.trailing, args.balance, args.log,
+                     args.verbose, args.maintain, volume=args.volume, pips=args.pips, levels=args.levels, tp_pips=args.tp_pips,
+                     sl_pips=args.sl_pips)
+    print(f"{r['ticks']} ticks in {r['elapsed']:.2f} s ({r['ticks_per_sec'] / 1e6:.2f}M ticks/s), "
+          f"{r['deployments']} grids, {r['fills']} fills, {r['sl']} SL / {r['tp']} TP closes")
+    print(f"Order traffic: {r['orders_placed']} placed, {r['orders_repriced']} repriced, "
+          f"{r['orders_cancelled']} cancelled")
+    print(f"Balance {r['balance']:.2f}, equity {r['equity']:.2f}, max drawdown {r['max_drawdown']:.2f}, "
+          f"{r['open_positions']} positions and {r['pending_orders']} orders still open")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,59 @@
 import MetaTrader5 as mt5
 import time
 import pandas as pd
+import numpy as np
 import os
+from tradelog import TradeLogWriter
+from snapshot import MarketSnapshot
+from orderbook import OrderBook
+from tickfeed import TickFeed
+from trailing import TrailingStopEngine
+from tickstore import TickRecorder
+from checkpoint import Checkpoint
+from symbols import SymbolCache
+from supervisor import Supervisor
+from gridmanager import GridManager
+import metrics
 
 # Symbol to trade
 symbol = "USDJPYm"
 
-# Initialize the DataFrame for logging
+# Initialize the trade log writer (appends in the background, one file per day)
 columns = ['timestamp', 'order_type', 'volume', 'price', 'sl', 'tp', 'result']
-trade_log_df = pd.DataFrame(columns=columns)
+desktop = os.path.join(os.path.expanduser("~"), "Desktop")
+trade_log = TradeLogWriter(os.path.join(desktop, 'gridbotlog.csv'), columns)
 
-# Connect to MetaTrader 5
-if not mt5.initialize():
-    print("Failed to initialize, error code =", mt5.last_error())
-    quit()
+# Market state shared by everything in one loop iteration
+snapshot = MarketSnapshot(mt5)
 
-# Get the current price
-def get_current_price(symbol):
-    ticker = mt5.symbol_info_tick(symbol)
-    if ticker is None:
-        raise Exception(f"Failed to get ticker for {symbol}")
-    return ticker.bid, ticker.ask
+# Local order/position book, updated from order and deal deltas
+book = OrderBook(mt5)
+
+# Digits, tick size, volume limits and stops/freeze levels, read once and refreshed hourly
+symbols = SymbolCache(mt5)
+
+# Every tick seen is recorded to one binary file per symbol per day
+tick_recorder = TickRecorder(os.path.join(desktop, "ticks"))
+
+# Grid ladder state (its centre and the order ticket of every level), for warm restarts
+checkpoint = Checkpoint(os.path.join(desktop, "gridbot_state.json"))
+
+# Magic number of the grid's orders
+grid_magic = 234000
+
+# Reload terminal state after a reconnect
+def resync():
+    snapshot.refresh()
+    symbols.invalidate()
+    book.full_sync()
+
+# Reconnects with backoff when the terminal connection drops, then resyncs and resumes the main loop
+supervisor = Supervisor(mt5, resync)
 
 # Function to log buy/sell order details
+@metrics.timed("log_trade")
 def log_trade(order_type, volume, price, sl, tp, result):
-    global trade_log_df
-    print(f"Logging trade: {order_type}, {volume}, {price}, {sl}, {tp}, {result.retcode if result else 'failed'}")
-    
-    new_trade = pd.DataFrame([{
+    trade_log.log({
         'timestamp': pd.Timestamp.now(),
         'order_type': order_type,
         'volume': volume,
@@ -35,28 +61,15 @@ def log_trade(order_type, volume, price, sl, tp, result):
         'sl': sl,
         'tp': tp,
         'result': result.retcode if result else 'failed'
-    }])
-    
-    print(f"New trade DataFrame:\n{new_trade}")
-    
-    if not new_trade.isna().all().all():
-        trade_log_df = pd.concat([trade_log_df, new_trade], ignore_index=True)
-        print(f"Updated trade_log_df:\n{trade_log_df}")
-
-# Function to save DataFrame into CSV file locally
-def save_log_to_csv():
-    desktop = os.path.join(os.path.join(os.environ['USERPROFILE']), 'Desktop')
-    filepath = os.path.join(desktop, 'gridbotlog.csv')
-    trade_log_df.to_csv(filepath, index=False)
+    })
 
-# Place an order with correct price precision
-def place_order(symbol, order_type, volume, price, sl, tp):
-    # Ensure the price has the correct precision
-    price = round(price, 3)  # For JPY pairs, using 3 decimal places
-    sl = round(sl, 3)
-    tp = round(tp, 3)
+# Function to flush the trade log into the CSV file locally
+def save_log_to_csv():
+    trade_log.flush()
 
-    request = {
+# Build a pending order request, normalized to the symbol's tick size and volume step
+def pending_order_request(symbol, order_type, volume, price, sl, tp):
+    return symbols.normalize({
         "action": mt5.TRADE_ACTION_PENDING,
         "symbol": symbol,
         "volume": volume,
@@ -65,149 +78,142 @@ def place_order(symbol, order_type, volume, price, sl, tp):
         "sl": sl,
         "tp": tp,
         "deviation": 10,
-        "magic": 234000,
+        "magic": grid_magic,
         "comment": "Grid strategy",
         "type_time": mt5.ORDER_TIME_GTC,
         "type_filling": mt5.ORDER_FILLING_RETURN,
-    }
-    
-    result = mt5.order_send(request)
-    
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
+    })
+
+# Send a pending order, without logging; a request that fails the local checks never reaches the server
+@metrics.timed("place_order")
+def send_pending_order(symbol, order_type, volume, price, sl, tp):
+    request = pending_order_request(symbol, order_type, volume, price, sl, tp)
+    tick = supervisor.expect(snapshot.tick(symbol), "symbol_info_tick")
+    request = symbols.fit_pending(request, tick)
+    result = symbols.check(request, tick)
+    if result is not None:
+        metrics.count("local_rejects", "place_order")
+        return request, result
+    result = supervisor.expect(snapshot.order_send(request), "order_send")
+    metrics.count_reject("place_order", result)
+    book.record(request, result)
+    return request, result
+
+# Place an order with correct price precision
+def place_order(symbol, order_type, volume, price, sl, tp):
+    request, result = send_pending_order(symbol, order_type, volume, price, sl, tp)
+    log_trade(order_type, volume, request["price"], request["sl"], request["tp"], result)
+
+    if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
         print(f"Failed to send order: {result}")
-        log_trade(order_type, volume, price, sl, tp, result)
         return None
-    else:
-        print(f"Order sent successfully: {result}")
-        log_trade(order_type, volume, price, sl, tp, result)
-    
+    print(f"Order sent successfully: {result}")
     return result
 
-# Update trailing stop loss for open positions
-def update_trailing_stop(symbol, trailing_stop_distance):
-    positions = mt5.positions_get(symbol=symbol)
-    if positions is None:
-        print(f"No positions found for {symbol}, error code:", mt5.last_error())
-        return
-    
-    for position in positions:
-        if position.type == mt5.ORDER_TYPE_BUY:
-            new_sl = mt5.symbol_info_tick(symbol).bid - trailing_stop_distance
-            if new_sl > position.sl:
-                modify_order(position.ticket, new_sl, position.tp)
-        elif position.type == mt5.ORDER_TYPE_SELL:
-            new_sl = mt5.symbol_info_tick(symbol).ask + trailing_stop_distance
-            if new_sl < position.sl:
-                modify_order(position.ticket, new_sl, position.tp)
-
-# Modify an existing order's stop loss and take profit
-def modify_order(position_ticket, new_sl, new_tp):
-    request = {
+# Build the request that moves an open position's stop loss and take profit
+def modify_request(position_ticket, new_sl, new_tp):
+    return {
         "action": mt5.TRADE_ACTION_SLTP,
         "position": position_ticket,
         "sl": new_sl,
         "tp": new_tp,
         "deviation": 10,
     }
-    result = mt5.order_send(request)
-    if result.retcode != mt5.TRADE_RETCODE_DONE:
-        print(f"Failed to modify order: {result}")
-        return None
-    return result
 
-# Grid strategy
-def grid_strategy(symbol):
-    volume = 0.05  # Define your volume/lotsize, adjust as necessary
-    pips = 0.05  # pip distance, adjust as necessary
-
-    bid, ask = get_current_price(symbol)
-    current_price = (bid + ask) / 2
-
-    # Define sell stops
-    last_sell_tp = None
-    for i in range(1, 4):
-        price = current_price - i * pips
-        tp = price - 4 * pips  # Take profit 4 levels away
-        sl = price + 2 * pips  # Stop loss half of take profit
-        last_sell_tp = tp  # Save the TP level of the last sell stop
-        result = place_order(symbol, mt5.ORDER_TYPE_SELL_STOP, volume, price, sl, tp)
-        if result is None:
-            print(f"Invalid price for sell stop at {price}. Retrying with adjusted price.")
-            # Adjust the price slightly and retry
-            price = round(current_price - (i * pips * 1.01), 3)
-            result = place_order(symbol, mt5.ORDER_TYPE_SELL_STOP, volume, price, sl, tp)
-            if result is None:
-                print(f"Failed to place adjusted sell stop order at {price}")
-                continue
-
-    # Place buy limit at the position of the last sell stop's TP level
-    if last_sell_tp is not None:
-        buy_limit_price = last_sell_tp
-        buy_limit_tp = buy_limit_price + 4 * pips
-        buy_limit_sl = buy_limit_price - 2 * pips
-        result = place_order(symbol, mt5.ORDER_TYPE_BUY_LIMIT, volume, buy_limit_price, buy_limit_sl, buy_limit_tp)
-        if result is None:
-            print(f"Invalid price for buy limit at {buy_limit_price}. Retrying with adjusted price.")
-            # Adjust the price slightly and retry
-            buy_limit_price = round(last_sell_tp * 1.01, 3)
-            result = place_order(symbol, mt5.ORDER_TYPE_BUY_LIMIT, volume, buy_limit_price, buy_limit_sl, buy_limit_tp)
-            if result is None:
-                print(f"Failed to place adjusted buy limit order at {buy_limit_price}")
-
-    # Define buy stops
-    last_buy_tp = None
-    for i in range(1, 4):
-        price = current_price + i * pips
-        tp = price + 4 * pips  # Take profit 4 levels away
-        sl = price - 2 * pips  # Stop loss half of take profit
-        last_buy_tp = tp  # Save the TP level of the last buy stop
-        result = place_order(symbol, mt5.ORDER_TYPE_BUY_STOP, volume, price, sl, tp)
-        if result is None:
-            print(f"Invalid price for buy stop at {price}. Retrying with adjusted price.")
-            # Adjust the price slightly and retry
-            price = round(current_price + (i * pips * 1.01), 3)
-            result = place_order(symbol, mt5.ORDER_TYPE_BUY_STOP, volume, price, sl, tp)
-            if result is None:
-                print(f"Failed to place adjusted buy stop order at {price}")
-                continue
-
-    # Place sell limit at the position of the last buy stop's TP level
-    if last_buy_tp is not None:
-        sell_limit_price = last_buy_tp
-        sell_limit_tp = sell_limit_price - 4 * pips
-        sell_limit_sl = sell_limit_price + 2 * pips
-        result = place_order(symbol, mt5.ORDER_TYPE_SELL_LIMIT, volume, sell_limit_price, sell_limit_sl, sell_limit_tp)
-        if result is None:
-            print(f"Invalid price for sell limit at {sell_limit_price}. Retrying with adjusted price.")
-            # Adjust the price slightly and retry
-            sell_limit_price = round(last_buy_tp * 1.01, 3)
-            result = place_order(symbol, mt5.ORDER_TYPE_SELL_LIMIT, volume, sell_limit_price, sell_limit_sl, sell_limit_tp)
-            if result is None:
-                print(f"Failed to place adjusted sell limit order at {sell_limit_price}")
-
-# Check if all pending orders have been executed
-def all_orders_executed():
-    orders = mt5.orders_get(symbol=symbol)
-    return orders is None or len(orders) == 0
-
-# Main loop
-while True:
-    # Run the grid strategy
-    grid_strategy(symbol)
-    
-    # Wait for 1 hour and check if all orders have been executed before placing new ones
-    time.sleep(3600)
-    
-    # If there are still pending orders, wait until the next iteration
-    if not all_orders_executed():
-        continue
-
-    # Update trailing stop loss for open positions
-    trailing_stop_distance = 2 * 0.1  # Example trailing stop distance, adjust as needed
-    update_trailing_stop(symbol, trailing_stop_distance)
+# Send a stop loss/take profit modification for the trailing stop engine
+@metrics.timed("modify_order")
+def send_modify(request):
+    result = supervisor.expect(snapshot.order_send(request), "order_send")
+    metrics.count_reject("modify_order", result)
+    return result
 
-    # Save to CSV file function call
-    save_log_to_csv()
+# Grid ladder levels: order type, price, SL and TP
+GRID_LEVEL_DTYPE = np.dtype([("type", "i4"), ("price", "f8"), ("sl", "f8"), ("tp", "f8")])
+
+# Compute the whole grid up front: 3 sell stops, a buy limit at the last sell stop's TP,
+# 3 buy stops and a sell limit at the last buy stop's TP (TP 4 and SL 2 pip distances away by default)
+def build_grid_ladder(current_price, pips, levels=3, tp_pips=4, sl_pips=2):
+    steps = np.arange(1, levels + 1)
+    sell_stops = current_price - steps * pips
+    buy_stops = current_price + steps * pips
+    last_sell_tp = sell_stops[-1] - tp_pips * pips
+    last_buy_tp = buy_stops[-1] + tp_pips * pips
+
+    ladder = np.zeros(2 * levels + 2, dtype=GRID_LEVEL_DTYPE)
+    sells = slice(0, levels)
+    buys = slice(levels + 1, 2 * levels + 1)
+
+    ladder["type"][sells] = mt5.ORDER_TYPE_SELL_STOP
+    ladder["price"][sells] = sell_stops
+    ladder["tp"][sells] = sell_stops - tp_pips * pips  # Take profit tp_pips levels away
+    ladder["sl"][sells] = sell_stops + sl_pips * pips  # Stop loss sl_pips levels away
+
+    ladder[levels] = (mt5.ORDER_TYPE_BUY_LIMIT, last_sell_tp, last_sell_tp - sl_pips * pips, last_sell_tp + tp_pips * pips)
+
+    ladder["type"][buys] = mt5.ORDER_TYPE_BUY_STOP
+    ladder["price"][buys] = buy_stops
+    ladder["tp"][buys] = buy_stops + tp_pips * pips  # Take profit tp_pips levels away
+    ladder["sl"][buys] = buy_stops - sl_pips * pips  # Stop loss sl_pips levels away
+
+    ladder[-1] = (mt5.ORDER_TYPE_SELL_LIMIT, last_buy_tp, last_buy_tp + sl_pips * pips, last_buy_tp - tp_pips * pips)
+    return ladder
+
+# Keeps the ladder armed: on every tick only missing levels are placed and moved levels repriced
+grid = GridManager(mt5, symbol, book, symbols, build_grid_ladder, place_order, send_modify, grid_magic)
+
+# Keep the grid armed and trail stops on every new tick (replaces the hourly redeploy)
+def trading_loop(trailing_engine, sync_interval=1.0):
+    # Warm restart (or reconnect): adopt the saved ladder and its live orders instead of deploying another
+    if grid.restore(checkpoint.load()):
+        print(f"Resuming: {grid.report()}")
+    feed = TickFeed(mt5, symbol, poll_interval=0.01, on_none=lambda: supervisor.expect(None, "symbol_info_tick"))
+    next_sync = 0.0
+    while True:
+        ticks = feed.poll()
+        for tick in ticks:
+            tick_recorder.record(symbol, tick)
+        if not ticks:
+            trailing_engine.flush()  # Throttled modifies still go out between ticks
+            time.sleep(feed.poll_interval)
+            continue
+        tick = ticks[-1]
+        snapshot.refresh()
+        snapshot.set_tick(symbol, tick)
+
+        recenters = grid.recenters
+        if grid.maintain(tick):
+            checkpoint.save(grid.state())
+            if grid.recenters != recenters:
+                print(grid.report())
+                save_log_to_csv()
+
+        now = time.monotonic()
+        if now >= next_sync:
+            snapshot.invalidate("positions")
+            trailing_engine.sync(supervisor.expect(snapshot.positions(symbol), "positions_get") or ())
+            next_sync = now + sync_interval
+        trailing_engine.on_tick(tick)
+
+if __name__ == "__main__":
+    # Connect to MetaTrader 5
+    if not mt5.initialize():
+        print("Failed to initialize, error code =", mt5.last_error())
+        quit()
+    book.full_sync()
+
+    # Optional --metrics-file/--metrics-port/--profile
+    instrumentation = metrics.start_from_args("gridbot")
 
-# Disconnect from MetaTrader 5
-mt5.shutdown()
+    trailing_stop_distance = 2 * 0.1  # Example trailing stop distance, adjust as needed
+    trailing_engine = TrailingStopEngine(mt5, symbol, trailing_stop_distance, send=send_modify)
+
+    # Main loop, resumed after a reconnect if the terminal connection drops
+    try:
+        supervisor.run(trading_loop, trailing_engine)
+    except Exception as e:
+        print(f"Error: {e}")
+
+    # Flush the trade log and metrics, then disconnect from MetaTrader 5
+    instrumentation.stop()
+    trade_log.close()
+    mt5.shutdown()
@@ -0,0 +1,199 @@
+## Incremental grid maintenance: the desired ladder is kept as state and diffed against the live book ##
+## Each ladder level has a slot holding the ticket of its order (a filled order's position has the same ticket) ##
+## On every tick only what differs is touched: a level with no order and no open position is placed again, ##
+## an order whose level moved is repriced in place, and grid orders no level owns are cancelled ##
+## The ladder re-centres on the mid price, snapped to the level spacing, once it is more than `recenter` level ##
+## spacings from the centre: orders already on a level of the new ladder stay put and only the edge levels move; ##
+## positions still open then stay with their SL/TP (and the trailing stops) and their levels are re-armed ##
+
+import time
+
+import metrics
+
+
+class GridManager:
+    def __init__(self, mt5, symbol, book, symbols, build, place, send, magic, volume=0.05, pips=0.05, levels=3,
+                 tp_pips=4, sl_pips=2, recenter=None, sync_interval=0.25, retry_interval=1.0):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.book = book
+        self.symbols = symbols
+        self.build = build  # build(center, pips, levels, tp_pips, sl_pips) -> ladder array (type, price, sl, tp)
+        self.place = place  # place(symbol, type, volume, price, sl, tp) -> result, or None if it failed
+        self.send = send  # send(request) -> result, for modify and remove requests
+        self.magic = magic  # Orders with this magic number on the symbol belong to the grid
+        self.volume = volume
+        self.pips = pips
+        self.levels = levels
+        self.tp_pips = tp_pips
+        self.sl_pips = sl_pips
+        self.recenter = levels + 1 if recenter is None else recenter  # In level spacings
+        self.sync_interval = sync_interval
+        self.retry_interval = retry_interval
+        self.center = None
+        self.ladder = None
+        self.targets = []  # Per level: (order type, (price, sl, tp)), read out of the ladder once per centre
+        self.slots = []  # Per level: [ticket (0 = none), (price, sl, tp) it was sent at, no retry before]
+        self.recenters = 0
+        self.placed = 0
+        self.repriced = 0
+        self.cancelled = 0
+        self.failed = 0
+        self._next_sync = 0.0
+        self._cancel_retry = {}  # ticket -> no cancel retry before
+
+    # Adopt a ladder saved by state() after a restart or reconnect
+    def restore(self, state):
+        if not state or state.get("center") is None:
+            return False
+        self._set_center(state["center"])
+        for slot, (ticket, key) in zip(self.slots, state.get("slots", [])):
+            slot[0], slot[1] = ticket, tuple(key) if key else None
+        self.recenters = state.get("recenters", 0)
+        return True
+
+    def state(self):
+        return {"center": self.center, "recenters": self.recenters,
+                "slots": [[ticket, list(key) if key else None] for ticket, key, _ in self.slots]}
+
+    def _set_center(self, center):
+        self.center = center
+        self.ladder = self.build(center, self.pips, self.levels, self.tp_pips, self.sl_pips)
+        # Tick-size rounded, so a level of the next ladder at the same price compares equal
+        price = self.symbols.normalize_price
+        self.targets = [(int(t), (price(self.symbol, p), price(self.symbol, sl), price(self.symbol, tp)))
+                        for t, p, sl, tp in self.ladder.tolist()]
+        self.slots = [[0, None, 0.0] for _ in self.targets]
+
+    def _recenter(self, mid):
+        # Orders still pending, by the level they were placed for (filled levels are free again: the position
+        # keeps its SL/TP)
+        live = {level: slot for slot, level in zip(self.slots, self.targets)
+                if slot[0] and self.book.order(slot[0]) is not None}
+        # Snap the centre to the level spacing, so the new ladder shares its inner levels with the old one
+        self._set_center(self.symbols.normalize_price(self.symbol, round(mid / self.pips) * self.pips))
+        free = []
+        for i, level in enumerate(self.targets):
+            slot = live.pop(level, None)
+            if slot is None:
+                free.append(i)
+            else:
+                self.slots[i] = slot  # Same type at the same price: the order stays as it is
+        # An order whose level left the ladder is repriced onto a new edge level of its type; any left over
+        # are no longer owned and get cancelled
+        spare = {}
+        for (order_type, _), slot in live.items():
+            spare.setdefault(order_type, []).append(slot)
+        for i in free:
+            slots = spare.get(self.targets[i][0])
+            if slots:
+                self.slots[i] = slots.pop()
+        self.recenters += 1
+        metrics.count("recenters", "grid")
+
+    # Whether a pending order of this type at price is on the right side of the market to be placed
+    def _armable(self, order_type, price, tick):
+        mt5 = self.mt5
+        if order_type == mt5.ORDER_TYPE_BUY_STOP:
+            return price > tick.ask
+        if order_type == mt5.ORDER_TYPE_SELL_STOP:
+            return price < tick.bid
+        if order_type == mt5.ORDER_TYPE_BUY_LIMIT:
+            return price < tick.ask
+        return price > tick.bid
+
+    # Bring the grid's orders in line with the ladder at this tick; returns True if any slot changed
+    @metrics.timed("grid_maintain")
+    def maintain(self, tick, now=None):
+        now = time.monotonic() if now is None else now
+        mid = (tick.bid + tick.ask) / 2
+        if now >= self._next_sync:
+            self.book.sync()
+            self._next_sync = now + self.sync_interval
+        changed = False
+        if self.center is None or abs(mid - self.center) > self.recenter * self.pips:
+            self._recenter(mid)
+            changed = True
+
+        armed = 0
+        for slot, (order_type, target) in zip(self.slots, self.targets):
+            ticket, key, retry_at = slot
+            if ticket and self.book.order(ticket) is not None:
+                armed += 1
+                if key != target and now >= retry_at:
+                    changed |= self._reprice(slot, ticket, order_type, target, tick, now)
+                continue
+            if ticket and self.book.position(ticket) is not None:
+                continue  # Filled and still open: the level is re-armed once its position closes
+            if now >= retry_at and self._armable(order_type, target[0], tick) and \
+                    self._place(slot, order_type, target, now):
+                changed = True
+                armed += 1
+
+        if self.book.count_orders(self.symbol, self.magic) <= armed:
+            return changed
+        owned = {slot[0] for slot in self.slots}
+        for order in self.book.orders_for(self.symbol, self.magic):
+            if order.ticket not in owned and now >= self._cancel_retry.get(order.ticket, 0.0):
+                changed |= self._cancel(order.ticket, now)
+        return changed
+
+    def _place(self, slot, order_type, target, now):
+        result = self.place(self.symbol, order_type, self.volume, *target)
+        if result is None:
+            self.failed += 1
+            slot[2] = now + self.retry_interval
+            return False
+        slot[0], slot[1] = result.order, target
+        self.placed += 1
+        return True
+
+    # Move a live order to its level's new price, SL and TP in one request (it keeps its ticket and queue slot)
+    def _reprice(self, slot, ticket, order_type, target, tick, now):
+        request = {"action": self.mt5.TRADE_ACTION_PENDING, "symbol": self.symbol, "type": order_type,
+                   "volume": self.volume, "price": target[0], "sl": target[1], "tp": target[2]}
+        request = self.symbols.fit_pending(self.symbols.normalize(request), tick)
+        spec = self.symbols.spec(self.symbol)
+        market = tick.ask if order_type in (self.mt5.ORDER_TYPE_BUY_LIMIT, self.mt5.ORDER_TYPE_BUY_STOP) else tick.bid
+        order = self.book.order(ticket)
+        if spec is not None and spec.freeze_level and abs(order.price - market) <= spec.freeze_level:
+            return False  # Too close to the market to touch; try again on a later tick
+        if self.symbols.check(request, tick) is not None:
+            slot[2] = now + self.retry_interval
+            return False
+        modify = {"action": self.mt5.TRADE_ACTION_MODIFY, "order": ticket, "symbol": self.symbol,
+                  "price": request["price"], "sl": request["sl"], "tp": request["tp"],
+                  "type_time": self.mt5.ORDER_TIME_GTC}
+        result = self.send(modify)
+        if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+            # Filled or gone meanwhile, or refused: the next sync shows which
+            self.failed += 1
+            slot[2] = now + self.retry_interval
+            self._next_sync = 0.0
+            return False
+        self.book.record(modify, result)
+        slot[1] = target
+        self.repriced += 1
+        return True
+
+    def _cancel(self, ticket, now):
+        request = {"action": self.mt5.TRADE_ACTION_REMOVE, "order": ticket}
+        result = self.send(request)
+        if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+            self.failed += 1
+            self._cancel_retry[ticket] = now + self.retry_interval
+            self._next_sync = 0.0
+            return False
+        self._cancel_retry.pop(ticket, None)
+        self.book.record(request, result)
+        self.cancelled += 1
+        return True
+
+    # Order requests sent so far
+    def requests(self):
+        return self.placed + self.repriced + self.cancelled + self.failed
+
+    def report(self):
+        armed = sum(1 for ticket, _, _ in self.slots if ticket and self.book.order(ticket) is not None)
+        return (f"Grid around {self.center}: {armed}/{len(self.slots)} levels armed, {self.recenters} re-centres, "
+                f"{self.placed} placed, {self.repriced} repriced, {self.cancelled} cancelled, {self.failed} failed")
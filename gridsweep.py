@@ -0,0 +1,279 @@
+## Multi-core parameter sweep for the gridbot2024 ladder over historical ticks ##
+## Run: python gridsweep.py --ticks ticks.csv | --store ~/Desktop/ticks --symbol USDJPYm | --synthetic 2000000 ##
+##      [--pips 0.03,0.05,0.08] [--levels 2,3,4] [--tp-pips 3,4,6] [--sl-pips 1,2,3] [--trailing 0,0.1,0.2] ##
+##      [--volume 0.05] [--cycle 3600] [--horizon 86400] [--workers 8] [--top 20] [--out results.csv] ##
+## The ticks are copied once into shared memory; every worker maps the same pages instead of taking a copy ##
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import mt5replay
+
+# The grid functions do not need a terminal; use the replay stand-in where MetaTrader5 is not installed
+try:
+    import MetaTrader5 as mt5
+except ImportError:
+    mt5 = mt5replay.install()
+
+from gridbot2024 import build_grid_ladder
+
+CONTRACT_SIZE = 100000
+BLOCK = 1024  # Ticks per block in the max/min index used to find the first touch of a price
+BUY_TYPES = (mt5.ORDER_TYPE_BUY_LIMIT, mt5.ORDER_TYPE_BUY_STOP)
+# Buy stops and sell limits trigger when the price rises to them, the others when it falls
+TRIGGER_ABOVE = (mt5.ORDER_TYPE_BUY_STOP, mt5.ORDER_TYPE_SELL_LIMIT)
+ARRAYS = ("time_msc", "bid", "ask", "bid_max", "bid_min", "ask_max", "ask_min")
+
+# Arrays of the attached shared memory block, set in each worker by _attach()
+_data = {}
+_shm = [None]
+
+
+# Per-block max/min so a first-touch search skips whole blocks that cannot contain the price
+def _block_extremes(values):
+    n = len(values)
+    padded = np.full(-(-n // BLOCK) * BLOCK, np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(-1, BLOCK)
+    return np.nanmax(blocks, axis=1), np.nanmin(blocks, axis=1)
+
+
+# Copy the tick columns and block index into one shared memory block; returns (shm, layout)
+def share_ticks(ticks):
+    bid_max, bid_min = _block_extremes(ticks["bid"])
+    ask_max, ask_min = _block_extremes(ticks["ask"])
+    arrays = {
+        "time_msc": np.ascontiguousarray(ticks["time_msc"], dtype=np.int64),
+        "bid": np.ascontiguousarray(ticks["bid"], dtype=np.float64),
+        "ask": np.ascontiguousarray(ticks["ask"], dtype=np.float64),
+        "bid_max": bid_max, "bid_min": bid_min, "ask_max": ask_max, "ask_min": ask_min,
+    }
+    layout, offset = {}, 0
+    for name in ARRAYS:
+        a = arrays[name]
+        layout[name] = (offset, a.dtype.str, len(a))
+        offset += a.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for name in ARRAYS:
+        start, dtype, length = layout[name]
+        np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)[:] = arrays[name]
+    return shm, layout
+
+
+def _attach(name, layout):
+    shm = shared_memory.SharedMemory(name=name)
+    _shm[0] = shm  # Keep the mapping alive for the life of the worker
+    for key, (start, dtype, length) in layout.items():
+        _data[key] = np.ndarray(length, dtype=dtype, buffer=shm.buf, offset=start)
+
+
+# First index in [lo, hi) where prices >= level (above=True) or <= level, or None
+def first_touch(prices, block_max, block_min, lo, hi, level, above):
+    def hits(a):
+        return a >= level if above else a <= level
+
+    edge = min(-(-lo // BLOCK) * BLOCK, hi)
+    found = np.flatnonzero(hits(prices[lo:edge]))
+    if len(found):
+        return lo + int(found[0])
+    if edge >= hi:
+        return None
+    first_block, last_block = edge // BLOCK, -(-hi // BLOCK)
+    index = block_max if above else block_min
+    candidates = np.flatnonzero(hits(index[first_block:last_block]))
+    for block in candidates[:2]:  # Only a block clipped at hi can be a false candidate
+        start = (first_block + int(block)) * BLOCK
+        found = np.flatnonzero(hits(prices[start:min(start + BLOCK, hi)]))
+        if len(found):
+            return start + int(found[0])
+    return None
+
+
+# First index in [lo, hi) where the trailing stop (distance behind the best price since lo) is hit
+def trailing_hit(prices, lo, hi, distance, is_buy):
+    best = prices[lo]
+    chunk = 256
+    while lo < hi:
+        window = prices[lo:min(lo + chunk, hi)]
+        if is_buy:
+            peak = np.maximum.accumulate(np.maximum(window, best))
+            found = np.flatnonzero(window <= peak - distance)
+            best = peak[-1]
+        else:
+            trough = np.minimum.accumulate(np.minimum(window, best))
+            found = np.flatnonzero(window >= trough + distance)
+            best = trough[-1]
+        if len(found):
+            return lo + int(found[0])
+        lo += len(window)
+        chunk *= 4
+    return None
+
+
+# Simulate the live loop for one parameter set: a fresh ladder around the mid price every `cycle` seconds,
+# pending orders live for `horizon` seconds, fills at the touching tick, exits on TP, SL, trailing stop
+# or at the end of the horizon. Buys fill and trail on ask/bid like the terminal.
+def simulate(params, cycle=3600, horizon=86400, digits=3):
+    t, bid, ask = _data["time_msc"], _data["bid"], _data["ask"]
+    n = len(t)
+    pips, levels, tp_pips, sl_pips = params["pips"], params["levels"], params["tp_pips"], params["sl_pips"]
+    trailing, volume = params["trailing"], params["volume"]
+
+    deploy_times = np.arange(t[0], t[-1], cycle * 1000)
+    deploys = np.searchsorted(t, deploy_times)
+    expiries = np.searchsorted(t, deploy_times + horizon * 1000)
+    exits, pls, outcomes = [], [], []
+    fills = 0
+    for start, end in zip(deploys.tolist(), expiries.tolist()):
+        end = min(end, n)
+        if start + 1 >= end:
+            continue
+        ladder = build_grid_ladder((bid[start] + ask[start]) / 2, pips, levels, tp_pips, sl_pips)
+        for level in ladder:
+            order_type = int(level["type"])
+            is_buy = order_type in BUY_TYPES
+            price, sl, tp = round(level["price"], digits), round(level["sl"], digits), round(level["tp"], digits)
+            above = order_type in TRIGGER_ABOVE
+            market = "ask" if is_buy else "bid"
+            filled = first_touch(_data[market], _data[market + "_max"], _data[market + "_min"], start + 1, end, price, above)
+            if filled is None:
+                continue
+            fills += 1
+            # Positions close on bid (buys) or ask (sells)
+            close = "bid" if is_buy else "ask"
+            closes, close_max, close_min = _data[close], _data[close + "_max"], _data[close + "_min"]
+            entry = ask[filled] if is_buy else bid[filled]
+            candidates = [(end - 1, "horizon")]
+            tp_hit = first_touch(closes, close_max, close_min, filled + 1, end, tp, is_buy)
+            sl_hit = first_touch(closes, close_max, close_min, filled + 1, end, sl, not is_buy)
+            if sl_hit is not None:
+                candidates.append((sl_hit, "sl"))
+            if tp_hit is not None:
+                candidates.append((tp_hit, "tp"))
+            if trailing:
+                limit = min(c[0] for c in candidates)
+                trail_hit = trailing_hit(closes, filled, limit, trailing, is_buy)
+                if trail_hit is not None:
+                    candidates.append((trail_hit, "trail"))
+            exit_index, outcome = min(candidates, key=lambda c: (c[0], c[1] != "sl"))
+            exit_price = closes[exit_index]
+            direction = 1.0 if is_buy else -1.0
+            pls.append(direction * (exit_price - entry) * volume * CONTRACT_SIZE / exit_price)
+            exits.append(exit_index)
+            outcomes.append(outcome)
+
+    result = dict(params)
+    pls = np.asarray(pls)
+    if len(pls):
+        equity = np.cumsum(pls[np.argsort(exits, kind="stable")])
+        drawdown = float((np.maximum.accumulate(np.r_[0.0, equity]) - np.r_[0.0, equity]).max())
+    else:
+        drawdown = 0.0
+    outcomes = np.asarray(outcomes)
+    result.update({
+        "net_pl": float(pls.sum()),
+        "max_drawdown": drawdown,
+        "fills": fills,
+        "win_rate": float((pls > 0).mean()) if len(pls) else 0.0,
+        "tp": int((outcomes == "tp").sum()),
+        "sl": int((outcomes == "sl").sum()),
+        "trail": int((outcomes == "trail").sum()),
+        "horizon": int((outcomes == "horizon").sum()),
+    })
+    return result
+
+
+def _evaluate(args):
+    params, cycle, horizon, digits = args
+    return simulate(params, cycle, horizon, digits)
+
+
+def parameter_grid(pips, levels, tp_pips, sl_pips, trailing, volume):
+    keys = ("pips", "levels", "tp_pips", "sl_pips", "trailing", "volume")
+    return [dict(zip(keys, values)) for values in itertools.product(pips, levels, tp_pips, sl_pips, trailing, volume)]
+
+
+# Evaluate every parameter set on a process pool; results ranked by net P/L, then drawdown, then fills
+def sweep(ticks, grid, workers=None, cycle=3600, horizon=86400, digits=3, chunksize=None):
+    workers = workers or os.cpu_count() or 1
+    shm, layout = share_ticks(ticks)
+    try:
+        jobs = [(params, cycle, horizon, digits) for params in grid]
+        if workers == 1:
+            _attach(shm.name, layout)
+            results = [_evaluate(job) for job in jobs]
+        else:
+            chunksize = chunksize or max(1, len(jobs) // (workers * 8))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shm.name, layout)) as pool:
+                results = list(pool.map(_evaluate, jobs, chunksize=chunksize))
+    finally:
+        _data.clear()
+        if _shm[0] is not None:
+            _shm[0].close()
+            _shm[0] = None
+        shm.close()
+        shm.unlink()
+    df = pd.DataFrame(results)
+    return df.sort_values(["net_pl", "max_drawdown", "fills"], ascending=[False, True, False]).reset_index(drop=True)
+
+
+def _floats(text):
+    return [float(v) for v in text.split(",")]
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep gridbot2024 parameters over historical ticks")
+    parser.add_argument("--ticks", help="Tick CSV with time_msc, bid, ask")
+    parser.add_argument("--store", help="Tick store root (see tickstore.py)")
+    parser.add_argument("--symbol", default="USDJPYm")
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic ticks")
+    parser.add_argument("--pips", type=_floats, default=[0.03, 0.05, 0.08])
+    parser.add_argument("--levels", type=_ints, default=[2, 3, 4])
+    parser.add_argument("--tp-pips", type=_floats, default=[3, 4, 6])
+    parser.add_argument("--sl-pips", type=_floats, default=[1, 2, 3])
+    parser.add_argument("--trailing", type=_floats, default=[0.0, 0.1, 0.2])
+    parser.add_argument("--volume", type=_floats, default=[0.05])
+    parser.add_argument("--cycle", type=int, default=3600, help="Seconds between ladder deployments")
+    parser.add_argument("--horizon", type=int, default=86400, help="Seconds a ladder's orders and positions live")
+    parser.add_argument("--digits", type=int, default=3)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", help="Write all ranked results to this CSV file")
+    args = parser.parse_args()
+
+    if args.ticks:
+        ticks = mt5replay.read_ticks(args.ticks)
+    elif args.store:
+        from tickstore import TickStore
+        ticks = TickStore(args.store).read(args.symbol)
+    elif args.synthetic:
+        from bench_replay import synthetic_ticks
+        ticks = synthetic_ticks(args.synthetic)
+    else:
+        parser.error("one of --ticks, --store or --synthetic is required")
+
+    grid = parameter_grid(args.pips, args.levels, args.tp_pips, args.sl_pips, args.trailing, args.volume)
+    start = time.perf_counter()
+    results = sweep(ticks, grid, args.workers, args.cycle, args.horizon, args.digits)
+    elapsed = time.perf_counter() - start
+    print(f"{len(grid)} parameter sets over {len(ticks)} ticks in {elapsed:.1f} s "
+          f"({len(grid) / elapsed:.1f} sets/s, {args.workers or os.cpu_count()} workers)")
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(results.head(args.top).to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
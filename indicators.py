@@ -0,0 +1,263 @@
+## Incremental rolling indicators: every update is O(1) (amortized for min/max) ##
+## Each indicator supports update() for a new bar/tick and replace() to revise the newest value, ##
+## which is how the close of the still-forming bar changes on every tick ##
+
+import math
+from collections import deque
+
+import numpy as np
+
+
+# Fixed-size ring buffer of floats backed by a NumPy array
+class RingBuffer:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = np.zeros(capacity, dtype=np.float64)
+        self.count = 0  # Total number of values ever appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # Append a value, returning the value it pushed out of the window (or None)
+    def append(self, value):
+        index = self.count % self.capacity
+        evicted = self.data[index] if self.count >= self.capacity else None
+        self.data[index] = value
+        self.count += 1
+        return evicted
+
+    # Overwrite the newest value, returning the old one
+    def replace(self, value):
+        index = (self.count - 1) % self.capacity
+        old = self.data[index]
+        self.data[index] = value
+        return old
+
+    @property
+    def newest(self):
+        return self.data[(self.count - 1) % self.capacity]
+
+    # Values oldest to newest (copy)
+    def values(self):
+        if self.count <= self.capacity:
+            return self.data[:self.count].copy()
+        index = self.count % self.capacity
+        return np.concatenate((self.data[index:], self.data[:index]))
+
+
+# Simple moving average from a running sum
+class SMA:
+    def __init__(self, period):
+        self.period = period
+        self.buffer = RingBuffer(period)
+        self.total = 0.0
+
+    @property
+    def ready(self):
+        return self.buffer.count >= self.period
+
+    @property
+    def value(self):
+        n = len(self.buffer)
+        return self.total / n if n else None
+
+    def seed(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def update(self, value):
+        evicted = self.buffer.append(value)
+        self.total += value
+        if evicted is not None:
+            self.total -= evicted
+        return self.value
+
+    def replace(self, value):
+        self.total += value - self.buffer.replace(value)
+        return self.value
+
+
+# Exponential moving average, seeded with the SMA of the first period values like MT5 does
+class EMA:
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.count = 0
+        self.value = None
+        self._previous = None  # EMA before the newest value, needed by replace()
+        self._last = 0.0
+        self._seed_total = 0.0
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    def seed(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def _next(self, previous, value):
+        if self.count < self.period:
+            return (self._seed_total + value) / (self.count + 1)
+        return previous + self.alpha * (value - previous)
+
+    def update(self, value):
+        self._previous = self.value
+        self.value = self._next(self._previous, value)
+        if self.count < self.period:
+            self._seed_total += value
+        self.count += 1
+        self._last = value
+        return self.value
+
+    def replace(self, value):
+        self.count -= 1
+        if self.count < self.period:
+            self._seed_total -= self._last
+        self.value = self._previous
+        return self.update(value)
+
+
+# Rolling standard deviation from running sums of x and x^2, shifted by the first value
+# so prices like 150.xxx do not lose precision to cancellation
+class RollingStd:
+    def __init__(self, period, ddof=0):
+        self.period = period
+        self.ddof = ddof
+        self.buffer = RingBuffer(period)
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    @property
+    def ready(self):
+        return self.buffer.count >= self.period
+
+    @property
+    def value(self):
+        n = len(self.buffer)
+        if n - self.ddof <= 0:
+            return None
+        mean = self.total / n
+        variance = (self.total_sq - n * mean * mean) / (n - self.ddof)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+    def seed(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def update(self, value):
+        if self.shift is None:
+            self.shift = value
+        value -= self.shift
+        evicted = self.buffer.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if evicted is not None:
+            self.total -= evicted
+            self.total_sq -= evicted * evicted
+        return self.value
+
+    def replace(self, value):
+        value -= self.shift
+        old = self.buffer.replace(value)
+        self.total += value - old
+        self.total_sq += value * value - old * old
+        return self.value
+
+
+# Rolling max (or min) with a monotonic deque; the newest value is kept outside the deque
+# so replace() stays O(1) without losing values it would have evicted
+class RollingMax:
+    def __init__(self, period):
+        self.period = period
+        self.window = deque()  # (index, value) of older values, decreasing by value
+        self.count = 0
+        self.newest = None
+
+    def _better(self, a, b):
+        return a >= b
+
+    @property
+    def ready(self):
+        return self.count >= self.period
+
+    @property
+    def value(self):
+        if self.newest is None:
+            return None
+        if not self.window:
+            return self.newest
+        front = self.window[0][1]
+        return front if self._better(front, self.newest) else self.newest
+
+    def seed(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def update(self, value):
+        if self.newest is not None:
+            index = self.count - 1
+            while self.window and self._better(self.newest, self.window[-1][1]):
+                self.window.pop()
+            self.window.append((index, self.newest))
+        self.count += 1
+        self.newest = value
+        # Drop values that fell out of the window
+        while self.window and self.window[0][0] <= self.count - 1 - self.period:
+            self.window.popleft()
+        return self.value
+
+    def replace(self, value):
+        self.newest = value
+        return self.value
+
+
+class RollingMin(RollingMax):
+    def _better(self, a, b):
+        return a <= b
+
+
+# Set of indicators over one symbol/timeframe, fed with ticks or bar closes
+class IndicatorEngine:
+    def __init__(self, timeframe_seconds=60):
+        self.timeframe_seconds = timeframe_seconds
+        self.indicators = {}
+        self.bar_time = None  # Open time of the bar currently forming
+
+    def add(self, name, indicator):
+        self.indicators[name] = indicator
+        return indicator
+
+    def __getitem__(self, name):
+        return self.indicators[name].value
+
+    # Seed all indicators once from a rates array (e.g. mt5.copy_rates_from_pos); the last row is the forming bar
+    def seed_from_rates(self, rates, field="close"):
+        if rates is None or len(rates) == 0:
+            return self
+        closes = rates[field].tolist()
+        for indicator in self.indicators.values():
+            indicator.seed(closes)
+        self.bar_time = int(rates["time"][-1])
+        return self
+
+    # Feed a price at a given time (seconds); a new bar appends, otherwise the forming bar is revised
+    def on_price(self, timestamp, price):
+        bar_time = int(timestamp) - int(timestamp) % self.timeframe_seconds
+        if self.bar_time is None or bar_time > self.bar_time:
+            self.bar_time = bar_time
+            for indicator in self.indicators.values():
+                indicator.update(price)
+        else:
+            for indicator in self.indicators.values():
+                indicator.replace(price)
+        return self
+
+    # Bars are built from bid prices by the terminal
+    def on_tick(self, tick):
+        return self.on_price(tick.time, tick.bid)
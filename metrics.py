@@ -0,0 +1,228 @@
+## Low-overhead hot-path instrumentation ##
+## @timed("stage") records latency into a log-bucketed histogram (p50/p99/max); count() bumps counters. ##
+## Metrics are exported in Prometheus text format to a file and/or an HTTP endpoint, and --profile ##
+## samples the main thread's stack into collapsed stacks (flamegraph.pl / speedscope format). ##
+
+import argparse
+import bisect
+import collections
+import functools
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bucket upper bounds in seconds: 1us to ~100s, 8 buckets per doubling (~9% resolution)
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 8) for i in range(8 * 27)]
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper bound of the bucket holding the q-th quantile
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+
+class Registry:
+    def __init__(self, namespace="bot"):
+        self.namespace = namespace
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self.counters = collections.defaultdict(int)
+        self.enabled = True
+
+    def record(self, stage, seconds):
+        self.histograms[stage].record(seconds)
+
+    def count(self, name, stage, n=1):
+        self.counters[(name, stage)] += n
+
+    def snapshot(self):
+        return {
+            stage: {"count": h.count, "p50": h.quantile(0.5), "p99": h.quantile(0.99), "max": h.max}
+            for stage, h in list(self.histograms.items())
+        }
+
+    def render(self):
+        ns = self.namespace
+        lines = [f"# TYPE {ns}_stage_latency_seconds summary"]
+        for stage, h in sorted(self.histograms.items()):
+            for q in QUANTILES:
+                lines.append(f'{ns}_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {h.quantile(q):.9f}')
+            lines.append(f'{ns}_stage_latency_seconds_sum{{stage="{stage}"}} {h.total:.9f}')
+            lines.append(f'{ns}_stage_latency_seconds_count{{stage="{stage}"}} {h.count}')
+        lines.append(f"# TYPE {ns}_stage_latency_max_seconds gauge")
+        for stage, h in sorted(self.histograms.items()):
+            lines.append(f'{ns}_stage_latency_max_seconds{{stage="{stage}"}} {h.max:.9f}')
+        names = sorted({name for name, _ in self.counters})
+        for name in names:
+            lines.append(f"# TYPE {ns}_{name}_total counter")
+            for (n, stage), value in sorted(self.counters.items()):
+                if n == name:
+                    lines.append(f'{ns}_{name}_total{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Decorator timing every call of a function under the given stage name
+def timed(stage):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def count(name, stage, n=1):
+    registry.count(name, stage, n)
+
+
+# Count a rejected order_send result (None or not TRADE_RETCODE_DONE)
+def count_reject(stage, result, done_code=10009):
+    if result is None or result.retcode != done_code:
+        registry.count("rejects", stage)
+
+
+# Writes the Prometheus text file every interval (atomically) and/or serves it over HTTP
+class MetricsExporter:
+    def __init__(self, path=None, port=None, interval=5.0):
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        if self.path:
+            self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._thread.start()
+        if self.port:
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = registry.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return self
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(registry.render())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self._stop.set()
+        if self.path:
+            self.write()
+        if self._server is not None:
+            self._server.shutdown()
+
+
+# Samples a thread's stack at a fixed interval and counts collapsed stacks
+class SamplingProfiler:
+    def __init__(self, path, interval=0.005, thread_id=None):
+        self.path = path
+        self.interval = interval
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        with open(self.path, "w") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+class Instrumentation:
+    def __init__(self, exporter=None, profiler=None):
+        self.exporter = exporter
+        self.profiler = profiler
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.stop()
+            print(f"Profile written to {self.profiler.path}")
+        if self.exporter is not None:
+            self.exporter.stop()
+
+
+# Parse --metrics-file/--metrics-port/--profile from the command line and start what was asked for
+def start_from_args(namespace, argv=None):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--metrics-file", help="Write Prometheus-style metrics to this file")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus-style metrics on this local port")
+    parser.add_argument("--metrics-interval", type=float, default=5.0)
+    parser.add_argument("--profile", nargs="?", const=f"{namespace}_profile.txt",
+                        help="Sample the main loop and write collapsed stacks to this file")
+    args, _ = parser.parse_known_args(sys.argv[1:] if argv is None else argv)
+
+    registry.namespace = namespace
+    exporter = None
+    if args.metrics_file or args.metrics_port:
+        exporter = MetricsExporter(args.metrics_file, args.metrics_port, args.metrics_interval).start()
+    profiler = SamplingProfiler(args.profile).start() if args.profile else None
+    return Instrumentation(exporter, profiler)
@@ -0,0 +1,711 @@
+## Local stand-in for the MetaTrader5 module that replays recorded ticks ##
+## Usage: import mt5replay; mt5replay.load_ticks("ticks.csv", "USDJPYm"); mt5replay.install() ##
+## After install() any "import MetaTrader5 as mt5" gets this module instead of the terminal ##
+## Pending orders trigger and position SL/TP fire on the replayed ticks (buys on ask, sells on bid) ##
+## Triggers sit in price-sorted heaps per symbol, so matching only looks at the nearest price on each side and ##
+## jumps between trigger events through a per-block max/min index instead of scanning every tick ##
+## disconnect() simulates a lost terminal: calls return None with an IPC error until initialize() succeeds ##
+
+import bisect
+import functools
+import heapq
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Constants mirrored from the MetaTrader5 package
+TIMEFRAME_M1 = 1
+TIMEFRAME_H1 = 16385
+COPY_TICKS_ALL = -1
+TRADE_ACTION_DEAL = 1
+TRADE_ACTION_PENDING = 5
+TRADE_ACTION_SLTP = 6
+TRADE_ACTION_MODIFY = 7
+TRADE_ACTION_REMOVE = 8
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+ORDER_TYPE_BUY_LIMIT = 2
+ORDER_TYPE_SELL_LIMIT = 3
+ORDER_TYPE_BUY_STOP = 4
+ORDER_TYPE_SELL_STOP = 5
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_PRICE = 10015
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_INVALID_STOPS = 10016
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_FROZEN = 10029
+ORDER_STATE_PLACED = 1
+ORDER_STATE_CANCELED = 2
+ORDER_STATE_FILLED = 4
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_REASON_EXPERT = 3
+DEAL_REASON_SL = 4
+DEAL_REASON_TP = 5
+RES_S_OK = 1
+RES_E_INTERNAL_FAIL_TIMEOUT = -10005
+
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"])
+AccountInfo = namedtuple("AccountInfo", ["login", "balance", "equity", "profit", "margin", "margin_free", "leverage", "currency"])
+TradePosition = namedtuple("TradePosition", ["ticket", "time", "time_msc", "type", "magic", "volume", "price_open", "sl", "tp", "price_current", "profit", "symbol", "comment"])
+SymbolInfo = namedtuple("SymbolInfo", ["name", "digits", "point", "trade_tick_size", "trade_contract_size", "trade_stops_level", "trade_freeze_level", "volume_min", "volume_max", "volume_step"])
+TradeDeal = namedtuple("TradeDeal", ["ticket", "order", "time", "time_msc", "type", "entry", "magic", "position_id", "reason", "volume", "price", "commission", "swap", "profit", "fee", "symbol", "comment", "external_id"])
+TradeOrder = namedtuple("TradeOrder", ["ticket", "time_setup", "time_setup_msc", "time_done", "time_done_msc", "type", "state", "magic", "volume_initial", "volume_current", "price_open", "sl", "tp", "price_current", "symbol", "comment"])
+OrderSendResult = namedtuple("OrderSendResult", ["retcode", "deal", "order", "volume", "price", "bid", "ask", "comment", "request_id"])
+
+TICK_DTYPE = np.dtype([
+    ("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+    ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8"),
+])
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("tick_volume", "<u8"), ("spread", "<i4"), ("real_volume", "<u8"),
+])
+
+# Replay state
+_ticks = {}  # symbol -> structured array of recorded ticks
+_symbols = {}  # symbol -> SymbolInfo
+_cursor = {}  # symbol -> index of the current tick
+_clock = {"start_wall": None, "start_msc": None, "speed": None}
+_account = {"login": 0, "balance": 10000.0, "leverage": 100, "currency": "USD", "contract_size": 100000}
+_positions = {}
+_orders = {}  # Pending orders by ticket
+_history_orders = []  # Orders that were filled or cancelled
+_deals = []
+_matched = {}  # symbol -> last tick index checked for order triggers and SL/TP
+_triggers = {}  # symbol -> {(price column, rising): heap of (key, ticket, kind, price)}
+_blocks = {}  # symbol -> {(price column, "max"/"min"): per-block extremes}
+_columns = {}  # symbol -> contiguous copies of time_msc, bid and ask, for searchsorted and matching
+_next_ticket = [1]
+_last_error = [(RES_S_OK, "Success")]
+_initialized = [False]
+_link = {"down": False, "failures": 0}  # Simulated terminal outage, see disconnect()
+
+
+# Terminal calls return None with an IPC error while the simulated connection is down
+def _terminal(function):
+    @functools.wraps(function)
+    def call(*args, **kwargs):
+        if _link["down"]:
+            _last_error[0] = (RES_E_INTERNAL_FAIL_TIMEOUT, "IPC timeout")
+            return None
+        return function(*args, **kwargs)
+    return call
+
+
+# Read ticks from a CSV file or a DataFrame/structured array with time_msc, bid, ask (last, volume optional)
+def read_ticks(source):
+    if isinstance(source, np.ndarray) and source.dtype == TICK_DTYPE:
+        return source
+    df = pd.read_csv(source) if isinstance(source, str) else pd.DataFrame(source)
+    ticks = np.zeros(len(df), dtype=TICK_DTYPE)
+    ticks["time_msc"] = df["time_msc"].to_numpy(dtype=np.int64)
+    ticks["time"] = ticks["time_msc"] // 1000
+    ticks["bid"] = df["bid"].to_numpy(dtype=np.float64)
+    ticks["ask"] = df["ask"].to_numpy(dtype=np.float64)
+    ticks["last"] = df["last"].to_numpy(dtype=np.float64) if "last" in df else (ticks["bid"] + ticks["ask"]) / 2
+    if "volume" in df:
+        ticks["volume"] = df["volume"].to_numpy(dtype=np.uint64)
+        ticks["volume_real"] = ticks["volume"]
+    return ticks
+
+
+# Replay recorded ticks (see read_ticks) for a symbol
+def load_ticks(source, symbol, digits=3, stops_level=0, freeze_level=0):
+    ticks = read_ticks(source)
+    _ticks[symbol] = ticks
+    _cursor[symbol] = 0
+    _matched[symbol] = 0
+    _triggers[symbol] = _empty_triggers()
+    _columns[symbol] = {column: np.ascontiguousarray(ticks[column]) for column in ("time_msc", "bid", "ask")}
+    _blocks[symbol] = {(column, kind): extremes for column in ("bid", "ask")
+                       for kind, extremes in zip(("max", "min"), _block_extremes(_columns[symbol][column]))}
+    point = 10.0 ** -digits
+    _symbols[symbol] = SymbolInfo(symbol, digits, point, point, _account["contract_size"], stops_level, freeze_level,
+                                  0.01, 100.0, 0.01)
+    return len(ticks)
+
+
+# Drive the replay clock: speed=None steps one tick per symbol_info_tick call,
+# otherwise recorded time runs at speed x wall clock time
+def set_speed(speed):
+    _clock["speed"] = speed
+    _clock["start_wall"] = None
+
+
+# Jump every symbol forward to its last tick at or before time_msc; orders and SL/TP trigger on the ticks skipped
+def advance_to(time_msc):
+    for symbol in _ticks:
+        index = int(np.searchsorted(_columns[symbol]["time_msc"], time_msc, side="right")) - 1
+        if index > _cursor[symbol]:
+            _cursor[symbol] = index
+            _match(symbol)
+
+
+# Make "import MetaTrader5" resolve to this module
+def install():
+    sys.modules["MetaTrader5"] = sys.modules[__name__]
+    return sys.modules[__name__]
+
+
+# Reset the simulated account and positions
+def reset(balance=10000.0):
+    _account["balance"] = balance
+    _positions.clear()
+    _orders.clear()
+    _history_orders.clear()
+    _deals.clear()
+    _next_ticket[0] = 1
+    for symbol in _cursor:
+        _cursor[symbol] = 0
+        _matched[symbol] = 0
+        _triggers[symbol] = _empty_triggers()
+    _clock["start_wall"] = None
+
+
+def initialize(*args, **kwargs):
+    if _link["down"] and _link["failures"] > 0:
+        _link["failures"] -= 1
+        _last_error[0] = (RES_E_INTERNAL_FAIL_TIMEOUT, "IPC timeout")
+        return False
+    _link["down"] = False
+    _last_error[0] = (RES_S_OK, "Success")
+    _initialized[0] = True
+    return True
+
+
+def shutdown():
+    _initialized[0] = False
+    return True
+
+
+def last_error():
+    return _last_error[0]
+
+
+# Drop the simulated terminal connection: calls fail until initialize() succeeds, after `failures` refused attempts
+def disconnect(failures=0):
+    _link["down"] = True
+    _link["failures"] = failures
+
+
+def _advance(symbol):
+    ticks = _ticks[symbol]
+    if _clock["speed"] is None:
+        if _cursor[symbol] < len(ticks) - 1:
+            _cursor[symbol] += 1
+        _match(symbol)
+        return _cursor[symbol]
+
+    index = int(np.searchsorted(_columns[symbol]["time_msc"], _now_msc(), side="right")) - 1
+    _cursor[symbol] = max(index, 0)
+    _match(symbol)
+    return _cursor[symbol]
+
+
+# Recorded time reached at a set speed; the paced clock starts at the first recorded tick on first use
+def _now_msc():
+    if _clock["start_wall"] is None:
+        _clock["start_wall"] = time.perf_counter()
+        _clock["start_msc"] = min(int(ticks["time_msc"][0]) for ticks in _ticks.values())
+    return _clock["start_msc"] + (time.perf_counter() - _clock["start_wall"]) * 1000 * _clock["speed"]
+
+
+# Recorded time the replay is at, in epoch seconds (the latest tick replayed when stepping tick by tick)
+def replay_time():
+    if _clock["speed"] is None:
+        return max(int(_ticks[s]["time_msc"][_cursor[s]]) for s in _ticks) / 1000
+    return _now_msc() / 1000
+
+
+# True once every loaded symbol has replayed its last tick
+def finished():
+    return all(_cursor[s] >= len(_ticks[s]) - 1 for s in _ticks)
+
+
+# Number of ticks replayed so far, over all symbols
+def replayed():
+    return sum(_cursor[s] + 1 for s in _ticks)
+
+
+def _current(symbol):
+    return _ticks[symbol][_cursor[symbol]]
+
+
+def _time_msc(date):
+    if isinstance(date, datetime):
+        return int(date.timestamp() * 1000)
+    return int(date * 1000)
+
+
+@_terminal
+def symbol_info(symbol):
+    return _symbols.get(symbol)
+
+
+@_terminal
+def symbol_info_tick(symbol):
+    if symbol not in _ticks:
+        _last_error[0] = (-1, f"Unknown symbol {symbol}")
+        return None
+    row = _ticks[symbol][_advance(symbol)]
+    return Tick(*row.tolist())
+
+
+@_terminal
+def copy_ticks_from(symbol, date_from, count, flags):
+    if symbol not in _ticks:
+        return None
+    _advance(symbol)
+    ticks = _ticks[symbol]
+    from_msc = _time_msc(date_from)
+    end = _cursor[symbol] + 1
+    start = int(np.searchsorted(_columns[symbol]["time_msc"][:end], from_msc, side="left"))
+    return ticks[start:min(end, start + count)]
+
+
+# Build M1 bars from the ticks replayed so far
+@_terminal
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    if symbol not in _ticks:
+        return None
+    ticks = _ticks[symbol][:_cursor[symbol] + 1]
+    seconds = 3600 if timeframe == TIMEFRAME_H1 else 60
+    bar_time = ticks["time"] - ticks["time"] % seconds
+    starts = np.flatnonzero(np.r_[True, bar_time[1:] != bar_time[:-1]])
+    ends = np.r_[starts[1:], len(ticks)]
+    first = max(len(starts) - start_pos - count, 0)
+    last = max(len(starts) - start_pos, 0)
+    rates = np.zeros(last - first, dtype=RATES_DTYPE)
+    bids = ticks["bid"]
+    for i, (s, e) in enumerate(zip(starts[first:last], ends[first:last])):
+        rates[i] = (bar_time[s], bids[s], bids[s:e].max(), bids[s:e].min(), bids[e - 1], e - s, 0, 0)
+    return rates
+
+
+def _profit(position, bid, ask):
+    if position["type"] == ORDER_TYPE_BUY:
+        diff = bid - position["price_open"]
+    else:
+        diff = position["price_open"] - ask
+    # JPY quoted pairs are converted back to the account currency at the current price
+    return diff * position["volume"] * _account["contract_size"] / bid
+
+
+@_terminal
+def account_info():
+    profit = 0.0
+    for position in _positions.values():
+        tick = _current(position["symbol"])
+        profit += _profit(position, tick["bid"], tick["ask"])
+    balance = _account["balance"]
+    return AccountInfo(_account["login"], balance, balance + profit, profit, 0.0, balance + profit,
+                       _account["leverage"], _account["currency"])
+
+
+def _as_position(position):
+    tick = _current(position["symbol"])
+    price_current = tick["bid"] if position["type"] == ORDER_TYPE_BUY else tick["ask"]
+    return TradePosition(position["ticket"], position["time"], position["time_msc"], position["type"], position["magic"],
+                         position["volume"], position["price_open"], position["sl"], position["tp"], price_current,
+                         _profit(position, tick["bid"], tick["ask"]), position["symbol"], position["comment"])
+
+
+@_terminal
+def positions_get(symbol=None, ticket=None):
+    positions = [_as_position(p) for p in _positions.values()
+                 if (symbol is None or p["symbol"] == symbol) and (ticket is None or p["ticket"] == ticket)]
+    return tuple(positions)
+
+
+def _as_order(order, state=ORDER_STATE_PLACED, done=None):
+    tick = _current(order["symbol"])
+    buy = order["type"] in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP)
+    time_done, time_done_msc = (int(done["time"]), int(done["time_msc"])) if done is not None else (0, 0)
+    return TradeOrder(order["ticket"], order["time"], order["time_msc"], time_done, time_done_msc, order["type"], state,
+                      order["magic"], order["volume"], order["volume"], order["price_open"], order["sl"], order["tp"],
+                      float(tick["ask"] if buy else tick["bid"]), order["symbol"], order["comment"])
+
+
+@_terminal
+def orders_get(symbol=None, ticket=None, group=None):
+    orders = [_as_order(o) for o in _orders.values()
+              if (symbol is None or o["symbol"] == symbol) and (ticket is None or o["ticket"] == ticket)]
+    return tuple(orders)
+
+
+@_terminal
+# Deals and finished orders are appended in time order, so a time range is two bisections;
+# like the real call, history_deals_get(position=...) or (ticket=...) alone searches the whole history
+def history_deals_get(date_from=None, date_to=None, group=None, position=None, ticket=None):
+    deals = _deals
+    if date_from is not None:
+        from_msc, to_msc = _time_msc(date_from), _time_msc(date_to)
+        deals = deals[bisect.bisect_left(deals, from_msc, key=_deal_time):bisect.bisect_right(deals, to_msc, key=_deal_time)]
+    return tuple(d for d in deals if (position is None or d.position_id == position) and
+                 (ticket is None or d.ticket == ticket))
+
+
+@_terminal
+def history_deals_total(date_from, date_to):
+    from_msc, to_msc = _time_msc(date_from), _time_msc(date_to)
+    return bisect.bisect_right(_deals, to_msc, key=_deal_time) - bisect.bisect_left(_deals, from_msc, key=_deal_time)
+
+
+@_terminal
+def history_orders_get(date_from, date_to, group=None, position=None):
+    from_msc, to_msc = _time_msc(date_from), _time_msc(date_to)
+    return tuple(_history_orders[bisect.bisect_left(_history_orders, from_msc, key=_order_done_time):
+                                 bisect.bisect_right(_history_orders, to_msc, key=_order_done_time)])
+
+
+def _deal_time(deal):
+    return deal.time_msc
+
+
+def _order_done_time(order):
+    return order.time_done_msc
+
+
+def _new_ticket():
+    ticket = _next_ticket[0]
+    _next_ticket[0] += 1
+    return ticket
+
+
+def _add_deal(ticket, order, tick, order_type, entry, position, price, profit, reason=DEAL_REASON_EXPERT):
+    deal = TradeDeal(ticket, order, int(tick["time"]), int(tick["time_msc"]), order_type, entry, position["magic"],
+                     position["ticket"], reason, position["volume"], price, 0.0, 0.0, profit, 0.0, position["symbol"],
+                     position["comment"], "")
+    bisect.insort(_deals, deal, key=_deal_time)  # Symbols are matched one after another, so keep time order
+
+
+def _result(retcode, request, price=0.0, deal=0, order=0, comment="Request executed"):
+    tick = _current(request["symbol"]) if request.get("symbol") in _ticks else None
+    bid = float(tick["bid"]) if tick is not None else 0.0
+    ask = float(tick["ask"]) if tick is not None else 0.0
+    return OrderSendResult(retcode, deal, order, request.get("volume", 0.0), price, bid, ask, comment, 0)
+
+
+def _open_position(ticket, symbol, order_type, volume, price, sl, tp, magic, comment, tick, order=None):
+    _positions[ticket] = {
+        "ticket": ticket, "time": int(tick["time"]), "time_msc": int(tick["time_msc"]), "type": order_type,
+        "magic": magic, "volume": volume, "price_open": price, "sl": sl, "tp": tp, "symbol": symbol,
+        "comment": comment,
+    }
+    _push_stops(_positions[ticket])
+    _add_deal(_new_ticket(), order or ticket, tick, order_type, DEAL_ENTRY_IN, _positions[ticket], price, 0.0)
+
+
+def _close_position(position, tick, reason=DEAL_REASON_EXPERT):
+    is_buy = position["type"] == ORDER_TYPE_BUY
+    price = float(tick["bid"] if is_buy else tick["ask"])
+    profit = _profit(position, tick["bid"], tick["ask"])
+    _account["balance"] += profit
+    ticket = _new_ticket()
+    _positions.pop(position["ticket"], None)
+    _add_deal(ticket, ticket, tick, ORDER_TYPE_SELL if is_buy else ORDER_TYPE_BUY, DEAL_ENTRY_OUT, position,
+              price, profit, reason)
+    return ticket, price
+
+
+@_terminal
+def order_send(request):
+    action = request.get("action")
+    if action == TRADE_ACTION_DEAL:
+        return _send_deal(request)
+    if action == TRADE_ACTION_PENDING:
+        return _send_pending(request)
+    if action == TRADE_ACTION_SLTP:
+        return _send_sltp(request)
+    if action == TRADE_ACTION_MODIFY:
+        return _send_modify(request)
+    if action == TRADE_ACTION_REMOVE:
+        return _send_remove(request)
+    return _result(TRADE_RETCODE_INVALID, request, comment="Unsupported trade action")
+
+
+def _check_volume(info, volume):
+    steps = volume / info.volume_step
+    return info.volume_min <= volume <= info.volume_max and abs(steps - round(steps)) < 1e-7
+
+
+# Stops must sit on the right side of the price, at least the stops level away
+def _check_stops(info, is_buy, price, sl, tp):
+    gap = info.trade_stops_level * info.point
+    if is_buy:
+        return (not sl or sl <= price - gap) and (not tp or tp >= price + gap)
+    return (not sl or sl >= price + gap) and (not tp or tp <= price - gap)
+
+
+def _send_deal(request):
+    symbol = request.get("symbol")
+    if symbol not in _ticks:
+        return _result(TRADE_RETCODE_INVALID, request, comment="Invalid symbol")
+    tick = _current(symbol)
+    order_type = request["type"]
+    price = float(tick["ask"] if order_type == ORDER_TYPE_BUY else tick["bid"])
+
+    # Closing an existing position
+    if "position" in request:
+        position = _positions.get(request["position"])
+        if position is None:
+            return _result(TRADE_RETCODE_INVALID, request, comment="Position not found")
+        ticket, price = _close_position(position, tick)
+        return _result(TRADE_RETCODE_DONE, request, price, deal=ticket, order=ticket)
+
+    info = _symbols[symbol]
+    if not _check_volume(info, request["volume"]):
+        return _result(TRADE_RETCODE_INVALID_VOLUME, request, comment="Invalid volume")
+    sl, tp = request.get("sl", 0.0), request.get("tp", 0.0)
+    if not _check_stops(info, order_type == ORDER_TYPE_BUY, price, sl, tp):
+        return _result(TRADE_RETCODE_INVALID_STOPS, request, comment="Invalid stops")
+    ticket = _new_ticket()
+    _open_position(ticket, symbol, order_type, request["volume"], price, sl, tp, request.get("magic", 0),
+                   request.get("comment", ""), tick)
+    return _result(TRADE_RETCODE_DONE, request, price, deal=_next_ticket[0] - 1, order=ticket)
+
+
+# Whether a pending order of this type may sit at price (outside the stops level, on the right side of the market)
+def _valid_pending(info, tick, order_type, price):
+    gap = info.trade_stops_level * info.point
+    return {
+        ORDER_TYPE_BUY_LIMIT: price <= tick["ask"] - gap,
+        ORDER_TYPE_SELL_LIMIT: price >= tick["bid"] + gap,
+        ORDER_TYPE_BUY_STOP: price >= tick["ask"] + gap,
+        ORDER_TYPE_SELL_STOP: price <= tick["bid"] - gap,
+    }.get(order_type, False)
+
+
+def _send_pending(request):
+    symbol = request.get("symbol")
+    if symbol not in _ticks:
+        return _result(TRADE_RETCODE_INVALID, request, comment="Invalid symbol")
+    info = _symbols[symbol]
+    tick = _current(symbol)
+    order_type, price = request["type"], request["price"]
+    if not _valid_pending(info, tick, order_type, price):
+        return _result(TRADE_RETCODE_INVALID_PRICE, request, comment="Invalid price")
+    if not _check_volume(info, request["volume"]):
+        return _result(TRADE_RETCODE_INVALID_VOLUME, request, comment="Invalid volume")
+    sl, tp = request.get("sl", 0.0), request.get("tp", 0.0)
+    if not _check_stops(info, order_type in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP), price, sl, tp):
+        return _result(TRADE_RETCODE_INVALID_STOPS, request, comment="Invalid stops")
+
+    ticket = _new_ticket()
+    _orders[ticket] = {
+        "ticket": ticket, "time": int(tick["time"]), "time_msc": int(tick["time_msc"]), "type": order_type,
+        "magic": request.get("magic", 0), "volume": request["volume"], "price_open": price, "sl": sl, "tp": tp,
+        "symbol": symbol, "comment": request.get("comment", ""),
+    }
+    _push_order(_orders[ticket])
+    return _result(TRADE_RETCODE_DONE, request, price, order=ticket)
+
+
+def _send_sltp(request):
+    position = _positions.get(request.get("position"))
+    if position is None:
+        return _result(TRADE_RETCODE_INVALID, request, comment="Position not found")
+    tick = _current(position["symbol"])
+    is_buy = position["type"] == ORDER_TYPE_BUY
+    sl, tp = request.get("sl", 0.0), request.get("tp", 0.0)
+    if not _check_stops(_symbols[position["symbol"]], is_buy, tick["bid"] if is_buy else tick["ask"], sl, tp):
+        return _result(TRADE_RETCODE_INVALID_STOPS, request, comment="Invalid stops")
+    position["sl"], position["tp"] = sl, tp
+    _push_stops(position)
+    return _result(TRADE_RETCODE_DONE, request, order=position["ticket"])
+
+
+# Move a pending order's price, SL and TP (not allowed within the freeze level of the market)
+def _send_modify(request):
+    order = _orders.get(request.get("order"))
+    if order is None:
+        return _result(TRADE_RETCODE_INVALID, request, comment="Order not found")
+    info = _symbols[order["symbol"]]
+    tick = _current(order["symbol"])
+    is_buy = order["type"] in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP)
+    market = tick["ask"] if is_buy else tick["bid"]
+    if info.trade_freeze_level and abs(order["price_open"] - market) <= info.trade_freeze_level * info.point:
+        return _result(TRADE_RETCODE_FROZEN, request, comment="Frozen")
+    price = request.get("price", order["price_open"])
+    if not _valid_pending(info, tick, order["type"], price):
+        return _result(TRADE_RETCODE_INVALID_PRICE, request, comment="Invalid price")
+    sl, tp = request.get("sl", 0.0), request.get("tp", 0.0)
+    if not _check_stops(info, is_buy, price, sl, tp):
+        return _result(TRADE_RETCODE_INVALID_STOPS, request, comment="Invalid stops")
+    order["price_open"], order["sl"], order["tp"] = price, sl, tp
+    _push_order(order)  # The old trigger is skipped as stale: its price no longer matches
+    return _result(TRADE_RETCODE_DONE, request, price, order=order["ticket"])
+
+
+def _send_remove(request):
+    order = _orders.pop(request.get("order"), None)
+    if order is None:
+        return _result(TRADE_RETCODE_INVALID, request, comment="Order not found")
+    bisect.insort(_history_orders, _as_order(order, ORDER_STATE_CANCELED, _current(order["symbol"])),
+                  key=_order_done_time)
+    return _result(TRADE_RETCODE_DONE, request, order=order["ticket"])
+
+
+# Price column and direction that trigger each pending order type (buys fill on the ask, sells on the bid)
+_ORDER_TRIGGERS = {
+    ORDER_TYPE_BUY_LIMIT: ("ask", False),
+    ORDER_TYPE_SELL_LIMIT: ("bid", True),
+    ORDER_TYPE_BUY_STOP: ("ask", True),
+    ORDER_TYPE_SELL_STOP: ("bid", False),
+}
+BLOCK = 1024  # Ticks per block in the max/min index
+
+
+def _empty_triggers():
+    return {(column, rising): [] for column in ("bid", "ask") for rising in (True, False)}
+
+
+def _block_extremes(values):
+    n = len(values)
+    padded = np.full(max(-(-n // BLOCK), 1) * BLOCK, np.nan)
+    padded[:n] = values
+    blocks = padded.reshape(-1, BLOCK)
+    with np.errstate(invalid="ignore"):
+        return np.fmax.reduce(blocks, axis=1), np.fmin.reduce(blocks, axis=1)
+
+
+# Whether a heap entry still describes a live order or stop (orders are removed and stops moved lazily)
+def _live(ticket, kind, price):
+    if kind == "order":
+        order = _orders.get(ticket)
+        return order is not None and order["price_open"] == price
+    position = _positions.get(ticket)
+    return position is not None and position[kind] == price
+
+
+# Rising triggers are a min-heap on price, falling ones a max-heap, so the nearest is always at the front
+def _push(symbol, column, rising, ticket, kind, price):
+    heap = _triggers[symbol][column, rising]
+    heapq.heappush(heap, (price if rising else -price, ticket, kind, price))
+    if len(heap) > 64 and len(heap) > 4 * (len(_orders) + 2 * len(_positions)):
+        heap[:] = [entry for entry in heap if _live(*entry[1:])]  # Drop stops left behind by SL/TP changes
+        heapq.heapify(heap)
+
+
+def _push_order(order):
+    column, rising = _ORDER_TRIGGERS[order["type"]]
+    _push(order["symbol"], column, rising, order["ticket"], "order", order["price_open"])
+
+
+# Buy positions close on the bid (SL below, TP above), sell positions on the ask
+def _push_stops(position):
+    is_buy = position["type"] == ORDER_TYPE_BUY
+    column = "bid" if is_buy else "ask"
+    if position["sl"]:
+        _push(position["symbol"], column, not is_buy, position["ticket"], "sl", position["sl"])
+    if position["tp"]:
+        _push(position["symbol"], column, is_buy, position["ticket"], "tp", position["tp"])
+
+
+# Nearest live trigger price per (column, direction) as (ask up, ask down, bid up, bid down), or None if there are none
+def _levels(symbol):
+    levels = []
+    for key in (("ask", True), ("ask", False), ("bid", True), ("bid", False)):
+        heap = _triggers[symbol][key]
+        while heap and not _live(*heap[0][1:]):
+            heapq.heappop(heap)
+        levels.append(heap[0][3] if heap else (np.inf if key[1] else -np.inf))
+    if levels == [np.inf, -np.inf, np.inf, -np.inf]:
+        return None
+    return levels
+
+
+# First tick index in [lo, hi) that reaches any of the levels, skipping blocks whose max/min cannot
+def _next_touch(symbol, lo, hi, levels):
+    ask_up, ask_down, bid_up, bid_down = levels
+    bid, ask = _columns[symbol]["bid"], _columns[symbol]["ask"]
+    if hi - lo <= 8:
+        for i in range(lo, hi):
+            b, a = bid[i], ask[i]
+            if a >= ask_up or a <= ask_down or b >= bid_up or b <= bid_down:
+                return i
+        return None
+
+    def first(start, stop):
+        a, b = ask[start:stop], bid[start:stop]
+        found = np.flatnonzero((a >= ask_up) | (a <= ask_down) | (b >= bid_up) | (b <= bid_down))
+        return start + int(found[0]) if len(found) else None
+
+    edge = min(-(-lo // BLOCK) * BLOCK, hi)
+    index = first(lo, edge)
+    if index is not None or edge >= hi:
+        return index
+    blocks = _blocks[symbol]
+    block, last, step = edge // BLOCK, -(-hi // BLOCK), 16
+    while block < last:
+        stop = min(block + step, last)
+        candidates = np.flatnonzero((blocks["ask", "max"][block:stop] >= ask_up) |
+                                    (blocks["ask", "min"][block:stop] <= ask_down) |
+                                    (blocks["bid", "max"][block:stop] >= bid_up) |
+                                    (blocks["bid", "min"][block:stop] <= bid_down))
+        for candidate in candidates:  # Only a block cut off at hi can be a false candidate
+            start = (block + int(candidate)) * BLOCK
+            index = first(start, min(start + BLOCK, hi))
+            if index is not None:
+                return index
+        block, step = stop, step * 4
+    return None
+
+
+# Fill the orders and close the positions this tick triggers: orders first, then SL before TP, each by ticket
+def _trigger(symbol, tick):
+    hits = []
+    for (column, rising), heap in _triggers[symbol].items():
+        price_now = tick[column]
+        while heap:
+            entry = heap[0]
+            if not _live(*entry[1:]):
+                heapq.heappop(heap)
+            elif price_now >= entry[3] if rising else price_now <= entry[3]:
+                hits.append(heapq.heappop(heap)[1:])
+            else:
+                break
+    for ticket, kind, price in sorted(hits, key=lambda hit: (hit[1] != "order", hit[0], hit[1])):
+        if kind == "order":
+            _fill_order(_orders[ticket], tick)
+        elif _live(ticket, kind, price):  # Not closed by its other stop on this tick
+            _close_position(_positions[ticket], tick, DEAL_REASON_SL if kind == "sl" else DEAL_REASON_TP)
+
+
+# Trigger pending orders and SL/TP on every tick replayed since the last check, in time order;
+# stops of positions opened on a tick are checked from the next tick on
+def _match(symbol):
+    end = _cursor[symbol]
+    start = _matched[symbol] + 1
+    if start > end:
+        return
+    _matched[symbol] = end
+    ticks = _ticks[symbol]
+    while start <= end:
+        levels = _levels(symbol)
+        if levels is None:
+            return
+        index = _next_touch(symbol, start, end + 1, levels)
+        if index is None:
+            return
+        _trigger(symbol, ticks[index])
+        start = index + 1
+
+
+def _fill_order(order, tick):
+    del _orders[order["ticket"]]
+    bisect.insort(_history_orders, _as_order(order, ORDER_STATE_FILLED, tick), key=_order_done_time)
+    is_buy = order["type"] in (ORDER_TYPE_BUY_LIMIT, ORDER_TYPE_BUY_STOP)
+    price = float(tick["ask"] if is_buy else tick["bid"])
+    _open_position(order["ticket"], order["symbol"], ORDER_TYPE_BUY if is_buy else ORDER_TYPE_SELL, order["volume"],
+                   price, order["sl"], order["tp"], order["magic"], order["comment"], tick, order["ticket"])
@@ -0,0 +1,255 @@
+## Local order and position book, kept in sync from deltas ##
+## One full load at start-up; afterwards only new deals (history_deals_get) and orders that left the ##
+## active set (history_orders_get) are applied, plus the results of our own order_send calls ##
+
+import threading
+from datetime import datetime, timedelta, timezone
+
+BUY = "buy"
+SELL = "sell"
+
+# Deal entry and type codes from the MetaTrader5 package
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_INOUT = 2
+DEAL_ENTRY_OUT_BY = 3
+
+INDEXED_FIELDS = ("symbol", "magic", "side")
+
+
+# Minimal record with the attributes the bots read from terminal positions/orders
+class BookEntry:
+    __slots__ = ("ticket", "symbol", "type", "side", "volume", "price", "sl", "tp", "magic", "time_msc")
+
+    def __init__(self, ticket, symbol, type, side, volume, price, sl, tp, magic, time_msc=0):
+        self.ticket = ticket
+        self.symbol = symbol
+        self.type = type
+        self.side = side
+        self.volume = volume
+        self.price = price
+        self.sl = sl
+        self.tp = tp
+        self.magic = magic
+        self.time_msc = time_msc
+
+    # Terminal positions and orders both call it price_open
+    @property
+    def price_open(self):
+        return self.price
+
+    def __repr__(self):
+        return f"BookEntry({self.ticket}, {self.symbol}, {self.side}, {self.volume}@{self.price})"
+
+
+# Entries by ticket plus set indexes by symbol, magic and side
+class _Table:
+    def __init__(self):
+        self.by_ticket = {}
+        self.index = {field: {} for field in INDEXED_FIELDS}
+        self.symbol_magic_counts = {}  # (symbol, magic) -> count, for O(1) "anything left?" checks
+
+    def __len__(self):
+        return len(self.by_ticket)
+
+    def add(self, entry):
+        self.remove(entry.ticket)
+        self.by_ticket[entry.ticket] = entry
+        for field in INDEXED_FIELDS:
+            self.index[field].setdefault(getattr(entry, field), set()).add(entry.ticket)
+        key = (entry.symbol, entry.magic)
+        self.symbol_magic_counts[key] = self.symbol_magic_counts.get(key, 0) + 1
+
+    def remove(self, ticket):
+        entry = self.by_ticket.pop(ticket, None)
+        if entry is None:
+            return None
+        for field in INDEXED_FIELDS:
+            tickets = self.index[field].get(getattr(entry, field))
+            if tickets is not None:
+                tickets.discard(ticket)
+                if not tickets:
+                    del self.index[field][getattr(entry, field)]
+        key = (entry.symbol, entry.magic)
+        self.symbol_magic_counts[key] -= 1
+        if not self.symbol_magic_counts[key]:
+            del self.symbol_magic_counts[key]
+        return entry
+
+    def tickets(self, symbol=None, magic=None, side=None):
+        filters = [(f, v) for f, v in zip(INDEXED_FIELDS, (symbol, magic, side)) if v is not None]
+        if not filters:
+            return set(self.by_ticket)
+        sets = sorted((self.index[f].get(v, set()) for f, v in filters), key=len)
+        return set.intersection(*sets) if len(sets) > 1 else set(sets[0])
+
+    def count(self, symbol=None, magic=None, side=None):
+        if symbol is not None and magic is not None and side is None:
+            return self.symbol_magic_counts.get((symbol, magic), 0)
+        filters = [(f, v) for f, v in zip(INDEXED_FIELDS, (symbol, magic, side)) if v is not None]
+        if len(filters) == 1:
+            f, v = filters[0]
+            return len(self.index[f].get(v, ()))
+        return len(self.tickets(symbol, magic, side))
+
+    def select(self, symbol=None, magic=None, side=None):
+        return [self.by_ticket[t] for t in self.tickets(symbol, magic, side)]
+
+
+class OrderBook:
+    def __init__(self, mt5):
+        self.mt5 = mt5
+        self.positions = _Table()
+        self.orders = _Table()
+        self.last_deal_ticket = 0
+        self.last_sync_time = None  # Server time (seconds) of the newest deal seen
+        self.deals_applied = 0
+        self.syncs = 0
+        self._pending_fills = {}  # Orders filled during the current sync, for the SL/TP of the new position
+        self._sent_deals = {}  # Our own market orders by order ticket, until their deal arrives
+        self._lock = threading.Lock()
+
+    def _side(self, order_type):
+        buy_types = (self.mt5.ORDER_TYPE_BUY, self.mt5.ORDER_TYPE_BUY_LIMIT, self.mt5.ORDER_TYPE_BUY_STOP)
+        return BUY if order_type in buy_types else SELL
+
+    def _from_terminal(self, item, is_order):
+        price = item.price_open
+        return BookEntry(item.ticket, item.symbol, item.type, self._side(item.type),
+                         item.volume_current if is_order else item.volume, price, item.sl, item.tp, item.magic,
+                         getattr(item, "time_setup_msc" if is_order else "time_msc", 0))
+
+    # Server time runs ahead of UTC on most brokers, so look well past now
+    def _date_to(self):
+        return datetime.now(timezone.utc) + timedelta(days=2)
+
+    # Load everything once from the terminal
+    def full_sync(self):
+        with self._lock:
+            self._full_sync()
+
+    def _full_sync(self):
+        self.positions = _Table()
+        self.orders = _Table()
+        for position in self.mt5.positions_get() or ():
+            self.positions.add(self._from_terminal(position, False))
+        for order in self.mt5.orders_get() or ():
+            self.orders.add(self._from_terminal(order, True))
+
+        # Remember where history ends so later syncs only read what is new
+        deals = self.mt5.history_deals_get(datetime.fromtimestamp(0, tz=timezone.utc), self._date_to()) or ()
+        self.last_deal_ticket = max((d.ticket for d in deals), default=0)
+        self.last_sync_time = max((d.time for d in deals), default=0)
+        self.syncs += 1
+
+    # Apply only what changed since the last sync
+    def sync(self):
+        with self._lock:
+            if self.last_sync_time is None:
+                self._full_sync()
+            else:
+                self._sync()
+
+    def _sync(self):
+        date_from = datetime.fromtimestamp(max(self.last_sync_time - 1, 0), tz=timezone.utc)
+        date_to = self._date_to()
+
+        # Orders that left the active set (filled, cancelled, expired)
+        for order in self.mt5.history_orders_get(date_from, date_to) or ():
+            filled = self.orders.remove(order.ticket)
+            if filled is not None:
+                self._pending_fills[order.ticket] = filled
+
+        for deal in self.mt5.history_deals_get(date_from, date_to) or ():
+            if deal.ticket <= self.last_deal_ticket:
+                continue
+            self._apply_deal(deal)
+            self.last_deal_ticket = deal.ticket
+            self.last_sync_time = max(self.last_sync_time, deal.time)
+        self._pending_fills.clear()
+        self.syncs += 1
+
+    def _apply_deal(self, deal):
+        self.deals_applied += 1
+        position = self.positions.by_ticket.get(deal.position_id)
+        if deal.entry == DEAL_ENTRY_IN:
+            if position is None:
+                # SL/TP come from the order that opened it, when we know it
+                order = self._pending_fills.get(deal.order) or self._sent_deals.pop(deal.order, None)
+                order_type = self.mt5.ORDER_TYPE_BUY if deal.type == DEAL_TYPE_BUY else self.mt5.ORDER_TYPE_SELL
+                self.positions.add(BookEntry(deal.position_id, deal.symbol, order_type, self._side(order_type),
+                                             deal.volume, deal.price, order.sl if order else 0.0,
+                                             order.tp if order else 0.0, deal.magic, deal.time_msc))
+            else:
+                position.price = (position.price * position.volume + deal.price * deal.volume) / (position.volume + deal.volume)
+                position.volume = round(position.volume + deal.volume, 8)
+        elif position is not None:
+            # OUT, INOUT and OUT_BY all reduce (or reverse) the position
+            remaining = round(position.volume - deal.volume, 8)
+            if remaining > 0:
+                position.volume = remaining
+            else:
+                self.positions.remove(position.ticket)
+                if remaining < 0 and deal.entry == DEAL_ENTRY_INOUT:
+                    order_type = self.mt5.ORDER_TYPE_BUY if deal.type == DEAL_TYPE_BUY else self.mt5.ORDER_TYPE_SELL
+                    self.positions.add(BookEntry(deal.position_id, deal.symbol, order_type, self._side(order_type),
+                                                 -remaining, deal.price, 0.0, 0.0, deal.magic, deal.time_msc))
+
+    # Record the outcome of our own order_send without asking the terminal
+    def record(self, request, result):
+        if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+            return
+        with self._lock:
+            self._record(request, result)
+
+    def _record(self, request, result):
+        action = request.get("action")
+        if action == self.mt5.TRADE_ACTION_PENDING:
+            self.orders.add(BookEntry(result.order, request["symbol"], request["type"], self._side(request["type"]),
+                                      request["volume"], request["price"], request.get("sl", 0.0),
+                                      request.get("tp", 0.0), request.get("magic", 0)))
+        elif action == self.mt5.TRADE_ACTION_SLTP:
+            position = self.positions.by_ticket.get(request["position"])
+            if position is not None:
+                position.sl = request["sl"]
+                position.tp = request["tp"]
+        elif action == self.mt5.TRADE_ACTION_MODIFY:
+            order = self.orders.by_ticket.get(request["order"])
+            if order is not None:
+                order.price = request["price"]
+                order.sl = request.get("sl", 0.0)
+                order.tp = request.get("tp", 0.0)
+        elif action == self.mt5.TRADE_ACTION_REMOVE:
+            self.orders.remove(request["order"])
+        elif action == self.mt5.TRADE_ACTION_DEAL and "position" not in request:
+            # The position itself shows up through history_deals_get on the next sync; keep its SL/TP until then
+            self._sent_deals[result.order] = BookEntry(result.order, request["symbol"], request["type"],
+                                                       self._side(request["type"]), request["volume"],
+                                                       request.get("price", 0.0), request.get("sl", 0.0),
+                                                       request.get("tp", 0.0), request.get("magic", 0))
+
+    # ---- indexed queries ----
+
+    def position(self, ticket):
+        return self.positions.by_ticket.get(ticket)
+
+    def order(self, ticket):
+        return self.orders.by_ticket.get(ticket)
+
+    def positions_for(self, symbol=None, magic=None, side=None):
+        return self.positions.select(symbol, magic, side)
+
+    def orders_for(self, symbol=None, magic=None, side=None):
+        return self.orders.select(symbol, magic, side)
+
+    def count_orders(self, symbol=None, magic=None, side=None):
+        return self.orders.count(symbol, magic, side)
+
+    def count_positions(self, symbol=None, magic=None, side=None):
+        return self.positions.count(symbol, magic, side)
+
+    # True when no pending orders are left for the symbol (and magic number)
+    def all_orders_filled(self, symbol, magic=None):
+        return self.orders.count(symbol, magic) == 0
@@ -0,0 +1,146 @@
+## Monte Carlo of saharabot2024's position sizing: calculate_risk's 5% risk with the [4, 2, 2, 2] reward cycle ##
+## Run: python riskmc.py --log "~/Desktop/trade_log_*.csv" | --bars bars.csv | --synthetic-bars 525600 | --p 0.35 ##
+##      [--paths 1000000] [--trades 100] [--balance 10000] [--ruin 0.5] [--posterior] [--workers 8] [--seed 1] ##
+## Every path is a day of up to max_trades_per_day trades that each win the reward or lose the risk, sized by ##
+## calculate_risk itself on the running balance; paths are NumPy arrays advanced one trade at a time, split ##
+## into chunks over a process pool with independent seeded streams (SeedSequence.spawn), so runs reproduce ##
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# The sizing functions do not need a terminal; use the replay stand-in where MetaTrader5 is not installed
+try:
+    import MetaTrader5  # noqa: F401
+except ImportError:
+    import mt5replay
+    mt5replay.install()
+
+from saharabot2024 import calculate_risk, max_trades_per_day
+
+DRAWDOWN_QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+BALANCE_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+# Wins and losses among closed trades in trade log files (CSV or Parquet; rows with P/L 0 are failed orders)
+def outcomes_from_logs(patterns):
+    paths = sorted({path for pattern in patterns for path in glob.glob(os.path.expanduser(pattern))})
+    if not paths:
+        raise FileNotFoundError(f"No trade log matches {patterns}")
+    pl = pd.concat([(pd.read_parquet(p) if p.endswith(".parquet") else pd.read_csv(p))["P/L"] for p in paths])
+    pl = pd.to_numeric(pl, errors="coerce").dropna()
+    return int((pl > 0).sum()), int((pl < 0).sum())
+
+
+# Wins and losses of the vectorized saharabot backtest over M1 bars
+def outcomes_from_backtest(bars):
+    from backtest import run_backtest
+    pl = run_backtest(bars)["P/L"].to_numpy()
+    return int((pl > 0).sum()), int((pl < 0).sum())
+
+
+# Simulate one chunk of paths; returns terminal balance, max drawdown (fraction of the peak) and ruin flags
+def _simulate(job):
+    seed, paths, trades, p, start_balance, ruin_balance = job
+    rng = np.random.default_rng(seed)
+    # A single p, or one per path drawn from its Beta posterior (wins, losses) when the estimate is uncertain
+    p = rng.beta(p[0] + 1, p[1] + 1, paths) if isinstance(p, tuple) else p
+    balance = np.full(paths, start_balance)
+    peak = balance.copy()
+    max_drawdown = np.zeros(paths)
+    ruined = np.zeros(paths, dtype=bool)
+    for trade_num in range(1, trades + 1):
+        risk, reward = calculate_risk(balance, trade_num)
+        balance += np.where(rng.random(paths) < p, reward, -risk)
+        np.maximum(peak, balance, out=peak)
+        np.maximum(max_drawdown, 1.0 - balance / peak, out=max_drawdown)
+        ruined |= balance <= ruin_balance
+    return balance, max_drawdown, ruined
+
+
+# Run `paths` paths in chunks over a process pool; p is a win probability or (wins, losses) for the posterior
+def monte_carlo(p, paths=1_000_000, trades=max_trades_per_day, start_balance=10000.0, ruin=0.5, workers=None,
+                seed=1, chunk=250_000):
+    workers = workers or os.cpu_count() or 1
+    sizes = [min(chunk, paths - start) for start in range(0, paths, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(s, n, trades, p, start_balance, ruin * start_balance) for s, n in zip(seeds, sizes)]
+    if workers == 1 or len(jobs) == 1:
+        results = [_simulate(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_simulate, jobs))
+    balance, max_drawdown, ruined = (np.concatenate(parts) for parts in zip(*results))
+    return balance, max_drawdown, ruined
+
+
+def summarize(balance, max_drawdown, ruined, start_balance):
+    summary = {
+        "paths": len(balance),
+        "ruin_probability": float(ruined.mean()),
+        "loss_probability": float((balance < start_balance).mean()),
+        "mean_balance": float(balance.mean()),
+    }
+    for q, value in zip(DRAWDOWN_QUANTILES, np.quantile(max_drawdown, DRAWDOWN_QUANTILES)):
+        summary[f"drawdown_p{q * 100:g}"] = float(value)
+    for q, value in zip(BALANCE_QUANTILES, np.quantile(balance, BALANCE_QUANTILES)):
+        summary[f"balance_p{q * 100:g}"] = float(value)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo of the calculate_risk position-sizing schedule")
+    parser.add_argument("--log", nargs="+", help="Trade log files or glob patterns to estimate the win rate from")
+    parser.add_argument("--bars", help="Estimate the win rate from a backtest over this M1 bars file")
+    parser.add_argument("--synthetic-bars", type=int, help="Estimate it from a backtest over synthetic bars")
+    parser.add_argument("--p", type=float, help="Win probability to use as is")
+    parser.add_argument("--posterior", action="store_true",
+                        help="Draw each path's win probability from the Beta posterior of the observed trades")
+    parser.add_argument("--paths", type=int, default=1_000_000)
+    parser.add_argument("--trades", type=int, default=max_trades_per_day, help="Trades per path (one day)")
+    parser.add_argument("--balance", type=float, default=10000.0)
+    parser.add_argument("--ruin", type=float, default=0.5, help="Ruin once the balance falls to this fraction")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.p is not None:
+        wins, losses = None, None
+        p = args.p
+    else:
+        if args.log:
+            wins, losses = outcomes_from_logs(args.log)
+        elif args.bars or args.synthetic_bars:
+            import backtest
+            bars = backtest.load_bars(args.bars) if args.bars else backtest.synthetic_bars(args.synthetic_bars)
+            wins, losses = outcomes_from_backtest(bars)
+        else:
+            parser.error("one of --log, --bars, --synthetic-bars or --p is required")
+        if wins + losses == 0:
+            parser.error("no closed trades to estimate the win rate from")
+        p = (wins, losses) if args.posterior else wins / (wins + losses)
+
+    start = time.perf_counter()
+    result = monte_carlo(p, args.paths, args.trades, args.balance, args.ruin, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+    s = summarize(*result, args.balance)
+
+    source = f"{wins} wins / {losses} losses" if wins is not None else "given"
+    p_text = f"Beta({wins + 1}, {losses + 1})" if isinstance(p, tuple) else f"{p:.4f}"
+    print(f"{s['paths']} paths x {args.trades} trades in {elapsed:.2f} s "
+          f"({s['paths'] * args.trades / elapsed / 1e6:.1f}M trades/s), win probability {p_text} ({source})")
+    print(f"Ruin (balance <= {args.ruin:.0%} of start): {s['ruin_probability']:.4%}, "
+          f"losing day: {s['loss_probability']:.2%}, mean balance {s['mean_balance']:.2f}")
+    print("Max drawdown quantiles:   " + ", ".join(f"p{q * 100:g} {s[f'drawdown_p{q * 100:g}']:.1%}"
+                                                   for q in DRAWDOWN_QUANTILES))
+    print("Terminal balance quantiles: " + ", ".join(f"p{q * 100:g} {s[f'balance_p{q * 100:g}']:.2f}"
+                                                     for q in BALANCE_QUANTILES))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,86 @@
 import os
 import time
-import math
-import pandas as pd
-from datetime import datetime
+import numpy as np
+from datetime import date, datetime
 import MetaTrader5 as mt5
-
-# Initialize MetaTrader 5
-if not mt5.initialize():
-    print("Failed to initialize MetaTrader 5")
-    mt5.shutdown()
-    exit()
+from tradelog import TradeLogWriter
+from snapshot import MarketSnapshot
+from orderbook import OrderBook
+from tickstore import TickRecorder
+from exits import ExitScheduler
+from checkpoint import Checkpoint
+from symbols import SymbolCache
+from exposure import ExposureEngine
+from supervisor import Supervisor
+from barclock import BarClock, bar_open, next_boundary
+import metrics
 
 # Specify the file path
 file_path = os.path.join(os.path.expanduser("~"), "Desktop", "trade_log.csv")
 
-# Initialize trade log DataFrame
-if os.path.exists(file_path):
-    trade_log_df = pd.read_csv(file_path)
-else:
-    trade_log_df = pd.DataFrame(columns=["SN", "Date", "Instrument", "P/L", "Net Balance", "Comment/ErrorLogs", "Forecast"])
+# Initialize trade log writer (appends in the background, one file per day)
+trade_log = TradeLogWriter(file_path, columns=["SN", "Date", "Instrument", "P/L", "Net Balance", "Comment/ErrorLogs", "Forecast"])
+
+# Market state shared by everything in one loop iteration
+snapshot = MarketSnapshot(mt5)
+
+# Local order/position book, updated from deal deltas
+book = OrderBook(mt5)
+
+# Digits, tick size, volume limits and stops level, so orders are normalized and checked before sending
+symbols = SymbolCache(mt5)
+
+# Net position, floating P/L, margin and equity, kept up to date from ticks and fills (balance set at start-up)
+exposure = ExposureEngine(symbols, balance=0.0)
+
+# Every tick seen is recorded to one binary file per symbol per day
+tick_recorder = TickRecorder(os.path.join(os.path.expanduser("~"), "Desktop", "ticks"))
+
+# Bot state (trade counters, balance, pending exits), saved after every change for warm restarts
+checkpoint = Checkpoint(os.path.join(os.path.expanduser("~"), "Desktop", "saharabot_state.json"))
 
 # Function to calculate A
 def calculate_A(M, fibM, S):
     return 60 / M * fibM * S
 
-# Function to get the current minute in 60-minute format
-def get_current_minute():
-    return datetime.now().minute
+# Function to get the current minute in 60-minute format (of a timestamp, if given)
+def get_current_minute(timestamp=None):
+    return (datetime.fromtimestamp(timestamp) if timestamp is not None else datetime.now()).minute
 
 # Function to get the spot price of the currency pair/instrument
+@metrics.timed("get_spot_price")
 def get_spot_price(symbol):
-    tick = mt5.symbol_info_tick(symbol)
+    tick = snapshot.tick(symbol)
     if tick:
+        tick_recorder.record(symbol, tick)
         return tick.last
     else:
         raise Exception(f"Failed to get tick for symbol: {symbol}")
 
-# Function to calculate risk based on account balance
+# Function to calculate the sine(A) signal for a minute and spot price (scalars or NumPy arrays)
+@metrics.timed("calculate_signal")
+def calculate_signal(current_minute, spot_price):
+    fibM = (current_minute - 1) + current_minute
+    A = calculate_A(current_minute, fibM, spot_price)
+    return np.sin(A)
+
+# Function to calculate risk based on account balance (scalars or NumPy arrays)
 def calculate_risk(start_balance, trade_num):
     risk_percent = 0.05
     risk = start_balance * risk_percent
     reward_multipliers = [4, 2, 2, 2]
-    reward = risk * reward_multipliers[trade_num % 4]
+    reward = risk * np.take(reward_multipliers, trade_num % 4)
     return risk, reward
 
-# Function to execute trades
-def execute_trade(symbol, trade_type, volume, price, sl, tp):
-    request = {
+# Function to calculate SL and TP from percentages of the current price (scalars or NumPy arrays)
+def calculate_sl_tp(spot_price, is_buy, sl_percent=0.5, tp_percent=1.0):
+    sl = np.where(is_buy, spot_price - sl_percent / 100 * spot_price, spot_price + sl_percent / 100 * spot_price)
+    tp = np.where(is_buy, spot_price + tp_percent / 100 * spot_price, spot_price - tp_percent / 100 * spot_price)
+    return sl, tp
+
+# Function to build a market order request
+def deal_request(symbol, trade_type, volume, price, sl, tp):
+    return {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
         "volume": volume,
@@ -60,111 +94,280 @@ def execute_trade(symbol, trade_type, volume, price, sl, tp):
         "type_time": mt5.ORDER_TIME_GTC,
         "type_filling": mt5.ORDER_FILLING_IOC,
     }
-    result = mt5.order_send(request)
+
+# Function to build the request that closes a position at a given price
+def close_request(position, price):
+    return {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": position.symbol,
+        "volume": position.volume,
+        "type": mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
+        "position": position.ticket,
+        "price": price,
+        "deviation": 20,
+        "magic": 234000,
+        "comment": "Closing position",
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": mt5.ORDER_FILLING_IOC,
+    }
+
+# Function to execute trades
+@metrics.timed("execute_trade")
+def execute_trade(symbol, trade_type, volume, price, sl, tp):
+    request = symbols.normalize(deal_request(symbol, trade_type, volume, price, sl, tp))
+    result = symbols.check(request, snapshot.tick(symbol))
+    if result is not None:
+        metrics.count("local_rejects", "execute_trade")
+        return result
+    result = supervisor.expect(snapshot.order_send(request), "order_send")
+    metrics.count_reject("execute_trade", result)
+    book.record(request, result)
     return result
 
 # Function to log trade data
+@metrics.timed("log_trade")
 def log_trade(trade_data):
-    global trade_log_df
-    trade_log_df = pd.concat([trade_log_df, pd.DataFrame([trade_data])], ignore_index=True)
-    print(trade_log_df)  # Display the DataFrame
-    trade_log_df.to_csv(file_path, index=False)
+    trade_log.log(trade_data)
+
+# Function to log a trade that closed without a timed exit and carry the balance forward
+def log_closed(ticket, info, pl, comment):
+    global start_balance
+    info = info or {"SN": None, "Forecast": None}  # Opened before this run
+    print(f"Trade {info['SN'] or ticket}: {comment}, P/L = {pl}, Net Balance = {exposure.balance}")
+    log_trade({
+        "SN": info["SN"],
+        "Date": datetime.now(),
+        "Instrument": symbol,
+        "P/L": pl,
+        "Net Balance": exposure.balance,
+        "Comment/ErrorLogs": comment,
+        "Forecast": info["Forecast"]
+    })
+    start_balance = exposure.balance
+
+# Function to log the trades the exposure engine saw reach their SL or TP (closed at that level)
+def log_stopped(closed):
+    for ticket, info, pl in closed:
+        log_closed(ticket, info, pl, "Trade closed by SL/TP")
+    if closed:
+        print(exposure.report())
+        save_state()
+
+# Function to book a position found closed at its exit time (SL/TP between ticks, during a reconnect, or
+# closed by hand) at the price and profit of its closing deals; returns (P/L, comment)
+def book_closed(ticket):
+    deals = supervisor.expect(mt5.history_deals_get(position=ticket), "history_deals_get")
+    out = [d for d in deals or () if d.entry != mt5.DEAL_ENTRY_IN]
+    if out:
+        volume = sum(d.volume for d in out)
+        price = sum(d.price * d.volume for d in out) / volume
+        profit = sum(d.profit + d.swap + d.commission + d.fee for d in out)
+        pl = exposure.close(ticket, price, profit)
+        if pl is None:
+            pl = profit  # Opened before this run and not in the book
+        reasons = {d.reason for d in out}
+        comment = ("Trade closed by SL" if reasons == {mt5.DEAL_REASON_SL} else
+                   "Trade closed by TP" if reasons == {mt5.DEAL_REASON_TP} else "Trade closed outside the bot")
+    else:
+        pl = exposure.close(ticket)
+        comment = "Trade closed before its exit; no closing deal found, P/L at the last price"
+    return pl, comment
+
+# Function to book and log a position the exit scheduler found already closed
+def close_missing(ticket, info):
+    if exposure.settled(ticket):
+        return  # Already booked and logged at its SL/TP by log_stopped
+    log_closed(ticket, info, *book_closed(ticket))
+    print(exposure.report())
+    save_state()
 
 # Initialize variables
-start_balance = mt5.account_info().balance
 trade_num = 0
+trades_today = 0  # Counted against max_trades_per_day, reset when the date changes
+trade_day = date.today().isoformat()
 max_trades_per_day = 100
+max_net_volume = 1.0  # Lots, long or short, open at any time
 symbol = "USDJPYm"  # Hardcoded symbol
 Startinglot = 0.1  # Hardcoded lot size
+hold_seconds = 180  # Each trade is closed 3 minutes after entry
+trade_interval = 180  # Seconds between trade attempts, made at the open of every third M1 bar
+start_balance = None
+next_trade_time = 0.0
 
-# Main trading loop
-while True:
-    try:
-        current_minute = get_current_minute()
+# Sleeps to the exact bar open (or exit deadline) on a monotonic deadline instead of drifting fixed sleeps
+clock = BarClock()
+
+# Function to reload terminal state after a reconnect
+def resync():
+    snapshot.refresh()
+    symbols.invalidate()
+    book.full_sync()
+
+# Reconnects with backoff when the terminal connection drops, then resyncs and resumes the loop
+supervisor = Supervisor(mt5, resync)
+
+# Positions are closed at the current price when their hold time is up, without blocking the loop
+exits = ExitScheduler(mt5, close_request, lambda s: supervisor.expect(snapshot.positions(s), "positions_get"),
+                      lambda s: supervisor.expect(snapshot.tick(s), "symbol_info_tick"), snapshot.order_send,
+                      on_missing=close_missing)
+
+# Function to save the bot state
+def save_state():
+    checkpoint.save({
+        "trade_num": trade_num,
+        "trade_day": trade_day,
+        "trades_today": trades_today,
+        "start_balance": start_balance,
+        "next_trade_time": next_trade_time,
+        "exits": exits.pending(),
+    })
+
+# Function to restore the state saved by the last run (the daily count only if it is from today)
+def load_state():
+    global trade_num, trades_today, start_balance, next_trade_time
+    state = checkpoint.load()
+    trade_num = state.get("trade_num", 0)
+    if state.get("trade_day") == trade_day:
+        trades_today = state.get("trades_today", 0)
+    start_balance = state.get("start_balance")
+    next_trade_time = state.get("next_trade_time", 0.0)
+    for ticket, position_symbol, deadline, info in state.get("exits", []):
+        exits.schedule(ticket, position_symbol, deadline, info)
+    return state
+
+# Main trading loop; runs until the daily trade limit is reached and every exit is done
+def trading_loop():
+    global trade_num, trades_today, trade_day, start_balance, next_trade_time
+    if next_trade_time < time.time():
+        next_trade_time = next_boundary(time.time(), trade_interval)
+    while True:
+        snapshot.refresh()
+        now = time.time()
+        today = date.today().isoformat()
+        if today != trade_day:
+            trade_day, trades_today = today, 0
+
+        # Revalue open positions on the latest tick and book the ones that reached their SL/TP
+        tick = supervisor.expect(snapshot.tick(symbol), "symbol_info_tick")
+        if tick is not None:
+            log_stopped(exposure.on_tick(symbol, tick.bid, tick.ask))
+
+        # Close every position whose hold time is up
+        closed = exits.process(now)
+        for ticket, info, position, close_result in closed:
+            if close_result is None or close_result.retcode != mt5.TRADE_RETCODE_DONE:
+                metrics.count_reject("close_position", close_result)
+                print(f"Failed to close position: {close_result.comment if close_result else 'order_send returned None'}")
+                continue
+            pl = exposure.close(ticket, close_result.price)
+            if pl is None:
+                pl = position.profit  # Opened before this run and not in the book
+            balance_after_trade = exposure.balance
+            print(f"Trade {info['SN']}: P/L = {pl}, Net Balance = {balance_after_trade}")
+            log_trade({
+                "SN": info["SN"],
+                "Date": datetime.now(),
+                "Instrument": symbol,
+                "P/L": pl,
+                "Net Balance": balance_after_trade,
+                "Comment/ErrorLogs": "Trade executed and closed successfully",
+                "Forecast": info["Forecast"]
+            })
+            start_balance = balance_after_trade
+        if closed:
+            print(exits.report())
+            print(exposure.report())
+            save_state()
+
+        if trades_today >= max_trades_per_day:
+            if not len(exits):
+                print("Reached maximum trades for the day.")
+                return
 
-        if trade_num >= max_trades_per_day:
-            print("Reached maximum trades for the day.")
-            break
-        
-        if trade_num < max_trades_per_day:
+        elif now >= next_trade_time:
+            next_trade_time = next_boundary(now, trade_interval)
+            current_minute = get_current_minute(bar_open(now, 60))
+            if current_minute == 0:
+                continue  # calculate_A divides by the minute; the next attempt comes at the following boundary
             spot_price = get_spot_price(symbol)
-            fibM = (current_minute - 1) + current_minute
-            A = calculate_A(current_minute, fibM, spot_price)
-            sin_A = math.sin(A)
+            sin_A = calculate_signal(current_minute, spot_price)
 
             # Determine trade type based on signal direction
             trade_type = mt5.ORDER_TYPE_BUY if sin_A > 0 else mt5.ORDER_TYPE_SELL
             forecast = "Buy" if sin_A > 0 else "Sell"
 
-            # Calculate risk and reward
-            risk, reward = calculate_risk(start_balance, trade_num + 1)
+            # No new position unless it fits the free margin and the net volume cap
+            if not exposure.allows(symbol, trade_type == mt5.ORDER_TYPE_BUY, Startinglot, max_net_volume):
+                print(f"Skipping trade: {exposure.report()}")
+                continue
+
+            # Calculate risk and reward on current equity, open positions included
+            risk, reward = calculate_risk(exposure.equity(), trade_num + 1)
 
             # Define SL and TP percentages
             sl_percent = 0.5  # Stop loss as a percentage of the current price
             tp_percent = 1.0  # Take profit as a percentage of the current price
 
             # Calculate SL and TP values
-            sl = spot_price - sl_percent / 100 * spot_price if trade_type == mt5.ORDER_TYPE_BUY else spot_price + sl_percent / 100 * spot_price
-            tp = spot_price + tp_percent / 100 * spot_price if trade_type == mt5.ORDER_TYPE_BUY else spot_price - tp_percent / 100 * spot_price
+            sl, tp = calculate_sl_tp(spot_price, trade_type == mt5.ORDER_TYPE_BUY, sl_percent, tp_percent)
+            sl, tp = float(sl), float(tp)
 
             # Execute trade
             result = execute_trade(symbol, trade_type, Startinglot, spot_price, sl, tp)
-            if result.retcode != mt5.TRADE_RETCODE_DONE:
-                print(f"Failed to execute trade: {result.comment}")
+            if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+                comment = result.comment if result else "order_send returned None"
+                print(f"Failed to execute trade: {comment}")
                 log_trade({
                     "SN": trade_num + 1,
                     "Date": datetime.now(),
                     "Instrument": symbol,
                     "P/L": 0,
                     "Net Balance": start_balance,
-                    "Comment/ErrorLogs": result.comment,
+                    "Comment/ErrorLogs": comment,
                     "Forecast": forecast
                 })
             else:
                 print(f"Trade executed successfully: {result}")
-
                 trade_num += 1
-                time.sleep(180)  # Wait for 3 minutes
-
-                positions = mt5.positions_get(symbol=symbol)
-                for position in positions:
-                    close_request = {
-                        "action": mt5.TRADE_ACTION_DEAL,
-                        "symbol": position.symbol,
-                        "volume": position.volume,
-                        "type": mt5.ORDER_TYPE_SELL if position.type == mt5.ORDER_TYPE_BUY else mt5.ORDER_TYPE_BUY,
-                        "position": position.ticket,
-                        "price": spot_price,
-                        "deviation": 20,
-                        "magic": 234000,
-                        "comment": "Closing position",
-                        "type_time": mt5.ORDER_TIME_GTC,
-                        "type_filling": mt5.ORDER_FILLING_IOC,
-                    }
-                    close_result = mt5.order_send(close_request)
-                    if close_result.retcode != mt5.TRADE_RETCODE_DONE:
-                        print(f"Failed to close position: {close_result.comment}")
-
-                balance_after_trade = mt5.account_info().balance
-                pl = balance_after_trade - start_balance
-                print(f"Trade {trade_num}: P/L = {pl}, Net Balance = {balance_after_trade}")
-                log_trade({
-                    "SN": trade_num,
-                    "Date": datetime.now(),
-                    "Instrument": symbol,
-                    "P/L": pl,
-                    "Net Balance": balance_after_trade,
-                    "Comment/ErrorLogs": "Trade executed and closed successfully",
-                    "Forecast": forecast
-                })
-                start_balance = balance_after_trade
+                trades_today += 1
+                info = {"SN": trade_num, "Forecast": forecast}
+                exits.schedule(result.order, symbol, now + hold_seconds, info)
+                exposure.open(result.order, symbol, trade_type == mt5.ORDER_TYPE_BUY, result.volume, result.price,
+                              sl, tp, info)
+            save_state()
+
+        # Sleep until the next exit or trade attempt is due
+        clock.sleep_until(min(t for t in (next_trade_time, exits.next_deadline()) if t is not None))
+
+if __name__ == "__main__":
+    # Initialize MetaTrader 5
+    if not mt5.initialize():
+        print("Failed to initialize MetaTrader 5")
+        mt5.shutdown()
+        exit()
 
-        # Sleep until the next 3 minutes
-        time.sleep(180)
+    # Optional --metrics-file/--metrics-port/--profile
+    instrumentation = metrics.start_from_args("saharabot")
 
+    # Warm restart from the last checkpoint
+    started = time.perf_counter()
+    if load_state():
+        print(f"Resumed in {(time.perf_counter() - started) * 1000:.1f} ms: trade {trade_num}, "
+              f"{trades_today} today, {len(exits)} exits pending")
+    account = snapshot.account()
+    if start_balance is None:
+        start_balance = account.balance
+    exposure.balance, exposure.leverage, exposure.currency = account.balance, account.leverage, account.currency
+    book.full_sync()
+    exposure.load(book.positions_for(symbol), mt5)
+
+    # Main trading loop, resumed after a reconnect if the terminal connection drops
+    try:
+        supervisor.run(trading_loop)
     except Exception as e:
         print(f"Error: {e}")
-        break
 
-# Shutdown MetaTrader 5
-mt5.shutdown()
+    # Flush the trade log and metrics, then shutdown MetaTrader 5
+    instrumentation.stop()
+    trade_log.close()
+    mt5.shutdown()
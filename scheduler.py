@@ -0,0 +1,268 @@
+## Multi-symbol strategy scheduler: one process, one terminal connection ##
+## Run: python scheduler.py --symbols USDJPYm,EURUSDm --strategies saharabot,hft,grid ##
+
+import argparse
+import asyncio
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from barstore import BarStore
+from tradelog import TradeLogWriter
+
+LOG_COLUMNS = ["SN", "Date", "Strategy", "Instrument", "P/L", "Net Balance", "Comment/ErrorLogs", "Forecast"]
+
+
+# Every terminal call runs on one dedicated thread, so reads and order submissions
+# share a single connection and never interleave
+class Terminal:
+    def __init__(self, mt5):
+        self.mt5 = mt5
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mt5")
+        self.calls = 0
+        self.orders_sent = 0
+        self.orders_rejected = 0
+
+    async def call(self, name, *args, **kwargs):
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(getattr(self.mt5, name), *args, **kwargs))
+
+    # Latest tick for every symbol in one hop to the terminal thread
+    async def ticks(self, symbols):
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: [self.mt5.symbol_info_tick(s) for s in symbols])
+
+    # Run a function that may itself call the terminal (e.g. SymbolCache lookups) on the terminal thread
+    async def run(self, function, *args):
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(function, *args))
+
+    # order_send for code already on the terminal thread (bot components called through run())
+    def send(self, request):
+        result = self.mt5.order_send(request)
+        self.orders_sent += 1
+        if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+            self.orders_rejected += 1
+        return result
+
+    async def order_send(self, request):
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.send, request)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+# Runs strategy units (one per strategy and symbol) on every new tick of their symbol.
+# Units get time slices in rotating order; a unit whose on_tick overruns time_budget
+# owes the overrun and sits out cycles until it is paid back (deficit round robin)
+class StrategyScheduler:
+    def __init__(self, mt5, units, log_path=None, poll_interval=0.001, time_budget=0.002, report_interval=10.0,
+                 bar_store=None):
+        self.mt5 = mt5
+        self.terminal = Terminal(mt5)
+        self.bar_store = bar_store  # barstore.BarStore; without one, rates() downloads every time
+        self.units = list(units)
+        self.symbols = sorted({unit.symbol for unit in self.units})
+        self.units_by_symbol = {s: [u for u in self.units if u.symbol == s] for s in self.symbols}
+        self.poll_interval = poll_interval
+        self.time_budget = time_budget
+        self.report_interval = report_interval
+        if log_path is None:
+            log_path = os.path.join(os.path.expanduser("~"), "Desktop", "scheduler_log.csv")
+        self.trade_log = TradeLogWriter(log_path, LOG_COLUMNS)
+        self.last_ticks = {}
+        self.market_time = 0.0  # Seconds, from the newest tick seen on any symbol
+        self.evaluations = 0
+        self.skipped = 0
+        self.cycles = 0
+        self._debt = {id(u): 0.0 for u in self.units}
+        self._rotation = 0
+        self._timers = []  # heap of (market time, seq, future)
+        self._timer_seq = 0
+        self._tasks = set()
+        self._running = False
+
+    # ---- API used by strategy units ----
+
+    async def call(self, name, *args, **kwargs):
+        return await self.terminal.call(name, *args, **kwargs)
+
+    async def order_send(self, request):
+        return await self.terminal.order_send(request)
+
+    # Run bot code that can reach the terminal (symbol rules, request checks) on the terminal thread
+    async def on_terminal(self, function, *args):
+        return await self.terminal.run(function, *args)
+
+    # Counted order_send for bot components running through on_terminal (their send callback)
+    def send(self, request):
+        return self.terminal.send(request)
+
+    # Last count bars like copy_rates_from_pos(symbol, timeframe, 0, count), through the bar store if there is one
+    async def rates(self, symbol, timeframe, count):
+        if self.bar_store is None:
+            return await self.call("copy_rates_from_pos", symbol, timeframe, 0, count)
+        self.terminal.calls += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.terminal.executor, self.bar_store.read, symbol, timeframe, count)
+
+    # Resolves once market time reaches the given timestamp (works at any replay speed)
+    def wait_until(self, timestamp):
+        future = asyncio.get_running_loop().create_future()
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (timestamp, self._timer_seq, future))
+        return future
+
+    # Run a unit's follow-up work (orders, waits) in the background; the unit is busy until it finishes
+    def spawn(self, unit, coro):
+        unit.busy = True
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+
+        def done(t):
+            unit.busy = False
+            self._tasks.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                print(f"{unit.name} {unit.symbol} failed: {t.exception()}")
+
+        task.add_done_callback(done)
+        return task
+
+    def log(self, unit, row):
+        row = dict(row)
+        row.setdefault("Date", datetime.now())
+        row["Strategy"] = unit.name
+        row["Instrument"] = unit.symbol
+        self.trade_log.log(row)
+
+    # ---- main loop ----
+
+    def stop(self):
+        self._running = False
+
+    async def run(self, duration=None):
+        self._running = True
+        start = time.perf_counter()
+        next_report = start + self.report_interval
+        while self._running:
+            if duration is not None and time.perf_counter() - start >= duration:
+                break
+            ticks = await self.terminal.ticks(self.symbols)
+            fresh = []
+            for symbol, tick in zip(self.symbols, ticks):
+                if tick is None:
+                    continue
+                last = self.last_ticks.get(symbol)
+                if last is not None and tick.time_msc <= last.time_msc:
+                    continue
+                self.last_ticks[symbol] = tick
+                self.market_time = max(self.market_time, tick.time_msc / 1000)
+                fresh.append(symbol)
+
+            self._fire_timers()
+            if fresh:
+                self._dispatch(fresh)
+            self.cycles += 1
+
+            now = time.perf_counter()
+            if now >= next_report:
+                self.report(now - start)
+                next_report = now + self.report_interval
+            await asyncio.sleep(0 if fresh else self.poll_interval)
+
+        # Let in-flight order work finish before reporting
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=5.0)
+        elapsed = time.perf_counter() - start
+        self.report(elapsed)
+        self.trade_log.flush()
+        return self.stats(elapsed)
+
+    def _fire_timers(self):
+        while self._timers and self._timers[0][0] <= self.market_time:
+            _, _, future = heapq.heappop(self._timers)
+            if not future.done():
+                future.set_result(self.market_time)
+
+    def _dispatch(self, symbols):
+        units = [u for s in symbols for u in self.units_by_symbol[s]]
+        # Rotate the starting point every cycle so no unit is always served last
+        self._rotation = (self._rotation + 1) % len(units)
+        units = units[self._rotation:] + units[:self._rotation]
+        for unit in units:
+            key = id(unit)
+            if self._debt[key] > 0:
+                self._debt[key] = max(self._debt[key] - self.time_budget, 0.0)
+                self.skipped += 1
+                continue
+            started = time.perf_counter()
+            try:
+                unit.on_tick(self, self.last_ticks[unit.symbol])
+            except Exception as e:
+                print(f"{unit.name} {unit.symbol} failed: {e}")
+            used = time.perf_counter() - started
+            self.evaluations += 1
+            if used > self.time_budget:
+                self._debt[key] += used - self.time_budget
+
+    def stats(self, elapsed):
+        return {
+            "elapsed": elapsed,
+            "evaluations": self.evaluations,
+            "evaluations_per_sec": self.evaluations / elapsed if elapsed else 0.0,
+            "skipped": self.skipped,
+            "cycles": self.cycles,
+            "terminal_calls": self.terminal.calls,
+            "orders_sent": self.terminal.orders_sent,
+            "orders_rejected": self.terminal.orders_rejected,
+        }
+
+    def report(self, elapsed):
+        s = self.stats(elapsed)
+        print(f"[scheduler] {len(self.symbols)} symbols, {len(self.units)} units: "
+              f"{s['evaluations_per_sec']:.0f} symbol evaluations/s, {s['skipped']} skipped, "
+              f"{s['orders_sent']} orders ({s['orders_rejected']} rejected), {s['terminal_calls']} terminal calls")
+
+
+# Build one unit per strategy and symbol
+def build_units(symbols, strategy_names):
+    from strategies import STRATEGIES
+    return [STRATEGIES[name](symbol) for name in strategy_names for symbol in symbols]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bots as plug-in strategies over many symbols")
+    parser.add_argument("--symbols", default="USDJPYm", help="Comma separated symbol list")
+    parser.add_argument("--strategies", default="saharabot,hft,grid", help="Comma separated strategy names")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--time-budget", type=float, default=0.002, help="Seconds of on_tick time per unit per cycle")
+    args = parser.parse_args()
+
+    import MetaTrader5 as mt5
+    if not mt5.initialize():
+        print("Failed to initialize, error code =", mt5.last_error())
+        quit()
+
+    units = build_units(args.symbols.split(","), args.strategies.split(","))
+    bar_store = BarStore(mt5, os.path.join(os.path.expanduser("~"), "Desktop", "bars"))
+    scheduler = StrategyScheduler(mt5, units, time_budget=args.time_budget, bar_store=bar_store)
+    try:
+        asyncio.run(scheduler.run(args.duration))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.trade_log.close()
+        scheduler.terminal.close()
+        mt5.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+## Per-cycle market snapshot: ticks, positions, orders and account state fetched once and shared ##
+## Entries expire after their TTL (None = until the next refresh) and are invalidated after order_send ##
+
+import threading
+import time
+
+# Default time-to-live per kind of data, in seconds
+DEFAULT_TTL = {"tick": None, "positions": None, "orders": None, "account": None}
+
+
+class MarketSnapshot:
+    def __init__(self, mt5, ttl=None):
+        self.mt5 = mt5
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.fetches = 0  # Terminal calls made through the snapshot
+        self.hits = 0
+        self._entries = {}  # key -> (fetched_at, value)
+        self._lock = threading.Lock()
+
+    def _get(self, kind, key, fetch):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            ttl = self.ttl[kind]
+            if entry is not None and (ttl is None or now - entry[0] < ttl):
+                self.hits += 1
+                return entry[1]
+        value = fetch()
+        self.fetches += 1
+        with self._lock:
+            self._entries[key] = (now, value)
+        return value
+
+    # Start a new cycle: everything is fetched again on first use
+    def refresh(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Drop cached data of the given kinds ("tick", "positions", "orders", "account"), or all of it
+    def invalidate(self, *kinds):
+        with self._lock:
+            if not kinds:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] in kinds]:
+                del self._entries[key]
+
+    def tick(self, symbol):
+        return self._get("tick", ("tick", symbol), lambda: self.mt5.symbol_info_tick(symbol))
+
+    # Seed the tick for a symbol from a tick already in hand (e.g. from a tick feed)
+    def set_tick(self, symbol, tick):
+        with self._lock:
+            self._entries[("tick", symbol)] = (time.monotonic(), tick)
+
+    # All positions are fetched in one call and filtered locally
+    def positions(self, symbol=None):
+        positions = self._get("positions", ("positions",), lambda: self.mt5.positions_get())
+        if positions is None or symbol is None:
+            return positions
+        return tuple(p for p in positions if p.symbol == symbol)
+
+    def orders(self, symbol=None):
+        orders = self._get("orders", ("orders",), lambda: self.mt5.orders_get())
+        if orders is None or symbol is None:
+            return orders
+        return tuple(o for o in orders if o.symbol == symbol)
+
+    def account(self):
+        return self._get("account", ("account",), lambda: self.mt5.account_info())
+
+    # Send an order and drop the state it may have changed
+    def order_send(self, request):
+        result = self.mt5.order_send(request)
+        self.invalidate("positions", "orders", "account")
+        return result
@@ -0,0 +1,255 @@
+## The three bots as plug-in strategy units for scheduler.StrategyScheduler ##
+## on_tick() only decides; terminal work goes through ctx (the scheduler) in a spawned task ##
+## The units run the bots' own components: the saharabot and HFT units gate and value trades with the bot's ##
+## ExposureEngine and close them with an ExitScheduler, the grid unit runs a GridManager and a TrailingStopEngine; ##
+## anything that calls the terminal runs on the scheduler's terminal thread through ctx.on_terminal ##
+## Times come from the tick (server time) so units behave the same live and in replay ##
+
+import math
+
+import MetaTrader5 as mt5
+
+import gridbot2024
+import HFTBot2024
+import saharabot2024
+from barclock import next_boundary
+from exits import ExitScheduler
+from gridmanager import GridManager
+from indicators import IndicatorEngine, SMA
+from trailing import TrailingStopEngine
+
+
+class Strategy:
+    name = "strategy"
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.busy = False  # True while spawned work (orders, exits, terminal passes) is in flight
+
+    def on_tick(self, ctx, tick):
+        raise NotImplementedError
+
+
+# Market orders closed hold_seconds after entry, as saharabot2024 and HFTBot2024 trade: the bot's ExposureEngine
+# gates every entry and books SL/TP hits on the tick, and the unit's ExitScheduler closes the positions that are
+# due (booking any it finds already closed from their closing deals, like the bot)
+class TimedExitStrategy(Strategy):
+    bot = None  # saharabot2024 or HFTBot2024, whose requests, ExposureEngine and deal booking the unit uses
+
+    def __init__(self, symbol, lot, hold_seconds, max_trades, max_net_volume):
+        super().__init__(symbol)
+        self.lot = lot
+        self.hold_seconds = hold_seconds
+        self.max_trades = max_trades
+        self.max_net_volume = max_net_volume
+        self.exposure = self.bot.exposure  # Shared by every unit of the strategy, as one account backs them
+        self.exits = None  # Built once the account is read, sending through the scheduler
+        self.closing = False  # True while a batch of due exits is on the terminal thread
+        self.trade_num = 0
+
+    # Balance, leverage and currency for the bot's ExposureEngine, read once (runs on the terminal thread)
+    def load_account(self):
+        if not self.exposure.balance:
+            account = mt5.account_info()
+            self.exposure.balance, self.exposure.leverage, self.exposure.currency = \
+                account.balance, account.leverage, account.currency
+
+    async def start(self, ctx):
+        await ctx.on_terminal(self.load_account)
+        self.exits = ExitScheduler(mt5, self.bot.close_request, send=ctx.send,
+                                   on_missing=lambda ticket, info: self.close_missing(ctx, ticket, info))
+
+    # Book the positions this tick takes to their SL/TP and send the exits that are due; False until ready
+    def manage(self, ctx, tick):
+        if self.exits is None:
+            if not self.busy:
+                ctx.spawn(self, self.start(ctx))
+            return False
+        for ticket, info, pl in self.exposure.on_tick(self.symbol, tick.bid, tick.ask):
+            self.log_closed(ctx, info, pl, "Trade closed by SL/TP")
+        if not self.closing:
+            deadline = self.exits.next_deadline()
+            if deadline is not None and tick.time_msc / 1000 >= deadline:
+                self.closing = True
+                ctx.spawn(self, self.close_due(ctx, tick.time_msc / 1000))
+        return True
+
+    async def close_due(self, ctx, now):
+        try:
+            closed = await ctx.on_terminal(self.exits.process, now)
+        finally:
+            self.closing = False
+        for ticket, info, position, result in closed:
+            if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+                print(f"Failed to close position: {result.comment if result else 'order_send returned None'}")
+                continue  # Retried by the exit scheduler
+            pl = self.exposure.close(ticket, result.price)
+            self.log_closed(ctx, info, position.profit if pl is None else pl, "Trade executed and closed successfully")
+
+    # ExitScheduler on_missing: book a position already closed at its exit time (runs on the terminal thread)
+    def close_missing(self, ctx, ticket, info):
+        if self.exposure.settled(ticket):
+            return  # Booked and logged at its SL/TP by manage
+        self.log_closed(ctx, info, *self.bot.book_closed(ticket))
+
+    def log_closed(self, ctx, info, pl, comment):
+        ctx.log(self, {"SN": info["SN"], "P/L": pl, "Net Balance": self.exposure.balance, "Forecast": info["Forecast"],
+                       "Comment/ErrorLogs": comment})
+
+    # Whether a new position fits the free margin and the net volume cap
+    def allows(self, trade_type):
+        return self.exposure.allows(self.symbol, trade_type == mt5.ORDER_TYPE_BUY, self.lot, self.max_net_volume)
+
+    async def trade(self, ctx, request, forecast, opened):
+        result = await ctx.order_send(request)
+        if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+            ctx.log(self, {"SN": self.trade_num + 1, "P/L": 0, "Net Balance": self.exposure.balance,
+                           "Forecast": forecast,
+                           "Comment/ErrorLogs": result.comment if result else "order_send returned None"})
+            return
+        self.trade_num += 1
+        info = {"SN": self.trade_num, "Forecast": forecast}
+        self.exposure.open(result.order, self.symbol, request["type"] == mt5.ORDER_TYPE_BUY, result.volume,
+                           result.price, request.get("sl", 0.0), request.get("tp", 0.0), info)
+        await ctx.on_terminal(self.exits.schedule, result.order, self.symbol, opened + self.hold_seconds, info)
+
+
+# saharabot2024: sine(A) on the minute, 0.5% SL / 1% TP, closed after 3 minutes; like the live loop a trade is
+# attempted at the open of every third M1 bar, whether or not the previous one is still open
+class SaharabotStrategy(TimedExitStrategy):
+    name = "saharabot"
+    bot = saharabot2024
+
+    def __init__(self, symbol, lot=0.1, hold_seconds=180, cycle_seconds=180, max_trades=100, max_net_volume=1.0):
+        super().__init__(symbol, lot, hold_seconds, max_trades, max_net_volume)
+        self.cycle_seconds = cycle_seconds
+        self.next_time = 0
+
+    def on_tick(self, ctx, tick):
+        if not self.manage(ctx, tick) or self.trade_num >= self.max_trades or tick.time < self.next_time:
+            return
+        self.next_time = next_boundary(tick.time, self.cycle_seconds)
+        current_minute = (tick.time // 60) % 60
+        if current_minute == 0:
+            return  # calculate_A divides by the minute
+
+        spot_price = tick.last
+        sin_A = saharabot2024.calculate_signal(current_minute, spot_price)
+        trade_type = mt5.ORDER_TYPE_BUY if sin_A > 0 else mt5.ORDER_TYPE_SELL
+        forecast = "Buy" if sin_A > 0 else "Sell"
+        if not self.allows(trade_type):
+            return
+        sl, tp = saharabot2024.calculate_sl_tp(spot_price, trade_type == mt5.ORDER_TYPE_BUY)
+        request = saharabot2024.deal_request(self.symbol, trade_type, self.lot, spot_price, float(sl), float(tp))
+        ctx.spawn(self, self.trade(ctx, request, forecast, tick.time))
+
+
+# HFTBot2024: SMA(50) on M1 plus sine(A) on the hour, one trade at a time, closed after 3 minutes
+class HFTStrategy(TimedExitStrategy):
+    name = "hft"
+    bot = HFTBot2024
+
+    def __init__(self, symbol, lot=2.0, period=50, hold_seconds=180, max_trades=100, max_net_volume=2.0):
+        super().__init__(symbol, lot, hold_seconds, max_trades, max_net_volume)
+        self.period = period
+        self.engine = None
+        self.previous_hour = None
+
+    async def seed(self, ctx):
+        rates = await ctx.rates(self.symbol, mt5.TIMEFRAME_M1, self.period)
+        if rates is None or len(rates) < self.period:
+            return
+        engine = IndicatorEngine(60)
+        engine.add("sma", SMA(self.period))
+        self.engine = engine.seed_from_rates(rates)
+
+    def on_tick(self, ctx, tick):
+        if not self.manage(ctx, tick):
+            return
+        if self.engine is None:
+            if not self.busy:
+                ctx.spawn(self, self.seed(ctx))
+            return
+        self.engine.on_tick(tick)
+        current_hour = (tick.time // 3600) % 24
+        previous_hour = current_hour if self.previous_hour is None else self.previous_hour
+        self.previous_hour = current_hour
+        # One trade at a time: the open one is still waiting for its timed exit
+        if self.busy or len(self.exits) or self.trade_num >= self.max_trades or current_hour == 0:
+            return  # (calculate_A divides by the hour)
+
+        spot_price = tick.last
+        sma_50 = self.engine["sma"]
+        fibH = current_hour - previous_hour
+        sin_A = math.sin(HFTBot2024.calculate_A(current_hour, fibH, spot_price))
+        if spot_price == 0.0:
+            return
+        if spot_price > sma_50 and sin_A > 0:
+            trade_type, forecast = mt5.ORDER_TYPE_BUY, "Buy"
+        elif spot_price < sma_50 and sin_A < 0:
+            trade_type, forecast = mt5.ORDER_TYPE_SELL, "Sell"
+        else:
+            return
+        if not self.allows(trade_type):
+            return
+        request = HFTBot2024.deal_request(self.symbol, trade_type, self.lot, spot_price)
+        ctx.spawn(self, self.trade(ctx, request, forecast, tick.time_msc / 1000))
+
+
+# gridbot2024: the bot's GridManager keeps the ladder armed (placing missing levels, repricing moved ones) and its
+# TrailingStopEngine trails the open positions, one pass of the live trading_loop per tick on the terminal thread
+class GridStrategy(Strategy):
+    name = "grid"
+
+    def __init__(self, symbol, volume=0.05, pips=0.05, trailing_stop_distance=0.2, sync_seconds=1.0):
+        super().__init__(symbol)
+        self.volume = volume
+        self.pips = pips
+        self.trailing_stop_distance = trailing_stop_distance
+        self.sync_seconds = sync_seconds  # Market seconds between position reads for the trailing engine
+        self.grid = None  # Built on the terminal thread on the first pass
+        self.trailing_engine = None
+        self.send = None  # The scheduler's counted order_send
+        self.tick = None
+        self.next_sync = 0.0
+
+    def on_tick(self, ctx, tick):
+        if not self.busy:  # Ticks that arrive during a pass are covered by the next one
+            ctx.spawn(self, ctx.on_terminal(self.step, ctx, tick))
+
+    # One pass of gridbot2024.trading_loop (runs on the terminal thread)
+    def step(self, ctx, tick):
+        if self.grid is None:
+            self.send = ctx.send
+            self.grid = GridManager(mt5, self.symbol, gridbot2024.book, gridbot2024.symbols,
+                                    gridbot2024.build_grid_ladder, self.place, ctx.send, gridbot2024.grid_magic,
+                                    volume=self.volume, pips=self.pips)
+            self.trailing_engine = TrailingStopEngine(mt5, self.symbol, self.trailing_stop_distance, send=ctx.send)
+        now = tick.time_msc / 1000
+        self.tick = tick
+        recenters = self.grid.recenters
+        self.grid.maintain(tick, now)
+        if self.grid.recenters != recenters:
+            ctx.log(self, {"SN": self.grid.recenters, "Comment/ErrorLogs": self.grid.report()})
+        if now >= self.next_sync:
+            self.trailing_engine.sync(mt5.positions_get(symbol=self.symbol) or ())
+            self.next_sync = now + self.sync_seconds
+        self.trailing_engine.on_tick(tick, now)
+
+    # GridManager's place callback: the bot's pending order request, moved out of the stops level and checked
+    # locally, then sent through the scheduler; returns the result, or None if the level was not placed
+    def place(self, symbol, order_type, volume, price, sl, tp):
+        request = gridbot2024.pending_order_request(symbol, order_type, volume, price, sl, tp)
+        request = gridbot2024.symbols.fit_pending(request, self.tick)
+        if gridbot2024.symbols.check(request, self.tick) is not None:
+            return None
+        result = self.send(request)
+        gridbot2024.book.record(request, result)
+        return result if result is not None and result.retcode == mt5.TRADE_RETCODE_DONE else None
+
+
+STRATEGIES = {
+    SaharabotStrategy.name: SaharabotStrategy,
+    HFTStrategy.name: HFTStrategy,
+    GridStrategy.name: GridStrategy,
+}
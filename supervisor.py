@@ -0,0 +1,106 @@
+## Connection supervisor: a lost terminal connection means reconnect and resync, not a dead bot ##
+## Loss is detected from None returns plus last_error()/account_info(); initialize() is retried with bounded ##
+## exponential backoff, the caller's resync() reloads positions and orders, and the strategy loop is resumed ##
+
+import asyncio
+import time
+
+import metrics
+
+# MetaTrader5 IPC error codes (RES_E_INTERNAL_FAIL_SEND ... _TIMEOUT): the terminal is not answering
+IPC_ERRORS = (-10001, -10002, -10003, -10004, -10005)
+
+
+class ConnectionLost(Exception):
+    pass
+
+
+class Supervisor:
+    def __init__(self, mt5, resync=None, min_delay=0.5, max_delay=30.0, max_attempts=None, **initialize_kwargs):
+        self.mt5 = mt5
+        self.resync = resync  # Called after every reconnect, e.g. to reload the order book
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts  # None = keep trying
+        self.initialize_kwargs = initialize_kwargs  # path/login/password/server for mt5.initialize()
+        self.outages = 0
+        self.downtime = 0.0
+        self.last_recovery = None
+
+    # Whether the terminal still answers (one account_info call)
+    def connected(self):
+        if self.mt5.last_error()[0] in IPC_ERRORS:
+            return False
+        return self.mt5.account_info() is not None
+
+    # Pass a terminal call's result through, raising ConnectionLost if it is None because the terminal is gone
+    def expect(self, value, what="terminal call"):
+        if value is None and not self.connected():
+            raise ConnectionLost(f"{what} returned None: {self.mt5.last_error()}")
+        return value
+
+    # Re-initialize with backoff until the terminal answers and resync succeeds; returns seconds to recovery
+    def reconnect(self, since=None):
+        since = time.monotonic() if since is None else since
+        delay = self.min_delay
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                self.mt5.shutdown()
+                if self.mt5.initialize(**self.initialize_kwargs) and self.mt5.account_info() is not None:
+                    if self.resync is not None:
+                        self.resync()
+                    break
+                error = self.mt5.last_error()
+            except Exception as e:  # The resync itself can hit the connection dropping again
+                error = e
+            metrics.count("reconnect_failures", "supervisor")
+            if self.max_attempts is not None and attempt >= self.max_attempts:
+                raise ConnectionLost(f"Gave up reconnecting after {attempt} attempts: {error}")
+            print(f"Reconnect attempt {attempt} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
+
+        seconds = time.monotonic() - since
+        self.outages += 1
+        self.downtime += seconds
+        self.last_recovery = seconds
+        metrics.registry.record("reconnect", seconds)
+        metrics.count("reconnects", "supervisor")
+        print(f"Reconnected after {attempt} attempt(s): {seconds:.2f}s to recovery, "
+              f"{self.outages} outages / {self.downtime:.1f}s down so far")
+        return seconds
+
+    # Whether an exception out of the strategy loop is a lost connection (anything else is a bug and is re-raised)
+    def _lost(self, error):
+        if isinstance(error, ConnectionLost):
+            return True
+        try:
+            return not self.connected()
+        except Exception:
+            return True
+
+    # Run loop(*args) until it returns, reconnecting and resuming it whenever the connection is lost
+    def run(self, loop, *args):
+        while True:
+            try:
+                return loop(*args)
+            except Exception as e:
+                detected = time.monotonic()
+                if not self._lost(e):
+                    raise
+                print(f"Connection lost: {e}")
+                self.reconnect(detected)
+
+    # Same for a coroutine function; the reconnect runs in a thread so the event loop keeps turning
+    async def run_async(self, loop, *args):
+        while True:
+            try:
+                return await loop(*args)
+            except Exception as e:
+                detected = time.monotonic()
+                if not self._lost(e):
+                    raise
+                print(f"Connection lost: {e}")
+                await asyncio.to_thread(self.reconnect, detected)
@@ -0,0 +1,153 @@
+## Symbol trading rules cached from symbol_info: digits, tick size, volume limits, stops and freeze levels ##
+## (plus contract size and currencies, for exposure and P/L) ##
+## Requests are normalized to these rules and checked locally, so one the server would reject is never sent ##
+
+import math
+import threading
+import time
+from collections import namedtuple
+
+SymbolSpec = namedtuple("SymbolSpec", ["digits", "point", "tick_size", "volume_min", "volume_max", "volume_step",
+                                       "stops_level", "freeze_level",  # Levels as price distances, not points
+                                       "contract_size", "currency_base", "currency_profit"])
+
+# Result of a request refused locally, shaped like the parts of OrderSendResult the bots read
+LocalReject = namedtuple("LocalReject", ["retcode", "order", "price", "comment"])
+
+
+class SymbolCache:
+    def __init__(self, mt5, refresh_interval=3600.0):
+        self.mt5 = mt5
+        self.refresh_interval = refresh_interval
+        self.fetches = 0
+        self.rejects = 0
+        self._specs = {}  # symbol -> (fetched_at, SymbolSpec)
+        self._lock = threading.Lock()
+
+    # Trading rules of a symbol, fetched on first use and again every refresh_interval seconds
+    def spec(self, symbol):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._specs.get(symbol)
+        if entry is not None and now - entry[0] < self.refresh_interval:
+            return entry[1]
+        info = self.mt5.symbol_info(symbol)
+        self.fetches += 1
+        if info is None:
+            return entry[1] if entry is not None else None  # Keep the old rules if the terminal hiccups
+        point = info.point
+        spec = SymbolSpec(info.digits, point, info.trade_tick_size or point, info.volume_min, info.volume_max,
+                          info.volume_step, info.trade_stops_level * point, info.trade_freeze_level * point,
+                          info.trade_contract_size, getattr(info, "currency_base", symbol[:3]),
+                          getattr(info, "currency_profit", symbol[3:6]))
+        with self._lock:
+            self._specs[symbol] = (now, spec)
+        return spec
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            if symbol is None:
+                self._specs.clear()
+            else:
+                self._specs.pop(symbol, None)
+
+    # Round a price to the symbol's tick size (0 stays 0, meaning no SL/TP)
+    def normalize_price(self, symbol, price):
+        spec = self.spec(symbol)
+        if not price or spec is None:
+            return price
+        return round(round(float(price) / spec.tick_size) * spec.tick_size, spec.digits)
+
+    # Round a volume down to the volume step and clamp it to the allowed range
+    def normalize_volume(self, symbol, volume):
+        spec = self.spec(symbol)
+        if spec is None:
+            return volume
+        steps = math.floor(volume / spec.volume_step + 1e-9)
+        volume = min(max(steps * spec.volume_step, spec.volume_min), spec.volume_max)
+        return round(volume, max(0, -math.floor(math.log10(spec.volume_step))))
+
+    # Copy of a request with price, SL, TP and volume normalized
+    def normalize(self, request):
+        symbol = request["symbol"]
+        request = dict(request)
+        for key in ("price", "sl", "tp"):
+            if key in request:
+                request[key] = self.normalize_price(symbol, request[key])
+        if "volume" in request:
+            request["volume"] = self.normalize_volume(symbol, request["volume"])
+        return request
+
+    # Move a pending order that sits inside the stops level (or on the wrong side of the market) to the
+    # nearest price the server accepts, keeping its SL and TP distances; returns a new request
+    def fit_pending(self, request, tick):
+        spec = self.spec(request["symbol"])
+        if spec is None or request.get("action") != self.mt5.TRADE_ACTION_PENDING:
+            return request
+        order_type, price = request["type"], request["price"]
+        limit = self._pending_limit(spec, order_type, tick)
+        if order_type in (self.mt5.ORDER_TYPE_BUY_STOP, self.mt5.ORDER_TYPE_SELL_LIMIT):
+            shift = max(limit - price, 0.0)
+        else:
+            shift = min(limit - price, 0.0)
+        if not shift:
+            return request
+        request = dict(request)
+        for key in ("price", "sl", "tp"):
+            if request.get(key):
+                request[key] = self.normalize_price(request["symbol"], request[key] + shift)
+        return request
+
+    # Closest price a pending order of this type may have at this tick
+    def _pending_limit(self, spec, order_type, tick):
+        gap = spec.stops_level + spec.tick_size / 2  # Half a tick of slack against float rounding
+        limit = {
+            self.mt5.ORDER_TYPE_BUY_LIMIT: tick.ask - gap,
+            self.mt5.ORDER_TYPE_SELL_LIMIT: tick.bid + gap,
+            self.mt5.ORDER_TYPE_BUY_STOP: tick.ask + gap,
+            self.mt5.ORDER_TYPE_SELL_STOP: tick.bid - gap,
+        }[order_type]
+        # Round away from the market so the rounded price is still valid
+        ticks = limit / spec.tick_size
+        above = order_type in (self.mt5.ORDER_TYPE_BUY_STOP, self.mt5.ORDER_TYPE_SELL_LIMIT)
+        return round((math.ceil(ticks) if above else math.floor(ticks)) * spec.tick_size, spec.digits)
+
+    # None if the server should accept the request at this tick, otherwise a LocalReject saying why
+    def check(self, request, tick):
+        spec = self.spec(request["symbol"])
+        if spec is None:
+            return self._reject(self.mt5.TRADE_RETCODE_INVALID, "Unknown symbol")
+        volume = request.get("volume")
+        if volume is not None:
+            steps = volume / spec.volume_step
+            if not spec.volume_min <= volume <= spec.volume_max or abs(steps - round(steps)) > 1e-7:
+                return self._reject(self.mt5.TRADE_RETCODE_INVALID_VOLUME, f"Volume {volume} outside "
+                                    f"{spec.volume_min}-{spec.volume_max} step {spec.volume_step}")
+
+        order_type = request["type"]
+        if request.get("action") == self.mt5.TRADE_ACTION_PENDING:
+            price = request["price"]
+            is_buy = order_type in (self.mt5.ORDER_TYPE_BUY_LIMIT, self.mt5.ORDER_TYPE_BUY_STOP)
+            market = tick.ask if is_buy else tick.bid
+            above = order_type in (self.mt5.ORDER_TYPE_BUY_STOP, self.mt5.ORDER_TYPE_SELL_LIMIT)
+            distance = price - market if above else market - price
+            if distance < spec.stops_level - 1e-9 or distance <= 0:
+                return self._reject(self.mt5.TRADE_RETCODE_INVALID_PRICE,
+                                    f"Price {price} within stops level of {market}")
+        else:
+            is_buy = order_type == self.mt5.ORDER_TYPE_BUY
+            price = tick.ask if is_buy else tick.bid  # Market orders fill at the current price
+
+        sl, tp = request.get("sl", 0.0), request.get("tp", 0.0)
+        gap = spec.stops_level - 1e-9
+        if is_buy:
+            valid = (not sl or sl <= price - gap) and (not tp or tp >= price + gap)
+        else:
+            valid = (not sl or sl >= price + gap) and (not tp or tp <= price - gap)
+        if not valid:
+            return self._reject(self.mt5.TRADE_RETCODE_INVALID_STOPS, f"SL {sl}/TP {tp} too close to {price}")
+        return None
+
+    def _reject(self, retcode, comment):
+        self.rejects += 1
+        return LocalReject(retcode, 0, 0.0, comment)
@@ -0,0 +1,85 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# Same field layout as the tick tuples returned by the MetaTrader5 module
+Tick = namedtuple("Tick", ["time", "bid", "ask", "last", "volume", "time_msc", "flags", "volume_real"])
+
+
+# Async tick feed that polls the terminal without blocking and only yields new ticks
+class TickFeed:
+    def __init__(self, mt5, symbol, poll_interval=0.001, use_copy_ticks=False, max_batch=1000, on_none=None):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.poll_interval = poll_interval  # Seconds to yield to the event loop when nothing new arrived
+        self.use_copy_ticks = use_copy_ticks  # Use copy_ticks_from so ticks between polls are not lost
+        self.max_batch = max_batch
+        self.on_none = on_none  # Called when the terminal returns None (e.g. to check the connection)
+        self.last_time_msc = 0
+        self.duplicates = 0
+        self.received = 0
+        self._running = False
+
+    # Stop the feed after the current poll
+    def stop(self):
+        self._running = False
+
+    # Fetch ticks newer than the last one seen, dropping duplicates by time_msc
+    def poll(self):
+        if self.use_copy_ticks:
+            return self._poll_copy_ticks()
+        tick = self.mt5.symbol_info_tick(self.symbol)
+        if tick is None:
+            if self.on_none is not None:
+                self.on_none()
+            return []
+        if tick.time_msc <= self.last_time_msc:
+            self.duplicates += 1
+            return []
+        self.last_time_msc = tick.time_msc
+        self.received += 1
+        return [tick]
+
+    def _poll_copy_ticks(self):
+        if self.last_time_msc:
+            date_from = datetime.fromtimestamp(self.last_time_msc / 1000, tz=timezone.utc)
+        else:
+            # First poll only needs the latest tick, not the whole history
+            tick = self.mt5.symbol_info_tick(self.symbol)
+            if tick is None:
+                if self.on_none is not None:
+                    self.on_none()
+                return []
+            self.last_time_msc = tick.time_msc
+            self.received += 1
+            return [tick]
+
+        ticks = self.mt5.copy_ticks_from(self.symbol, date_from, self.max_batch, self.mt5.COPY_TICKS_ALL)
+        if ticks is None and self.on_none is not None:
+            self.on_none()
+        if ticks is None or len(ticks) == 0:
+            return []
+        new_ticks = []
+        for row in ticks:
+            if row["time_msc"] <= self.last_time_msc:
+                self.duplicates += 1
+                continue
+            new_ticks.append(Tick(*row.tolist()[:8]))
+            self.last_time_msc = int(row["time_msc"])
+        self.received += len(new_ticks)
+        return new_ticks
+
+    # Iterate over new ticks as they arrive
+    async def __aiter__(self):
+        self._running = True
+        while self._running:
+            ticks = self.poll()
+            if not ticks:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for tick in ticks:
+                yield tick
+                if not self._running:
+                    break
+            # Give other tasks a chance to run between bursts
+            await asyncio.sleep(0)
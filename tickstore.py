@@ -0,0 +1,215 @@
+## Binary tick store: one fixed-width segment file per symbol per day ##
+## TickRecorder appends ticks in batches; TickStore memory-maps the segments as NumPy structured arrays ##
+## Records use the MetaTrader5 tick layout, so slices feed mt5replay.load_ticks / backtests without copying ##
+## Layout: <root>/<symbol>/<YYYYMMDD>.ticks = 64-byte header + packed records ##
+## Run: python tickstore.py <root> [symbol]   (lists days and tick counts) ##
+
+import atexit
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+TICK_DTYPE = np.dtype([
+    ("time", "<i8"), ("bid", "<f8"), ("ask", "<f8"), ("last", "<f8"), ("volume", "<u8"),
+    ("time_msc", "<i8"), ("flags", "<u4"), ("volume_real", "<f8"),
+])
+MAGIC = b"TICKSEG1"
+HEADER_SIZE = 64
+EXTENSION = ".ticks"
+
+
+def _header():
+    return (MAGIC + np.uint32(TICK_DTYPE.itemsize).tobytes()).ljust(HEADER_SIZE, b"\0")
+
+
+def _day(time_msc):
+    return datetime.fromtimestamp(time_msc // 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+# Buffers ticks per symbol and appends them to the day's segment when the buffer fills or
+# flush_interval has passed; ticks not newer than the last one recorded are dropped
+class TickRecorder:
+    def __init__(self, root, buffer_ticks=4096, flush_interval=1.0):
+        self.root = root
+        self.buffer_ticks = buffer_ticks
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.last_error = None
+        self._buffers = {}  # symbol -> (array, count)
+        self._last_msc = {}
+        self._files = {}  # symbol -> (day, open file)
+        self._next_flush = time.monotonic() + flush_interval
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def record(self, symbol, tick):
+        time_msc = tick.time_msc
+        with self._lock:
+            if symbol not in self._last_msc:
+                self._last_msc[symbol] = self._last_recorded(symbol, _day(time_msc))
+            if time_msc <= self._last_msc[symbol]:
+                self.duplicates += 1
+                return False
+            self._last_msc[symbol] = time_msc
+            buffer, count = self._buffers.get(symbol) or (np.zeros(self.buffer_ticks, dtype=TICK_DTYPE), 0)
+            buffer[count] = tuple(tick)[:8]
+            count += 1
+            self._buffers[symbol] = (buffer, count)
+            self.recorded += 1
+            if count == self.buffer_ticks:
+                self._write(symbol)
+            if time.monotonic() >= self._next_flush:
+                self._flush()
+        return True
+
+    # time_msc of the last tick already in the day's segment, so a restart does not record ticks twice
+    def _last_recorded(self, symbol, day):
+        path = segment_path(self.root, symbol, day)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return 0
+        if size < HEADER_SIZE + TICK_DTYPE.itemsize:
+            return 0
+        with open(path, "rb") as f:
+            f.seek(HEADER_SIZE + ((size - HEADER_SIZE) // TICK_DTYPE.itemsize - 1) * TICK_DTYPE.itemsize)
+            return int(np.frombuffer(f.read(TICK_DTYPE.itemsize), dtype=TICK_DTYPE)["time_msc"][0])
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            for _, f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    def _flush(self):
+        for symbol in list(self._buffers):
+            self._write(symbol)
+        self._next_flush = time.monotonic() + self.flush_interval
+
+    # Write a symbol's buffer, splitting it where the UTC day changes
+    def _write(self, symbol):
+        buffer, count = self._buffers.get(symbol, (None, 0))
+        if not count:
+            return
+        try:
+            records = buffer[:count]
+            days = (records["time"] // 86400)
+            splits = np.flatnonzero(days[1:] != days[:-1]) + 1
+            for chunk in np.split(records, splits):
+                self._file(symbol, _day(int(chunk["time_msc"][0]))).write(chunk.tobytes())
+            for _, f in self._files.values():
+                f.flush()
+        except OSError as e:
+            self.errors += 1
+            self.last_error = e
+        self._buffers[symbol] = (buffer, 0)
+
+    def _file(self, symbol, day):
+        current = self._files.get(symbol)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        path = segment_path(self.root, symbol, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, "ab")
+        if f.tell() == 0:
+            f.write(_header())
+        else:
+            _truncate_partial(f, path)
+        self._files[symbol] = (day, f)
+        return f
+
+
+# Drop a record left half-written by a crash so the segment stays fixed-width
+def _truncate_partial(f, path):
+    size = os.path.getsize(path)
+    extra = (size - HEADER_SIZE) % TICK_DTYPE.itemsize
+    if extra:
+        f.truncate(size - extra)
+        f.seek(0, os.SEEK_END)
+
+
+def segment_path(root, symbol, day):
+    return os.path.join(root, symbol, f"{day}{EXTENSION}")
+
+
+# Read-only access to recorded segments; every array returned by day() is a memory map
+class TickStore:
+    def __init__(self, root):
+        self.root = root
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def days(self, symbol):
+        folder = os.path.join(self.root, symbol)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(f[:-len(EXTENSION)] for f in os.listdir(folder) if f.endswith(EXTENSION))
+
+    # One day's ticks as a read-only memmap (day as "YYYYMMDD" or a date)
+    def day(self, symbol, day):
+        if not isinstance(day, str):
+            day = day.strftime("%Y%m%d")
+        path = segment_path(self.root, symbol, day)
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:len(MAGIC)] != MAGIC or int(np.frombuffer(header[8:12], np.uint32)[0]) != TICK_DTYPE.itemsize:
+            raise ValueError(f"Not a tick segment: {path}")
+        count = (os.path.getsize(path) - HEADER_SIZE) // TICK_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=TICK_DTYPE)
+        return np.memmap(path, dtype=TICK_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+    # Zero-copy slices of every segment overlapping [start_msc, end_msc)
+    def segments(self, symbol, start_msc=None, end_msc=None):
+        first = _day(start_msc) if start_msc is not None else None
+        last = _day(end_msc - 1) if end_msc is not None else None
+        for day in self.days(symbol):
+            if (first and day < first) or (last and day > last):
+                continue
+            ticks = self.day(symbol, day)
+            lo = np.searchsorted(ticks["time_msc"], start_msc, side="left") if start_msc is not None else 0
+            hi = np.searchsorted(ticks["time_msc"], end_msc, side="left") if end_msc is not None else len(ticks)
+            if hi > lo:
+                yield ticks[lo:hi]
+
+    # Ticks in [start_msc, end_msc) as one array: a view when they lie in one segment, otherwise a copy
+    def read(self, symbol, start_msc=None, end_msc=None):
+        parts = list(self.segments(symbol, start_msc, end_msc))
+        if not parts:
+            return np.zeros(0, dtype=TICK_DTYPE)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python tickstore.py <root> [symbol]")
+        return
+    store = TickStore(sys.argv[1])
+    for symbol in sys.argv[2:] or store.symbols():
+        for day in store.days(symbol):
+            ticks = store.day(symbol, day)
+            span = ""
+            if len(ticks):
+                first, last = (datetime.fromtimestamp(t / 1000, tz=timezone.utc) for t in ticks["time_msc"][[0, -1]])
+                span = f"  {first:%H:%M:%S.%f} - {last:%H:%M:%S.%f}"
+            print(f"{symbol} {day}: {len(ticks)} ticks{span}")
+
+
+if __name__ == "__main__":
+    main()
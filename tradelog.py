@@ -0,0 +1,191 @@
+## Append-only trade log shared by the bots ##
+## log() only puts the row on a queue; a background thread writes batches, rotating to a new file each day ##
+
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class TradeLogWriter:
+    def __init__(self, file_path, columns, fmt="csv", batch_size=256, flush_interval=1.0, rotate_daily=True, dtypes=None):
+        if fmt not in ("csv", "parquet"):
+            raise ValueError(f"Unsupported trade log format: {fmt}")
+        if fmt == "parquet" and pa is None:
+            raise ImportError("pyarrow is required for parquet trade logs")
+        self.file_path = file_path
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_daily = rotate_daily
+        self.dtypes = dtypes or {}  # Optional column -> "int", "float", "str" or "datetime" for parquet output
+        self.rows_written = 0
+        self.errors = 0
+        self.last_error = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._parquet_writer = None
+        self._parquet_path = None
+        self._schema = None
+
+    # Queue a row for writing; never blocks on disk and never prints
+    def log(self, row):
+        if self._thread is None:
+            self._start()
+        self._queue.put((date.today(), row))
+
+    # Block until everything queued so far is on disk
+    def flush(self, timeout=None):
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # Path of the file for a given day, e.g. trade_log.csv -> trade_log_20240601.csv
+    def path_for(self, day):
+        root, ext = os.path.splitext(self.file_path)
+        if self.fmt == "parquet":
+            ext = ".parquet"
+        if not self.rotate_daily:
+            return root + ext
+        return f"{root}_{day:%Y%m%d}{ext}"
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="trade-log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        batch = []
+        waiters = []
+        deadline = time.monotonic() + self.flush_interval
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                running = False
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item:
+                batch.append(item)
+
+            if batch and (len(batch) >= self.batch_size or waiters or not running or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+            for waiter in waiters:
+                waiter.set()
+            waiters = []
+        self._close_parquet()
+
+    def _write(self, batch):
+        # Group consecutive rows by day so a batch spanning midnight lands in both files
+        start = 0
+        for i in range(1, len(batch) + 1):
+            if i == len(batch) or batch[i][0] != batch[start][0]:
+                rows = [row for _, row in batch[start:i]]
+                try:
+                    if self.fmt == "csv":
+                        self._write_csv(batch[start][0], rows)
+                    else:
+                        self._write_parquet(batch[start][0], rows)
+                    self.rows_written += len(rows)
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = e
+                    print(f"Failed to write trade log: {e}")
+                start = i
+
+    def _write_csv(self, day, rows):
+        path = self.path_for(day)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        with open(path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def _write_parquet(self, day, rows):
+        path = self.path_for(day)
+        if path != self._parquet_path:
+            self._close_parquet()
+        table = self._to_table(rows)
+        if self._parquet_writer is None:
+            # Parquet files cannot be appended to, so an existing file for the day gets a numbered sibling
+            if os.path.exists(path):
+                root, ext = os.path.splitext(path)
+                n = 1
+                while os.path.exists(f"{root}.{n}{ext}"):
+                    n += 1
+                file_name = f"{root}.{n}{ext}"
+            else:
+                file_name = path
+            self._parquet_writer = pq.ParquetWriter(file_name, self._schema)
+            self._parquet_path = path
+        self._parquet_writer.write_table(table)
+
+    def _close_parquet(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+            self._parquet_path = None
+
+    # Column types come from dtypes, else from the first batch: numbers are stored as float64,
+    # timestamps as timestamps and everything else as text
+    def _to_table(self, rows):
+        if self._schema is None:
+            types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "datetime": pa.timestamp("us")}
+            fields = []
+            for column in self.columns:
+                if column in self.dtypes:
+                    fields.append(pa.field(column, types[self.dtypes[column]]))
+                    continue
+                value = next((row.get(column) for row in rows if row.get(column) is not None), None)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    fields.append(pa.field(column, pa.float64()))
+                elif isinstance(value, datetime):
+                    fields.append(pa.field(column, pa.timestamp("us")))
+                else:
+                    fields.append(pa.field(column, pa.string()))
+            self._schema = pa.schema(fields)
+
+        data = {}
+        for field in self._schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if v is None else str(v) for v in values]
+            elif pa.types.is_floating(field.type):
+                values = [float(v) if isinstance(v, (int, float)) else None for v in values]
+            elif pa.types.is_integer(field.type):
+                values = [int(v) if isinstance(v, (int, float)) else None for v in values]
+            elif pa.types.is_timestamp(field.type):
+                values = [v if isinstance(v, datetime) else None for v in values]
+            data[field.name] = values
+        return pa.Table.from_pydict(data, schema=self._schema)
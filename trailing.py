@@ -0,0 +1,117 @@
+## Tick-driven trailing stop engine ##
+## New stops are computed for all tracked positions at once; a modify is only sent when the stop moves by at ##
+## least the minimum step, and requests are coalesced per position and rate limited ##
+
+import time
+
+import numpy as np
+
+
+class TrailingStopEngine:
+    def __init__(self, mt5, symbol, distance, min_step=None, max_requests_per_sec=5.0, send=None):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.distance = distance
+        self.send = send or mt5.order_send
+
+        # Broker limits, read once
+        info = mt5.symbol_info(symbol)
+        self.point = info.point if info is not None else 0.001
+        self.stops_level = info.trade_stops_level * self.point if info is not None else 0.0
+        self.freeze_level = info.trade_freeze_level * self.point if info is not None else 0.0
+        self.digits = info.digits if info is not None else 3
+        self.min_step = min_step if min_step is not None else 10 * self.point
+        self.threshold = max(self.min_step, self.stops_level)
+
+        # Token bucket for modify requests
+        self.rate = max_requests_per_sec
+        self.tokens = max_requests_per_sec
+        self.last_refill = time.monotonic()
+
+        self.tickets = np.zeros(0, dtype=np.int64)
+        self.is_buy = np.zeros(0, dtype=bool)
+        self.sl = np.zeros(0, dtype=np.float64)
+        self.tp = np.zeros(0, dtype=np.float64)
+        self.buy_above = np.inf  # No stop can move before the bid reaches this or the ask falls to sell_below
+        self.sell_below = -np.inf
+        self.pending = {}  # ticket -> (sl, tp) waiting for a rate limit token; newer stops overwrite older ones
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    # Replace the tracked set with the terminal's current positions
+    def sync(self, positions):
+        positions = [p for p in positions if p.symbol == self.symbol]
+        self.tickets = np.array([p.ticket for p in positions], dtype=np.int64)
+        self.is_buy = np.array([p.type == self.mt5.ORDER_TYPE_BUY for p in positions], dtype=bool)
+        self.sl = np.array([p.sl for p in positions], dtype=np.float64)
+        self.tp = np.array([p.tp for p in positions], dtype=np.float64)
+        live = set(self.tickets.tolist())
+        self.pending = {t: v for t, v in self.pending.items() if t in live}
+        self._update_triggers()
+
+    # Nearest prices at which some stop would move by the threshold (a point of slack covers the rounding), so
+    # ticks in between skip the array work; a position without a stop trails on the next tick
+    def _update_triggers(self):
+        gap = max(self.distance, self.stops_level)
+        reach = np.where(self.is_buy, self.sl + gap + self.threshold - self.point,
+                         self.sl - gap - self.threshold + self.point)
+        reach[self.sl == 0] = np.where(self.is_buy, -np.inf, np.inf)[self.sl == 0]
+        self.buy_above = reach[self.is_buy].min(initial=np.inf)
+        self.sell_below = reach[~self.is_buy].max(initial=-np.inf)
+
+    # Stops the positions should move to at this tick, and which of them are worth a request
+    def candidates(self, bid, ask):
+        # Keep the new stop at least the stops level away from the closing price
+        gap = max(self.distance, self.stops_level)
+        new_sl = np.where(self.is_buy, bid - gap, ask + gap)
+        new_sl = np.round(new_sl, self.digits)
+        no_sl = self.sl == 0
+        move = np.where(self.is_buy, new_sl - self.sl, self.sl - new_sl)
+        improve = no_sl | (move >= self.threshold - 1e-9)
+        # Inside the freeze level the broker refuses to modify
+        if self.freeze_level:
+            price = np.where(self.is_buy, bid, ask)
+            improve &= no_sl | (np.abs(price - self.sl) > self.freeze_level)
+        return new_sl, improve
+
+    # now: seconds on the clock the rate limit runs on (time.monotonic() by default; a backtest passes replay time)
+    def on_tick(self, tick, now=None):
+        if len(self.tickets) and (tick.bid >= self.buy_above or tick.ask <= self.sell_below):
+            new_sl, improve = self.candidates(tick.bid, tick.ask)
+            for i in np.flatnonzero(improve):
+                ticket = int(self.tickets[i])
+                if ticket in self.pending:
+                    self.coalesced += 1
+                self.pending[ticket] = (float(new_sl[i]), float(self.tp[i]))
+        return self.flush(now)
+
+    # Send as many pending modifies as the rate limit allows, oldest first
+    def flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.rate, self.tokens + max(now - self.last_refill, 0.0) * self.rate)
+        self.last_refill = now
+        sent = 0
+        while self.pending and self.tokens >= 1:
+            ticket = next(iter(self.pending))
+            sl, tp = self.pending.pop(ticket)
+            self.tokens -= 1
+            request = {
+                "action": self.mt5.TRADE_ACTION_SLTP,
+                "symbol": self.symbol,
+                "position": ticket,
+                "sl": sl,
+                "tp": tp,
+                "deviation": 10,
+            }
+            result = self.send(request)
+            if result is None or result.retcode != self.mt5.TRADE_RETCODE_DONE:
+                self.failed += 1
+                print(f"Failed to modify order: {result}")
+                continue
+            self.sent += 1
+            sent += 1
+            self.sl[self.tickets == ticket] = sl
+        if sent:
+            self._update_triggers()
+        return sent